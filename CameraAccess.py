@@ -1,27 +1,256 @@
-import platform
-from threading import Thread
+import time
+from threading import Condition, Thread
 
 import cv2
+import numpy as np
 
+from frame_sources import is_recorded, open_frame_source
 from log import Logger
 
 # Set up logging
 logger = Logger("WebcamStream")
 
 
+class FrameRing:
+    """
+    Ring of preallocated frames with sequence numbers and capture timestamps.
+
+    One producer writes frames into free slots and publishes them, one consumer reads them. The slot handed to the
+    consumer stays pinned until its next read, so the frame it works on is never overwritten underneath it. A
+    lossless ring never overwrites a frame the consumer has not read; the producer waits for a consumed slot.
+
+    Attributes:
+        dropped (int): Published frames the consumer never received.
+        idle_polls (int): Reads that found no frame newer than the previous read, the consumer got the frame it
+            already has back and is expected to skip it.
+
+    Methods:
+        acquire(timeout): Slot index and buffer for the producer to write the next frame into.
+        publish(slot, timestamp): Make a written slot the latest frame.
+        read_latest(): Latest frame as (seq, timestamp, frame).
+        read_next(after_seq, timeout): First frame newer than `after_seq` still in the ring.
+
+    """
+
+    def __init__(self, shape, slots=4, dtype=np.uint8, lossless=False):
+        """
+        Initialize the FrameRing.
+
+        Args:
+            shape (tuple): Shape of a frame.
+            slots (int, optional): Number of preallocated frames, at least 3.
+            dtype (type, optional): Data type of a frame.
+            lossless (bool, optional): Make the producer wait instead of overwriting unread frames.
+
+        """
+        self.lossless = lossless
+        self.frames = np.zeros((max(slots, 3), *shape), dtype=dtype)
+        self.slot_seq = np.zeros(len(self.frames), dtype=np.int64)
+        self.slot_time = np.zeros(len(self.frames), dtype=np.float64)
+        self.condition = Condition()
+        self.seq = 0
+        self.latest_slot = -1
+        self.pinned_slot = -1
+        self.last_read_seq = 0
+        self.dropped = 0
+        self.idle_polls = 0
+
+    def _free_slots(self):
+        """Slots the producer may write, called with the condition held."""
+        busy = (self.latest_slot, self.pinned_slot)
+        free = [i for i in range(len(self.frames)) if i not in busy]
+        if self.lossless:
+            free = [i for i in free if self.slot_seq[i] <= self.last_read_seq]
+        return free
+
+    def acquire(self, timeout=None):
+        """
+        Slot index and buffer for the producer to write the next frame into.
+
+        Args:
+            timeout (float, optional): Seconds a lossless ring waits for the consumer to free a slot.
+
+        Returns:
+            tuple: (slot, buffer), the oldest slot that is neither the latest frame nor pinned by the consumer,
+                (None, None) when a lossless ring timed out.
+        """
+        with self.condition:
+            if not self.condition.wait_for(self._free_slots, timeout):
+                return None, None
+            slot = min(self._free_slots(), key=lambda i: self.slot_seq[i])
+            self.slot_seq[slot] = 0
+        return slot, self.frames[slot]
+
+    def publish(self, slot, timestamp):
+        """Make a written slot the latest frame."""
+        with self.condition:
+            self.seq += 1
+            self.slot_seq[slot] = self.seq
+            self.slot_time[slot] = timestamp
+            self.latest_slot = slot
+            self.condition.notify_all()
+
+    def _take(self, slot):
+        """Pin a slot for the consumer and update the counters, called with the condition held."""
+        seq = int(self.slot_seq[slot])
+        if seq == self.last_read_seq:
+            self.idle_polls += 1
+        elif seq > self.last_read_seq:
+            self.dropped += seq - self.last_read_seq - 1
+            self.last_read_seq = seq
+        self.pinned_slot = slot
+        self.condition.notify_all()
+        return seq, float(self.slot_time[slot]), self.frames[slot]
+
+    def read_latest(self):
+        """
+        Latest frame of the ring.
+
+        Returns:
+            tuple: (seq, timestamp, frame), (0, None, None) before the first frame is published.
+        """
+        with self.condition:
+            if self.latest_slot < 0:
+                return 0, None, None
+            return self._take(self.latest_slot)
+
+    def read_next(self, after_seq, timeout=None):
+        """
+        First frame newer than `after_seq` that is still in the ring, waiting for it if needed.
+
+        Args:
+            after_seq (int): Sequence number of the last frame the consumer processed.
+            timeout (float, optional): Seconds to wait for a newer frame.
+
+        Returns:
+            tuple: (seq, timestamp, frame), (0, None, None) on timeout.
+        """
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.seq > after_seq, timeout):
+                return 0, None, None
+            newer = [i for i in range(len(self.frames)) if self.slot_seq[i] > after_seq]
+            return self._take(min(newer, key=lambda i: self.slot_seq[i]))
+
+
+# Capture properties in the order V4L2 expects them, the pixel format decides which sizes and rates are offered
+CAPTURE_PROPERTIES = (
+    ("FOURCC", cv2.CAP_PROP_FOURCC),
+    ("WIDTH", cv2.CAP_PROP_FRAME_WIDTH),
+    ("HEIGHT", cv2.CAP_PROP_FRAME_HEIGHT),
+    ("FPS", cv2.CAP_PROP_FPS),
+    ("BUFFERSIZE", cv2.CAP_PROP_BUFFERSIZE),
+)
+
+
+def fourcc_code(value):
+    """Four character code of a CAP_PROP_FOURCC value."""
+    code = int(value)
+    return "".join(chr((code >> 8 * i) & 0xFF) for i in range(4))
+
+
+def apply_capture_settings(vcap, settings, stream_id=None):
+    """
+    Request capture parameters from the driver and read back what it negotiated.
+
+    Args:
+        vcap (cv2.VideoCapture): Opened capture.
+        settings (dict): Any of FOURCC, WIDTH, HEIGHT, FPS and BUFFERSIZE, as in the CAMERA section of config.json.
+        stream_id (int or str, optional): Camera the settings belong to, for logging.
+
+    Returns:
+        dict: Negotiated value of every requested parameter.
+    """
+    for key, prop in CAPTURE_PROPERTIES:
+        if settings.get(key) is None:
+            continue
+        value = cv2.VideoWriter_fourcc(*settings[key]) if key == "FOURCC" else settings[key]
+        if not vcap.set(prop, value):
+            logger.warn(f"Camera {stream_id} refused {key}={settings[key]}")
+
+    negotiated = {}
+    for key, prop in CAPTURE_PROPERTIES:
+        if settings.get(key) is None:
+            continue
+        value = vcap.get(prop)
+        negotiated[key] = fourcc_code(value) if key == "FOURCC" else value
+        requested = settings[key]
+        if (key == "FOURCC" and negotiated[key] != requested) or (key != "FOURCC" and abs(value - requested) > 0.5):
+            logger.warn(f"Camera {stream_id} negotiated {key}={negotiated[key]} instead of {requested}")
+    logger.info(f"Camera {stream_id} capture settings {negotiated}")
+    return negotiated
+
+
+def open_capture(stream_id, capture_settings=None, playback="realtime", loop=False):
+    """
+    Open a frame source, apply its capture settings and read its first frame.
+
+    Args:
+        stream_id (int or str): Camera index, stream URL, video file, image directory or synthetic source, see
+            `frame_sources.open_frame_source`.
+        capture_settings (dict, optional): Capture parameters of a camera, see `apply_capture_settings`.
+        playback (str, optional): "realtime" or "fast" playback of recorded sources.
+        loop (bool, optional): Replay recorded sources from the start when they end.
+
+    Returns:
+        tuple: (vcap, first frame, negotiated capture settings).
+
+    Raises:
+        RuntimeError: When the source cannot be opened or delivers no first frame.
+    """
+    vcap = open_frame_source(stream_id, playback, loop)
+
+    negotiated = {}
+    if capture_settings and vcap.isOpened() and not is_recorded(vcap):
+        negotiated = apply_capture_settings(vcap, capture_settings, stream_id)
+
+    grabbed, frame = vcap.read()
+
+    if not grabbed or frame is None:
+        opened = vcap.isOpened()
+        vcap.release()
+        reason = "delivered no frame" if opened else "could not be opened"
+        raise RuntimeError(f"Frame source {stream_id!r} {reason}, check that the camera is connected or the file exists")
+    return vcap, frame, negotiated
+
+
+def grab_timestamp(vcap, timestamp_source="grab"):
+    """
+    Grab the next frame and return its capture timestamp in seconds, None when no frame could be grabbed.
+
+    "grab" stamps the frame with the monotonic clock when the grab returns, "driver" uses the timestamp the
+    backend attaches to the frame (V4L2 buffer time, media time of a video file).
+    """
+    if not vcap.grab():
+        return None
+    if timestamp_source == "driver":
+        return vcap.get(cv2.CAP_PROP_POS_MSEC) / 1000.0
+    return time.monotonic()
+
+
+def retrieve_into(vcap, buffer):
+    """Decode the grabbed frame straight into `buffer`, copy only if the backend returned its own buffer."""
+    retrieved, frame = vcap.retrieve(buffer)
+    if not retrieved:
+        return False
+    if frame is not buffer:
+        if frame.shape != buffer.shape:
+            logger.error(f"Camera frame shape {frame.shape} does not match the buffer shape {buffer.shape}")
+            return False
+        np.copyto(buffer, frame)
+    return True
+
+
 class WebcamStream:
-    def __init__(self, stream_id=0):
+    def __init__(self, stream_id=0, slots=4, capture_settings=None, playback="realtime", loop=False):
         self.stream_id = stream_id
-        if platform.system() == "Windows":
-            self.vcap = cv2.VideoCapture(stream_id, cv2.CAP_DSHOW)
-        else:
-            self.vcap = cv2.VideoCapture(stream_id)
-
-        self.grabbed, self.frame = self.vcap.read()
+        self.vcap, frame, self.negotiated = open_capture(stream_id, capture_settings, playback, loop)
+        self.grabbed = frame is not None
 
-        if self.grabbed is False and self.vcap.isOpened() is False:
-            logger.error(f"[Exiting] No more frames to read camera index {stream_id}")
-            exit(0)
+        # Recordings played fast hand every frame to the consumer, so a run over them is reproducible
+        self.ring = FrameRing(frame.shape, slots, lossless=playback == "fast" and is_recorded(self.vcap))
+        slot, buffer = self.ring.acquire()
+        np.copyto(buffer, frame)
+        self.ring.publish(slot, time.monotonic())
 
         self.stopped = True
         self.t = Thread(target=self.update, args=())
@@ -35,53 +264,198 @@ class WebcamStream:
         while True:
             if self.stopped is True:
                 break
-            self.grabbed, self.frame = self.vcap.read()
-            if self.grabbed is False:
+            slot, buffer = self.ring.acquire(timeout=0.1)
+            if slot is None:
+                continue
+            self.grabbed = self.vcap.grab()
+            timestamp = time.monotonic()
+            if self.grabbed is False or not retrieve_into(self.vcap, buffer):
                 logger.warn("[Exiting] No more frames to read")
                 self.stopped = True
                 break
+            self.ring.publish(slot, timestamp)
         self.vcap.release()
 
     def read(self):
-        return self.frame
+        return self.ring.read_latest()[2]
+
+    def read_latest(self):
+        """Latest frame as (seq, capture timestamp, frame)."""
+        return self.ring.read_latest()
+
+    def read_next(self, after_seq, timeout=None):
+        """First frame newer than `after_seq` as (seq, capture timestamp, frame)."""
+        return self.ring.read_next(after_seq, timeout)
+
+    @property
+    def frames_dropped(self):
+        return self.ring.dropped
+
+    @property
+    def idle_polls(self):
+        return self.ring.idle_polls
 
     def stop(self):
         self.stopped = True
 
 
 class DualWebcamStream:
-    def __init__(self, stream_id1=0, stream_id2=1):
+    """
+    Two cameras captured side by side into one preallocated frame ring.
+
+    Both cameras are grabbed first and then decoded straight into the left and right half of the same ring slot,
+    so a combined frame needs no per frame allocation or concatenation copy. Every grab is timestamped; when the
+    two halves are further apart than `sync_tolerance_ms`, the camera that is behind is grabbed again, up to
+    `max_regrabs` times, before the pair is decoded. The measured skew of every pair is kept in `sync_stats`.
+    """
+
+    def __init__(
+        self,
+        stream_id1=0,
+        stream_id2=1,
+        slots=4,
+        sync_tolerance_ms=None,
+        max_regrabs=3,
+        timestamp_source="grab",
+        capture_settings=(None, None),
+        playback="realtime",
+        loop=False,
+    ):
         self.stopped = True
-        self.stream1 = WebcamStream(stream_id1)
-        self.stream2 = WebcamStream(stream_id2)
+        self.stream_ids = (stream_id1, stream_id2)
+        self.sync_tolerance_ms = sync_tolerance_ms
+        self.max_regrabs = max_regrabs
+        self.timestamp_source = timestamp_source
+        self.vcap1, frame1, negotiated1 = open_capture(stream_id1, capture_settings[0], playback, loop)
+        self.vcap2, frame2, negotiated2 = open_capture(stream_id2, capture_settings[1], playback, loop)
+        self.negotiated = (negotiated1, negotiated2)
+        if frame1.shape[0] != frame2.shape[0] or frame1.shape[2:] != frame2.shape[2:]:
+            raise ValueError(f"Cameras {self.stream_ids} deliver frames of different height: {frame1.shape} and {frame2.shape}")
+
+        self.split = frame1.shape[1]
+        lossless = playback == "fast" and is_recorded(self.vcap1) and is_recorded(self.vcap2)
+        self.ring = FrameRing((frame1.shape[0], frame1.shape[1] + frame2.shape[1], *frame1.shape[2:]), slots, lossless=lossless)
+        slot, buffer = self.ring.acquire()
+        np.copyto(buffer[:, :self.split], frame1)
+        np.copyto(buffer[:, self.split:], frame2)
+        self.ring.publish(slot, time.monotonic())
+
+        self.skew_ms = 0.0
+        self.pairs = 0
+        self.unsynced_pairs = 0
+        self.regrabs = 0
+        self.total_skew_ms = 0.0
+        self.max_skew_ms = 0.0
+
+        self.t = Thread(target=self.update, args=())
+        self.t.daemon = True
 
     def start(self):
         self.stopped = False
-        self.stream1.start()
-        self.stream2.start()
+        self.t.start()
+
+    def grab_pair(self):
+        """
+        Grab one frame of each camera, re-grabbing the camera that is behind while the pair is out of tolerance.
+
+        Returns:
+            tuple: Capture timestamps of the two frames, None for a camera that delivered no frame.
+        """
+        timestamp1 = grab_timestamp(self.vcap1, self.timestamp_source)
+        timestamp2 = grab_timestamp(self.vcap2, self.timestamp_source)
+        if self.sync_tolerance_ms is None:
+            return timestamp1, timestamp2
+
+        for _ in range(self.max_regrabs):
+            if timestamp1 is None or timestamp2 is None or abs(timestamp1 - timestamp2) * 1000 <= self.sync_tolerance_ms:
+                break
+            self.regrabs += 1
+            if timestamp1 < timestamp2:
+                timestamp1 = grab_timestamp(self.vcap1, self.timestamp_source)
+            else:
+                timestamp2 = grab_timestamp(self.vcap2, self.timestamp_source)
+        return timestamp1, timestamp2
+
+    def record_skew(self, timestamp1, timestamp2):
+        """Update the pairing statistics with the skew of a pair."""
+        self.skew_ms = abs(timestamp1 - timestamp2) * 1000
+        self.pairs += 1
+        self.total_skew_ms += self.skew_ms
+        self.max_skew_ms = max(self.max_skew_ms, self.skew_ms)
+        if self.sync_tolerance_ms is not None and self.skew_ms > self.sync_tolerance_ms:
+            self.unsynced_pairs += 1
+            logger.debug(f"Camera pair {self.pairs} out of tolerance, skew {self.skew_ms:.1f} ms")
+
+    @property
+    def sync_stats(self):
+        """Pairing statistics: last, mean and max skew in ms, pairs out of tolerance and re-grabs."""
+        return {
+            "skew_ms": self.skew_ms,
+            "mean_skew_ms": self.total_skew_ms / self.pairs if self.pairs else 0.0,
+            "max_skew_ms": self.max_skew_ms,
+            "pairs": self.pairs,
+            "unsynced_pairs": self.unsynced_pairs,
+            "regrabs": self.regrabs,
+        }
+
+    def update(self):
+        while not self.stopped:
+            slot, buffer = self.ring.acquire(timeout=0.1)
+            if slot is None:
+                continue
+            # Grab both cameras before decoding so the two halves are as close in time as possible
+            timestamp1, timestamp2 = self.grab_pair()
+            grabbed = timestamp1 is not None and timestamp2 is not None
+            retrieved = grabbed and retrieve_into(self.vcap1, buffer[:, :self.split]) and retrieve_into(self.vcap2, buffer[:, self.split:])
+            if not retrieved:
+                logger.warn("[Exiting] No more frames to read")
+                self.stopped = True
+                break
+            self.record_skew(timestamp1, timestamp2)
+            self.ring.publish(slot, min(timestamp1, timestamp2) if self.timestamp_source == "grab" else time.monotonic())
+        self.vcap1.release()
+        self.vcap2.release()
 
     def read(self):
-        frame1 = self.stream1.read()
-        frame2 = self.stream2.read()
+        return self.ring.read_latest()[2]
+
+    def read_latest(self):
+        """Latest combined frame as (seq, capture timestamp, frame)."""
+        return self.ring.read_latest()
 
-        if frame1 is not None and frame2 is not None:
-            combined_frame = cv2.hconcat([frame1, frame2])
-            return combined_frame
-        else:
-            return None
+    def read_next(self, after_seq, timeout=None):
+        """First combined frame newer than `after_seq` as (seq, capture timestamp, frame)."""
+        return self.ring.read_next(after_seq, timeout)
+
+    def camera_views(self, frame):
+        """Views of the two camera halves of a combined frame, without copying."""
+        return frame[:, :self.split], frame[:, self.split:]
+
+    @property
+    def frames_dropped(self):
+        return self.ring.dropped
+
+    @property
+    def idle_polls(self):
+        return self.ring.idle_polls
 
     def stop(self):
-        self.stream1.stop()
-        self.stream2.stop()
         self.stopped = True
 
 
-def create_webcam_stream(*args):
+def create_webcam_stream(*args, capture_settings=None, playback="realtime", loop=False, **sync_options):
+    """
+    Open one stream or a side by side pair of streams.
+
+    Every argument can be a camera index, a stream URL, a video file, a directory of stills or
+    "synthetic[:WIDTHxHEIGHT[@FPS]]", see `frame_sources.open_frame_source`.
+    """
     num_cameras = len(args)
+    capture_settings = capture_settings or [None] * num_cameras
     if num_cameras == 1:
-        return WebcamStream(args[0])
+        return WebcamStream(args[0], capture_settings=capture_settings[0], playback=playback, loop=loop)
     elif num_cameras == 2:
-        return DualWebcamStream(args[0], args[1])
+        return DualWebcamStream(args[0], args[1], capture_settings=capture_settings, playback=playback, loop=loop, **sync_options)
     else:
         raise logger.warn("You can provide one or two camera IDs only.")
 
@@ -89,3 +463,4 @@ def create_webcam_stream(*args):
 # Example usage:
 # single_stream = create_webcam_stream(0)
 # dual_stream = create_webcam_stream(0, 1)
+# replay_stream = create_webcam_stream("recordings/left.mp4", "recordings/right.mp4", playback="fast")
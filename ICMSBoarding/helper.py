@@ -15,6 +15,9 @@ class Config:
 
         self.camera_source_1 = data["CAMERA"]["FIRST_CAMERA_INDEX"]
         self.camera_source_2 = data["CAMERA"]["SECOND_CAMERA_INDEX"]
+        # Sources may be camera indices, video files, image directories or "synthetic", see frame_sources.py
+        self.playback = data["CAMERA"].get("PLAYBACK", "realtime")
+        self.loop_playback = data["CAMERA"].get("LOOP", False)
         self.seat_coordinates = seats_coordinates(data["SEAT_COORDINATES"], data["FRAME_SHAPE"])
 
 # fmt: off
@@ -11,6 +11,10 @@ from PyQt5.QtGui import QPixmap, QMovie, QIcon
 from helper import CameraWidget, ObjectsFiles,Config, draw_seats
 from detection_models import YoloObjectdetection,BehaviourDetection
 
+# Frame sources are shared with the ICMS dashboard one directory up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from frame_sources import open_frame_source
+
 
 class BoardThread(QThread):
     frame_ready = pyqtSignal(np.ndarray)
@@ -77,9 +81,9 @@ class MyWindow(QWidget):
     def __init__(self):
         super().__init__()
         
-        # Initialize VideoCapture instances outside threads
-        cap1 = cv2.VideoCapture(CONFIG.camera_source_1)
-        cap2 = cv2.VideoCapture(CONFIG.camera_source_2)
+        # Initialize VideoCapture instances outside threads, recorded footage replays through the same interface
+        cap1 = open_frame_source(CONFIG.camera_source_1, CONFIG.playback, CONFIG.loop_playback)
+        cap2 = open_frame_source(CONFIG.camera_source_2, CONFIG.playback, CONFIG.loop_playback)
 
         # Create threads with initialized VideoCapture instances
         self.board_thread = BoardThread(cap1)
@@ -366,8 +370,7 @@ class MyWindow(QWidget):
             
 def ModelLoader():
     # Initialize necessary components
-    global CONFIG, OBJECT, YOLO_OBJECT, YOLO_GESTURE
-    CONFIG = Config()
+    global OBJECT, YOLO_OBJECT, YOLO_GESTURE
     OBJECT = ObjectsFiles()
     YOLO_OBJECT = YoloObjectdetection()
     YOLO_GESTURE = BehaviourDetection()
@@ -375,6 +378,9 @@ def ModelLoader():
 if __name__ == "__main__":
     start = time.time()  # Start timing
     
+    # The configuration is read before the window opens, only the models load in the background
+    CONFIG = Config()
+
     # Start a separate thread to initialize necessary components
     init_thread = threading.Thread(target=ModelLoader)
     init_thread.start()
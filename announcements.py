@@ -0,0 +1,192 @@
+"""Voice announcements of ICMS Application
+
+Non-blocking, prioritised playback of the cabin voice messages. A single audio thread owns the mixer, which is
+initialised once, and every clip is loaded into memory up front. Callers only enqueue a message name and return
+at once. Queued messages play in priority order: unauthorised access, then wrong seat, then seatbelt
+reminders, then welcomes. A message already waiting is not queued twice, and the same message is not repeated
+within `repeat_interval` seconds.
+
+Author: Ravi Shanker Singh
+"""
+
+import io
+import itertools
+import queue
+import threading
+import time
+
+import pygame
+
+from log import Logger
+
+logger = Logger(module="Announcements")
+
+PRIORITY_UNAUTHORIZED = 0
+PRIORITY_WRONG_SEAT = 1
+PRIORITY_SEATBELT = 2
+PRIORITY_WELCOME = 3
+PRIORITY_OTHER = 4
+
+
+def message_priority(message):
+    """Priority of a message name of `helper.mp3_files`, lower plays first."""
+    if message == "message_unauthorize":
+        return PRIORITY_UNAUTHORIZED
+    if message.startswith("seltbelt_"):
+        return PRIORITY_SEATBELT
+    if message.startswith("welcome_") or message == "Welcome":
+        return PRIORITY_WELCOME
+    if message.startswith("message_"):
+        return PRIORITY_OTHER
+    # Seat names announce a passenger sitting on the wrong seat
+    return PRIORITY_WRONG_SEAT
+
+
+class AnnouncementQueue:
+    """
+    Audio worker thread playing queued voice messages by priority.
+
+    Attributes:
+        clips (dict): Message names as keys and the path of their audio file as values.
+        repeat_interval (float): Seconds before the same message may play again.
+        gap (float): Pause in seconds between two messages.
+        max_pending (int): Most messages waiting at once, beyond it the least urgent one is dropped.
+        played (int): Messages played.
+        dropped (int): Messages dropped as duplicates, repeats or overflow.
+
+    Methods:
+        start(): Start the audio thread.
+        announce(message): Queue a message without blocking.
+        add_clip(message, path): Make another audio file available, e.g. a rendered announcement.
+        close(): Stop the audio thread.
+
+    """
+
+    def __init__(self, clips, repeat_interval=10.0, gap=0.5, max_pending=8):
+        """
+        Initialize the AnnouncementQueue.
+
+        Args:
+            clips (dict): Message names as keys and the path of their audio file as values.
+            repeat_interval (float, optional): Seconds before the same message may play again.
+            gap (float, optional): Pause in seconds between two messages.
+            max_pending (int, optional): Most messages waiting at once.
+
+        """
+        self.clips = dict(clips)
+        self.repeat_interval = repeat_interval
+        self.gap = gap
+        self.max_pending = max_pending
+        self.queue = queue.PriorityQueue()
+        self.order = itertools.count()
+        self.lock = threading.Lock()
+        self.pending = {}
+        self.last_played = {}
+        self.sounds = {}
+        self.played = 0
+        self.dropped = 0
+        self.thread = None
+
+    def start(self):
+        """Start the audio thread, it initialises the mixer and preloads every clip."""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def announce(self, message, priority=None):
+        """
+        Queue a message without blocking.
+
+        Args:
+            message (str): Message name of `clips`.
+            priority (int, optional): Overrides the priority derived from the message name.
+
+        Returns:
+            bool: True when the message was queued.
+        """
+        priority = message_priority(message) if priority is None else priority
+        now = time.monotonic()
+        if message not in self.clips:
+            logger.debug(f"No clip for {message} yet")
+            self.dropped += 1
+            return False
+        with self.lock:
+            if message in self.pending or now - self.last_played.get(message, -self.repeat_interval) < self.repeat_interval:
+                self.dropped += 1
+                return False
+            if len(self.pending) >= self.max_pending:
+                # A full queue gives way only to a more urgent message, the least urgent waiting one is dropped
+                least_urgent = max(self.pending, key=self.pending.get)
+                if self.pending[least_urgent] <= priority:
+                    self.dropped += 1
+                    return False
+                del self.pending[least_urgent]
+                self.dropped += 1
+                logger.warn(f"Announcement queue full, dropped {least_urgent}")
+            self.pending[message] = priority
+        self.queue.put((priority, next(self.order), message))
+        return True
+
+    def add_clip(self, message, path):
+        """Make another audio file available, read into memory at once so the file may be evicted afterwards."""
+        with open(path, "rb") as clip:
+            self.sounds[message] = clip.read()
+        self.clips[message] = path
+
+    def close(self):
+        """Stop the audio thread after the message playing now."""
+        self.queue.put((-1, next(self.order), None))
+
+    def load(self, message):
+        """Load a clip into memory, as a mixer Sound when the codec allows it, as raw bytes otherwise."""
+        path = self.clips[message]
+        try:
+            self.sounds[message] = pygame.mixer.Sound(str(path))
+        except pygame.error:
+            with open(path, "rb") as clip:
+                self.sounds[message] = clip.read()
+        return self.sounds[message]
+
+    def play(self, message):
+        """Play a preloaded clip and wait for it to finish, on the audio thread."""
+        sound = self.sounds.get(message)
+        if sound is None:
+            sound = self.load(message)
+        if isinstance(sound, bytes):
+            pygame.mixer.music.load(io.BytesIO(sound))
+            pygame.mixer.music.play()
+            while pygame.mixer.music.get_busy():
+                time.sleep(0.05)
+        else:
+            channel = sound.play()
+            while channel is not None and channel.get_busy():
+                time.sleep(0.05)
+
+    def run(self):
+        """Audio thread, initialise the mixer once, preload the clips and play queued messages."""
+        try:
+            pygame.mixer.init()
+        except pygame.error as e:
+            logger.error(f"Audio device unavailable, announcements are disabled: {e}")
+            return
+        for message in list(self.clips):
+            try:
+                self.load(message)
+            except (OSError, pygame.error) as e:
+                logger.warn(f"Could not preload {message}: {e}")
+        logger.info(f"Preloaded {len(self.sounds)} announcement clips")
+
+        while True:
+            _, _, message = self.queue.get()
+            if message is None:
+                return
+            with self.lock:
+                if self.pending.pop(message, None) is None:
+                    # Dropped while waiting in a full queue
+                    continue
+                self.last_played[message] = time.monotonic()
+            try:
+                self.play(message)
+                self.played += 1
+            except Exception as e:
+                logger.error(f"Error playing {message}: {e}")
+            time.sleep(self.gap)
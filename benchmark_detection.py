@@ -0,0 +1,113 @@
+"""Face detection scale benchmark of ICMS Application
+
+Measures detection time and recall of `face_analysis.detect_faces` at several detection scales on recorded cabin
+footage, so FACE_DETECTION.SCALE in config.json can be chosen per camera mount. Boxes detected at full
+resolution are the reference; a face counts as found when a box at the tested scale overlaps it with IoU >= 0.5.
+
+Usage:
+    python benchmark_detection.py recordings/cabin.mp4 --scales 1.0 0.75 0.5 0.35
+    python benchmark_detection.py recordings/stills/ --seats
+
+Author: Ravi Shanker Singh
+"""
+
+import argparse
+import json
+import pathlib
+import time
+
+import cv2
+import numpy as np
+
+from cabin import CabinLayout
+from face_analysis import detect_faces
+from face_tracker import box_iou
+from log import Logger
+
+logger = Logger(module="Detection Benchmark")
+current = pathlib.Path(__file__).parent.resolve()
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def load_frames(source, max_frames):
+    """Read up to `max_frames` BGR frames from a video file or a directory of stills."""
+    source = pathlib.Path(source)
+    if source.is_dir():
+        paths = sorted(path for path in source.iterdir() if path.suffix.lower() in IMAGE_SUFFIXES)[:max_frames]
+        return [frame for frame in (cv2.imread(str(path)) for path in paths) if frame is not None]
+
+    frames = []
+    capture = cv2.VideoCapture(str(source))
+    while len(frames) < max_frames:
+        grabbed, frame = capture.read()
+        if not grabbed:
+            break
+        frames.append(frame)
+    capture.release()
+    return frames
+
+
+def load_images(frames, use_seats):
+    """Convert frames to the RGB images detection runs on, whole frames or every seat ROI."""
+    if not use_seats:
+        return [cv2.cvtColor(frame, cv2.COLOR_BGR2RGB) for frame in frames]
+
+    with open(current.joinpath("config.json")) as data_file:
+        data = json.load(data_file)
+    images = []
+    for frame in frames:
+        for x1, y1, x2, y2, _ in CabinLayout.from_config(data, frame.shape).seat_coordinates:
+            images.append(cv2.cvtColor(frame[y2:y1, x1:x2], cv2.COLOR_BGR2RGB))
+    return images
+
+
+def recall(reference_boxes, boxes, min_iou=0.5):
+    """Fraction of reference faces matched by a detected box."""
+    total = sum(len(reference) for reference in reference_boxes)
+    if not total:
+        return 1.0
+    found = 0
+    for reference, detected in zip(reference_boxes, boxes):
+        found += sum(1 for box in reference if any(box_iou(box, other) >= min_iou for other in detected))
+    return found / total
+
+
+def benchmark(images, scales):
+    """Time detection at every scale and compare the boxes with full resolution detection."""
+    timings, detections = {}, {}
+    for scale in sorted(set(scales) | {1.0}, reverse=True):
+        durations, boxes = [], []
+        for image in images:
+            start = time.perf_counter()
+            boxes.append(detect_faces(image, scale))
+            durations.append(time.perf_counter() - start)
+        timings[scale], detections[scale] = np.array(durations) * 1000, boxes
+
+    reference = detections[1.0]
+    logger.info(f"{'scale':>6} {'mean ms':>9} {'p95 ms':>9} {'speedup':>8} {'recall':>7}")
+    for scale, durations in timings.items():
+        speedup = timings[1.0].mean() / max(durations.mean(), 1e-9)
+        p95 = np.percentile(durations, 95)
+        logger.info(f"{scale:>6.2f} {durations.mean():>9.2f} {p95:>9.2f} {speedup:>7.2f}x {recall(reference, detections[scale]):>7.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark face detection accuracy against speed per detection scale.")
+    parser.add_argument("source", help="Video file or directory of still images recorded on the camera mount.")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0, 0.75, 0.5, 0.35, 0.25])
+    parser.add_argument("--max-frames", type=int, default=100)
+    parser.add_argument("--seats", action="store_true", help="Detect on every seat ROI as the \"roi\" detection mode does.")
+    args = parser.parse_args()
+
+    frames = load_frames(args.source, args.max_frames)
+    if not frames:
+        logger.error(f"No frames could be read from {args.source}")
+        return
+    images = load_images(frames, args.seats)
+    logger.info(f"Benchmarking {len(images)} images from {len(frames)} frames of {args.source}")
+    benchmark(images, args.scales)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+"""Face gallery search benchmark of ICMS Application
+
+Compares the approximate `CoarseIndex` search of `FaceGallery` against brute force on synthetic galleries of
+growing size, reporting per query latency and recall@1 (the approximate result is the exact nearest passenger).
+Synthetic embeddings are drawn around random identities on the unit sphere, like dlib face encodings.
+
+Usage:
+    python benchmark_gallery.py --sizes 1000 10000 50000 --queries 200 --n-probe 4
+
+Author: Ravi Shanker Singh
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from gallery import EMBEDDING_SIZE, FaceGallery
+from log import Logger
+
+logger = Logger(module="Gallery Benchmark")
+
+
+def synthetic_gallery(size, rng):
+    """Random unit length embeddings standing in for the passenger encodings of a manifest."""
+    embeddings = rng.normal(size=(size, EMBEDDING_SIZE)).astype(np.float32)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+
+def timed_nearest(gallery, queries):
+    """Run one query at a time as the dashboard does and return the rows found and the mean latency in ms."""
+    rows = np.empty(len(queries), dtype=np.int64)
+    start = time.perf_counter()
+    for i, query in enumerate(queries):
+        rows[i] = gallery.nearest(query)[0][0]
+    return rows, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def benchmark(sizes, n_queries, n_probe, noise, seed=0):
+    rng = np.random.default_rng(seed)
+    logger.info(f"{'gallery':>8} {'brute ms':>9} {'index ms':>9} {'build ms':>9} {'speedup':>8} {'recall@1':>9}")
+    for size in sizes:
+        embeddings = synthetic_gallery(size, rng)
+        names = [f"passenger_{i}" for i in range(size)]
+        seats = [f"S{i}" for i in range(size)]
+        truth = rng.choice(size, n_queries)
+        queries = embeddings[truth] + rng.normal(scale=noise, size=(n_queries, EMBEDDING_SIZE)).astype(np.float32)
+
+        brute = FaceGallery(names, seats, embeddings, ann_min_size=size + 1)
+        exact_rows, brute_ms = timed_nearest(brute, queries)
+
+        indexed = FaceGallery(names, seats, embeddings, ann_min_size=1)
+        start = time.perf_counter()
+        indexed.nearest(queries[:1])
+        build_ms = (time.perf_counter() - start) * 1000
+        indexed.index.n_probe = n_probe
+        index_rows, index_ms = timed_nearest(indexed, queries)
+
+        recall = float(np.mean(index_rows == exact_rows))
+        logger.info(f"{size:>8} {brute_ms:>9.3f} {index_ms:>9.3f} {build_ms:>9.1f} {brute_ms / index_ms:>7.2f}x {recall:>9.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark approximate against brute force gallery search.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[500, 2000, 10000, 50000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--n-probe", type=int, default=4)
+    parser.add_argument("--noise", type=float, default=0.03, help="Per dimension noise between a face and its gallery entry.")
+    args = parser.parse_args()
+    benchmark(args.sizes, args.queries, args.n_probe, args.noise)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Cabin model of ICMS Application
+
+Seat map of the cabin as configured in the CABIN section of config.json: seat names, the camera every seat is
+seen by and its ROI in that camera, the seat belt sensor pin and the place of the seat in the dashboard grid.
+Per-seat data is kept in arrays indexed by seat so the hot paths can work on all seats at once.
+
+    "CABIN": {
+        "CAMERAS": 2,
+        "GRID": {"ORIGIN": [0.26, 0.2], "STEP": [0.4, 0.38], "LAST": [0.7, 0.6]},
+        "SEATS": {"A1": {"CAMERA": 0, "ROI": [0.0, 0.55, 0.48, 0.05], "ROW": 0, "COLUMN": 1, "BELT_PIN": 31}, ...}
+    }
+
+ROI values are fractions of the camera image as [start, bottom, end, top]; the cameras sit side by side in the
+combined frame. Configurations without a CABIN section fall back to SEAT_COORDINATES, given as fractions of
+the combined frame, with seats placed two per grid row.
+
+Author: Ravi Shanker Singh
+"""
+
+import numpy as np
+
+DEFAULT_GRID = {"ORIGIN": [0.26, 0.2], "STEP": [0.4, 0.38], "LAST": [0.7, 0.6]}
+
+
+class CabinLayout:
+    """
+    Seat map of the cabin.
+
+    Attributes:
+        seat_names (list): Seat names in seat index order.
+        index (dict): Seat index of every seat name.
+        rois (np.ndarray): Seat ROIs in combined frame pixels, shape (seats, 4) as (start, bottom, end, top).
+        cameras (np.ndarray): Camera index of every seat.
+        grid (np.ndarray): Dashboard (row, column) of every seat.
+        belt_pins (dict): Seat belt sensor pin of the seats that have one.
+
+    Methods:
+        from_config(data, frame_shape): Build the layout from the parsed config.json.
+        seat_coordinates: Seat ROIs as (start, bottom, end, top, seat_name) tuples.
+        ui_positions(): Dashboard position of every seat and the widget scale that fits the grid on screen.
+
+    """
+
+    def __init__(self, seat_names, rois, cameras=None, grid=None, belt_pins=None, grid_options=None):
+        """
+        Initialize the CabinLayout.
+
+        Args:
+            seat_names (list): Seat names.
+            rois (array-like): Seat ROIs in combined frame pixels as (start, bottom, end, top).
+            cameras (array-like, optional): Camera index of every seat.
+            grid (array-like, optional): Dashboard (row, column) of every seat, two seats per row by default.
+            belt_pins (dict, optional): Seat belt sensor pin per seat name.
+            grid_options (dict, optional): ORIGIN, STEP and LAST of the dashboard grid, see the module documentation.
+
+        """
+        count = len(seat_names)
+        self.seat_names = list(seat_names)
+        self.index = {seat_name: i for i, seat_name in enumerate(self.seat_names)}
+        self.rois = np.asarray(rois, dtype=np.int32).reshape(count, 4)
+        self.cameras = np.zeros(count, dtype=np.int32) if cameras is None else np.asarray(cameras, dtype=np.int32)
+        if grid is None:
+            grid = [(i // 2, i % 2) for i in range(count)]
+        self.grid = np.asarray(grid, dtype=np.int32).reshape(count, 2)
+        self.belt_pins = dict(belt_pins or {})
+        self.grid_options = {**DEFAULT_GRID, **(grid_options or {})}
+
+    def __len__(self):
+        return len(self.seat_names)
+
+    @classmethod
+    def from_config(cls, data, frame_shape=None):
+        """
+        Build the layout from the parsed config.json.
+
+        Args:
+            data (dict): Parsed config.json.
+            frame_shape (tuple, optional): Shape of the combined frame, defaults to FRAME_SHAPE.
+
+        Returns:
+            CabinLayout: Seat map of the cabin.
+        """
+        height, width = (frame_shape or data["FRAME_SHAPE"])[:2]
+        cabin = data.get("CABIN")
+        if cabin is None:
+            seats = data["SEAT_COORDINATES"]
+            rois = [(int(x1 * width), int(y1 * height), int(x2 * width), int(y2 * height)) for x1, y1, x2, y2 in seats.values()]
+            return cls(list(seats), rois)
+
+        seats = cabin["SEATS"]
+        cameras = [seat.get("CAMERA", 0) for seat in seats.values()]
+        camera_count = cabin.get("CAMERAS") or max(cameras) + 1
+        camera_width = width / camera_count
+        rois, grid, belt_pins = [], [], {}
+        for i, (seat_name, seat) in enumerate(seats.items()):
+            x1, y1, x2, y2 = seat["ROI"]
+            camera = seat.get("CAMERA", 0)
+            rois.append((int((camera + x1) * camera_width), int(y1 * height), int((camera + x2) * camera_width), int(y2 * height)))
+            grid.append((seat.get("ROW", i // 2), seat.get("COLUMN", i % 2)))
+            if seat.get("BELT_PIN") is not None:
+                belt_pins[seat_name] = seat["BELT_PIN"]
+        return cls(list(seats), rois, cameras, grid, belt_pins, cabin.get("GRID"))
+
+    @property
+    def seat_coordinates(self):
+        """Seat ROIs as (start, bottom, end, top, seat_name) tuples, the form `helper.seats_coordinates` returns."""
+        return [(int(x1), int(y1), int(x2), int(y2), seat_name) for (x1, y1, x2, y2), seat_name in zip(self.rois, self.seat_names)]
+
+    def ui_positions(self):
+        """
+        Dashboard position of every seat.
+
+        The grid starts at ORIGIN and advances by STEP per column and row. When the grid would place seats past
+        LAST, the step shrinks until it fits and the widgets are scaled down by the same factor.
+
+        Returns:
+            tuple: (list of (seat_name, relx, rely), widget scale between 0 and 1).
+        """
+        origin = np.asarray(self.grid_options["ORIGIN"], dtype=np.float64)
+        step = np.asarray(self.grid_options["STEP"], dtype=np.float64)
+        last = np.asarray(self.grid_options["LAST"], dtype=np.float64)
+        # Grid is (row, column), positions are (x, y)
+        extent = self.grid[:, ::-1].max(axis=0) if len(self) else np.zeros(2)
+        fitted = np.where(extent > 0, np.minimum(step, (last - origin) / np.maximum(extent, 1)), step)
+        scale = float(np.min(fitted / step))
+        positions = origin + self.grid[:, ::-1] * fitted
+        return [(seat_name, float(x), float(y)) for seat_name, (x, y) in zip(self.seat_names, positions)], scale
@@ -0,0 +1,410 @@
+"""Cabin monitor of ICMS Application
+
+Monitoring pipeline shared by the dashboard and the headless mode: manifest loading into the face gallery,
+capture, frame scheduling, motion gating, face detection, encoding and verification and the seat vote. Nothing
+here imports a GUI or audio library; front ends subclass `CabinMonitor` and receive passengers and seat
+decisions through its hooks.
+
+Author: Ravi Shanker Singh
+"""
+
+import json
+import pathlib
+import threading
+import time
+
+import numpy as np
+
+from cabin import CabinLayout
+from CameraAccess import create_webcam_stream
+from database import ConnectionPool, ManifestSync, stream_passenger_data
+from face_analysis import process_faces, process_faces_full_frame, verify_faces
+from face_tracker import SeatFaceTracker
+from face_workers import FaceWorkerPool
+from frame_scheduler import FrameScheduler
+from gallery import FaceGallery
+from log import Logger
+from motion_gate import SeatMotionGate
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+class Config:
+    """Configuration class for ICMS Dashboard."""
+
+    def __init__(self):
+        """Initialize configuration parameters."""
+        current = pathlib.Path(__file__).parent.resolve()
+        self.background = current.joinpath("Images", "home.png")
+
+        with open("config.json") as data_file:
+            data = json.load(data_file)
+
+        self.camera_source_1 = data["CAMERA"]["FIRST_CAMERA_INDEX"]
+        self.camera_source_2 = data["CAMERA"]["SECOND_CAMERA_INDEX"]
+        # Halves of a combined frame further apart than SYNC_TOLERANCE_MS are re-grabbed up to MAX_REGRABS times
+        self.camera_sync = {
+            "sync_tolerance_ms": data["CAMERA"].get("SYNC_TOLERANCE_MS"),
+            "max_regrabs": data["CAMERA"].get("MAX_REGRABS", 3),
+            "timestamp_source": data["CAMERA"].get("TIMESTAMP_SOURCE", "grab"),
+        }
+        # Camera indices may also name a video file, a directory of stills or "synthetic[:WIDTHxHEIGHT[@FPS]]",
+        # played back at the recorded rate ("realtime") or frame by frame as fast as they are processed ("fast")
+        self.playback = data["CAMERA"].get("PLAYBACK", "realtime")
+        self.loop_playback = data["CAMERA"].get("LOOP", False)
+        # Pixel format, size, rate and driver queue depth requested from each camera when it is opened
+        self.capture_settings = [data["CAMERA"].get("FIRST_CAMERA_CAPTURE"), data["CAMERA"].get("SECOND_CAMERA_CAPTURE")]
+        self.frame_shape = tuple(data["FRAME_SHAPE"])
+        # Seats, the camera each is seen by and their dashboard grid come from CABIN, or SEAT_COORDINATES without it
+        self.cabin = CabinLayout.from_config(data)
+        self.seat_coordinates = self.cabin.seat_coordinates
+
+        # "roi" detects per seat crop, "full_frame" detects once and assigns faces to seats geometrically
+        face_detection = data.get("FACE_DETECTION", {})
+        self.face_detection_mode = face_detection.get("MODE", "roi")
+        # Detection and encoding are spread over WORKERS persistent processes, the CPU count when unset, 0 runs in process
+        self.face_workers = face_detection.get("WORKERS", None)
+
+        # Faces closer than EARLY_ACCEPT to the passenger assigned to their seat skip the full gallery search
+        face_verification = data.get("FACE_VERIFICATION", {})
+        self.tolerance = face_verification.get("TOLERANCE", 0.55)
+        self.early_accept = face_verification.get("EARLY_ACCEPT", None)
+        # Galleries from ANN_MIN_GALLERY passengers on are searched through the approximate index
+        self.ann_min_gallery = face_verification.get("ANN_MIN_GALLERY", 10000)
+
+        # Seat swaps and late boarders are picked up by a background sync of the changed manifest rows
+        manifest_sync = data.get("MANIFEST_SYNC", {})
+        self.manifest_sync = manifest_sync.get("ENABLED", False)
+        self.manifest_sync_interval = manifest_sync.get("INTERVAL_SECONDS", 30)
+        self.manifest_updated_column = manifest_sync.get("UPDATED_AT_COLUMN", None)
+        # Detection runs on a copy resized by SCALE, encodings always use the original pixels
+        self.detection_scale = face_detection.get("SCALE", 1.0)
+
+        # Tracking keeps verified identities of stable faces and re-verifies them every REVERIFY_FRAMES frames
+        face_tracking = data.get("FACE_TRACKING", {})
+        self.face_tracking = face_tracking.get("ENABLED", False)
+        self.reverify_frames = face_tracking.get("REVERIFY_FRAMES", 30)
+        self.track_min_iou = face_tracking.get("MIN_IOU", 0.6)
+        self.track_max_appearance_diff = face_tracking.get("MAX_APPEARANCE_DIFF", 12.0)
+
+        # Voice messages are not repeated within REPEAT_INTERVAL_SECONDS and play GAP_SECONDS apart
+        announcements = data.get("ANNOUNCEMENTS", {})
+        self.repeat_interval = announcements.get("REPEAT_INTERVAL_SECONDS", 10)
+        self.announcement_gap = announcements.get("GAP_SECONDS", 0.5)
+        self.max_pending_announcements = announcements.get("MAX_PENDING", 8)
+
+        # Announcements without a pre-recorded clip are synthesised once into a cache of at most MAX_MB
+        tts_cache = data.get("TTS_CACHE", {})
+        self.tts_cache = tts_cache.get("ENABLED", False)
+        self.tts_voice_index = tts_cache.get("VOICE_INDEX", 22)
+        self.tts_rate = tts_cache.get("RATE", 125)
+        self.tts_max_bytes = int(tts_cache.get("MAX_MB", 256) * 1024 * 1024)
+
+        # Seat decisions are a majority vote over the last WINDOW frames, optionally weighted by match distance
+        seat_voting = data.get("SEAT_VOTING", {})
+        self.vote_window = seat_voting.get("WINDOW", 5)
+        self.distance_weighted_vote = seat_voting.get("DISTANCE_WEIGHTED", False)
+
+        # Seats whose thumbnail changed in less than MIN_CHANGED_FRACTION of its pixels skip face detection
+        motion_gating = data.get("MOTION_GATING", {})
+        self.motion_gating = motion_gating.get("ENABLED", False)
+        self.motion_gate_options = {
+            "downscale": motion_gating.get("DOWNSCALE", 0.125),
+            "pixel_threshold": motion_gating.get("PIXEL_THRESHOLD", 15),
+            "min_changed_fraction": motion_gating.get("MIN_CHANGED_FRACTION", 0.02),
+            "max_skipped_frames": motion_gating.get("MAX_SKIPPED_FRAMES", 50),
+        }
+
+        # Frames are analysed at TARGET_FPS, slowed down to MIN_FPS when analysis would take more than
+        # MAX_BUSY_FRACTION of the period away from the UI
+        scheduler = data.get("SCHEDULER", {})
+        self.target_fps = scheduler.get("TARGET_FPS", 10)
+        self.min_fps = scheduler.get("MIN_FPS", 2)
+        self.max_busy_fraction = scheduler.get("MAX_BUSY_FRACTION", 0.8)
+
+        # The camera preview shows the analysed frames downscaled by SCALE, at most FPS times a second
+        preview = data.get("PREVIEW", {})
+        self.preview = preview.get("ENABLED", True)
+        self.preview_fps = preview.get("FPS", 5)
+        self.preview_scale = preview.get("SCALE", 0.5)
+
+        # Headless mode writes the seat decisions as JSON lines to OUTPUT: "-" for stdout, a file path or
+        # "unix:PATH" for a local socket
+        headless = data.get("HEADLESS", {})
+        self.headless_output = headless.get("OUTPUT", "-")
+
+
+CONFIG = Config()
+logger = Logger(module="Cabin Monitor")
+
+
+def resource_usage():
+    """CPU seconds of the process and its face workers and the peak resident memory of the process."""
+    if resource is None:
+        return {}
+    own, children = resource.getrusage(resource.RUSAGE_SELF), resource.getrusage(resource.RUSAGE_CHILDREN)
+    return {
+        "cpu_s": round(own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime, 2),
+        # ru_maxrss is in kilobytes on Linux
+        "max_rss_mb": round(own.ru_maxrss / 1024, 1),
+    }
+
+
+class CabinMonitor:
+    """
+    Cabin monitoring pipeline without a user interface.
+
+    Hooks for front ends, called on the thread named:
+        on_passenger(passenger): New or changed passenger, loader thread.
+        on_removal(passenger_name): Passenger removed from the manifest, loader thread.
+        on_manifest_progress(processed, total): Manifest rows loaded so far, loader thread.
+        on_manifest_loaded(count): Initial manifest loaded, loader thread.
+        display_frames(): Hand the analysed frame `frame` to a preview, analysis thread; must not draw on it.
+        publish_decisions(decisions): Seat decision codes of `voter`, analysis thread.
+
+    Attributes:
+        voter (SeatVoter): Seat vote, the dashboard passes its NotificationController.
+        gallery (FaceGallery): Passengers faces are verified against.
+        vid (WebcamStream or DualWebcamStream): Capture stream, None before `start_webcam`.
+        scheduler (FrameScheduler): Frame scheduler of the stream.
+
+    """
+
+    def __init__(self, voter):
+        """
+        Initialize the CabinMonitor.
+
+        Args:
+            voter (SeatVoter): Seat vote over the seats of `CONFIG.cabin`.
+
+        """
+        self.seat_coordinate = CONFIG.seat_coordinates
+        self.voter = voter
+        # Passenger data is streamed from the database in the background and published as it becomes ready
+        self.gallery = FaceGallery(ann_min_size=CONFIG.ann_min_gallery)
+        self.db_pool = ConnectionPool()
+        self.manifest_sync = None
+
+        self.vid = None
+        self.face_pool = None
+        self.face_tracker = None
+        if CONFIG.face_tracking:
+            self.face_tracker = SeatFaceTracker(CONFIG.reverify_frames, CONFIG.track_min_iou, CONFIG.track_max_appearance_diff)
+        self.motion_gate = None
+        if CONFIG.motion_gating:
+            self.motion_gate = SeatMotionGate(**CONFIG.motion_gate_options)
+        self.frame = None
+        self.scheduler = None
+        self.frame_process = 0
+        self.frame_info = {}
+        self.published_decisions = None
+
+    def on_passenger(self, passenger):
+        pass
+
+    def on_removal(self, passenger_name):
+        pass
+
+    def on_manifest_progress(self, processed, total):
+        pass
+
+    def on_manifest_loaded(self, count):
+        logger.info(f"Manifest loaded with {count} passengers")
+
+    def display_frames(self):
+        pass
+
+    def publish_decisions(self, decisions):
+        pass
+
+    def start_manifest(self):
+        """Load the manifest on a background thread."""
+        threading.Thread(target=self.load_manifest, daemon=True).start()
+
+    def load_manifest(self):
+        """Stream the passenger manifest into the gallery and keep it in sync, runs on the loader thread."""
+        if CONFIG.manifest_sync:
+            self.manifest_sync = ManifestSync(
+                self.db_pool, self.publish_passenger, self.publish_removal, CONFIG.manifest_sync_interval, CONFIG.manifest_updated_column
+            )
+            try:
+                self.manifest_sync.prime()
+            except Exception as e:
+                logger.error(f"Error priming manifest sync, seat changes need a restart: {e}")
+                self.manifest_sync = None
+
+        published = stream_passenger_data(self.publish_passenger, self.on_manifest_progress, pool=self.db_pool)
+        self.on_manifest_loaded(published)
+        if self.manifest_sync is not None:
+            self.manifest_sync.start()
+
+    def publish_passenger(self, passenger):
+        """Add a new or changed passenger to the gallery and hand it to the front end."""
+        self.gallery.add(*passenger["passenger_dataset"])
+        self.on_passenger(passenger)
+
+    def publish_removal(self, passenger_name):
+        """Remove a passenger from the gallery and hand the removal to the front end."""
+        self.gallery.remove(passenger_name)
+        self.on_removal(passenger_name)
+
+    def start_face_pool(self, frame_shape):
+        """
+        Start the persistent face workers for frames of the given shape and log the face analysis path taken.
+
+        Args:
+            frame_shape (tuple): Shape of the frames the stream delivers.
+
+        """
+        if self.face_pool is not None and self.face_pool.frame_shape != tuple(frame_shape):
+            self.face_pool.close()
+            self.face_pool = None
+        if self.face_pool is None and CONFIG.face_workers != 0:
+            try:
+                self.face_pool = FaceWorkerPool(frame_shape, processes=CONFIG.face_workers, scale=CONFIG.detection_scale)
+                self.face_pool.start()
+            except Exception as e:
+                logger.error(f"Error starting face workers, falling back to in-process analysis: {e}")
+                self.face_pool = None
+
+        if self.face_tracker is not None:
+            path = "full frame detection with face tracking"
+        elif CONFIG.face_detection_mode == "full_frame":
+            path = "full frame detection"
+        else:
+            path = "per seat detection"
+        workers = f"{self.face_pool.processes} face workers" if self.face_pool is not None else "the analysis thread"
+        logger.info(f"Face analysis: {path} on {workers}")
+
+    def start_webcam(self):
+        """Start the webcam stream and its frame scheduler."""
+        self.vid = create_webcam_stream(
+            CONFIG.camera_source_1,
+            CONFIG.camera_source_2,
+            capture_settings=CONFIG.capture_settings,
+            playback=CONFIG.playback,
+            loop=CONFIG.loop_playback,
+            **CONFIG.camera_sync,
+        )
+        self.start_face_pool(self.vid.ring.frames.shape[1:])
+        self.vid.start()
+        self.scheduler = FrameScheduler(self.vid, CONFIG.target_fps, CONFIG.min_fps, CONFIG.max_busy_fraction)
+
+    def run_analysis(self):
+        """Analyse scheduled frames until the stream stops."""
+        while not self.vid.stopped:
+            # The scheduler hands out the freshest frame not analysed yet and counts the stale ones it skips
+            scheduled = self.scheduler.next_frame()
+            if scheduled is not None:
+                self.show_frames(scheduled)
+            time.sleep(self.scheduler.delay_ms() / 1000)
+
+        logger.info(f"Scheduler {self.scheduler.stats}")
+        logger.info(f"Resource usage {resource_usage()}")
+        if self.motion_gate is not None:
+            logger.info(f"Motion gate skip ratios {self.motion_gate.skip_ratios}")
+
+    def show_frames(self, scheduled):
+        """Analyse one frame and hand it to the display."""
+        try:
+            frame_seq, _, self.frame = scheduled
+            self.frame_process += 1
+            logger.debug(f"Frame {frame_seq}: {self.vid.frames_dropped} dropped, {self.vid.idle_polls} polls without a new frame")
+
+            # Process frames and store every seat face signature
+            with self.scheduler.stage("analysis"):
+                self.process_frames()
+
+            # Offer the frame to the preview, which copies it only at its own rate
+            with self.scheduler.stage("display"):
+                self.display_frames()
+
+            # Vote the seat results of this frame into the sliding window of every seat
+            with self.scheduler.stage("tracker"):
+                self.tracker()
+            self.scheduler.complete()
+            if self.motion_gate is not None and self.scheduler.analysed % self.scheduler.report_every == 0:
+                logger.info(f"Motion gate skip ratios {self.motion_gate.skip_ratios}")
+        except Exception as e:
+            logger.error(f"Error in show_frames: {e}")
+
+    def process_seat_info(self, face_embeddings, seat_names=None):
+        """Verify all faces of a frame against the gallery in one batch and return their seat information."""
+        try:
+            matches = verify_faces(self.gallery, face_embeddings, CONFIG.tolerance, seat_names, CONFIG.early_accept)
+        except Exception as e:
+            logger.error(f"Error in process_seat_info: {e}")
+            matches = [("", "", 0)] * len(face_embeddings)
+
+        return [
+            {
+                "passenger_name": passenger_name,
+                "passenger_assign_seat": passenger_seat,
+                "passenger_match_distance": match_distance,
+            }
+            for passenger_name, passenger_seat, match_distance in matches
+        ]
+
+    def tracker(self):
+        """
+        Vote the latest frame into the seat windows and hand the seat decisions to the front end.
+
+        Decisions are published as soon as one changes, and once per voting window otherwise so repeated
+        reminders keep their cadence.
+        """
+        try:
+            decisions = self.voter.vote(self.frame_info)
+            if not np.array_equal(decisions, self.published_decisions) or self.frame_process % CONFIG.vote_window == 0:
+                self.published_decisions = decisions
+                self.publish_decisions(decisions)
+        except Exception as e:
+            logger.error(f"Error in tracker: {e}")
+
+    def process_frames(self):
+        """Process frames and store face signatures."""
+        try:
+            # Seats whose ROI did not change since they were last analysed keep their last result
+            seat_coordinate = self.seat_coordinate
+            if self.motion_gate is not None:
+                seat_coordinate = self.motion_gate.changed_seats(self.frame, self.seat_coordinate)
+
+            frame_info = {seat_name: [] for *_, seat_name in self.seat_coordinate}
+            if seat_coordinate:
+                frame_info.update(self.analyse_seats(seat_coordinate))
+            if self.motion_gate is not None:
+                frame_info = self.motion_gate.carry_forward(frame_info)
+            self.frame_info = frame_info
+
+        except Exception as e:
+            logger.error(f"Error in process_frames: {e}")
+
+    def analyse_seats(self, seat_coordinate):
+        """Detect, encode and verify the faces of the given seats and return their seat information."""
+        if self.face_tracker is not None:
+            return self.face_tracker.process(self.frame, seat_coordinate, self.process_seat_info, CONFIG.detection_scale, self.face_pool)
+
+        if CONFIG.face_detection_mode == "full_frame":
+            result = process_faces_full_frame(self.frame, seat_coordinate, CONFIG.detection_scale, self.face_pool)
+        elif self.face_pool is not None:
+            result = self.face_pool.process(self.frame, seat_coordinate)
+        else:
+            result = process_faces(self.frame, seat_coordinate, CONFIG.detection_scale)
+        frame_info = {seat_name: [] for *_, seat_name in seat_coordinate}
+
+        seats = [seat_name for seat_name, embedding in result.items() if len(embedding) == 1]
+        face_embeddings = [result[seat_name][0] for seat_name in seats]
+        for seat_name, log_info in zip(seats, self.process_seat_info(face_embeddings, seats)):
+            frame_info[seat_name].append(log_info)
+        return frame_info
+
+    def stop(self):
+        """Stop capture, the face workers and the manifest sync."""
+        if self.vid:
+            self.vid.stop()
+        if self.face_pool:
+            self.face_pool.close()
+        if self.manifest_sync:
+            self.manifest_sync.stop()
@@ -0,0 +1,150 @@
+"""Camera pairing check of ICMS Application
+
+Runs `DualWebcamStream` over recorded and synthetic sources and checks that the two camera halves of every
+combined frame belong together and that the skew between them stays bounded:
+
+    fast: a video file on both sides, every pair is handed over in order with matching halves.
+    offset: the second camera starts a few frames ahead, re-grabbing on driver timestamps must bring the halves
+        back in step.
+    realtime: two synthetic cameras paced at their frame rate, the measured skew must stay below the tolerance.
+
+Exits with status 1 when a check fails.
+
+Usage:
+    python check_camera_sync.py
+    python check_camera_sync.py --frames 120 --fps 30 --tolerance 10
+
+Author: Ravi Shanker Singh
+"""
+
+import argparse
+import pathlib
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+from CameraAccess import DualWebcamStream
+from frame_sources import SyntheticSource
+from log import Logger
+
+logger = Logger(module="Camera Sync Check")
+
+
+def write_recording(path, frames, fps, shape=(240, 320, 3)):
+    """Record `frames` synthetic frames into a video file."""
+    source = SyntheticSource(shape, fps, frames=frames, realtime=False)
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"MJPG"), fps, (shape[1], shape[0]))
+    while True:
+        grabbed, frame = source.read()
+        if not grabbed:
+            break
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def read_all(stream, timeout=2.0):
+    """Every combined frame of a stream started in fast playback, as (seq, matching halves) pairs."""
+    read, seq = [], 0
+    stream.start()
+    while True:
+        seq, _, frame = stream.read_next(seq, timeout)
+        if frame is None:
+            break
+        left, right = stream.camera_views(frame)
+        read.append((seq, np.array_equal(left, right)))
+    stream.stop()
+    return read
+
+
+class Checker:
+    """Counts and logs the failed checks."""
+
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, condition, message):
+        if condition:
+            logger.info(f"ok   {message}")
+        else:
+            logger.error(f"FAIL {message}")
+            self.failures += 1
+
+
+def check_fast(checker, recording, frames, tolerance_ms):
+    """Fast playback hands over every pair once, in order, with both halves from the same frame index."""
+    stream = DualWebcamStream(recording, recording, playback="fast")
+    read = read_all(stream)
+    seqs = [seq for seq, _ in read]
+    checker.check(seqs == list(range(1, frames + 1)), f"fast: pairs 1..{frames} read in order, got {len(seqs)}")
+    checker.check(all(matching for _, matching in read), "fast: both halves of every pair show the same frame")
+    checker.check(stream.frames_dropped == 0, "fast: no pair dropped")
+    stats = stream.sync_stats
+    checker.check(stats["max_skew_ms"] <= tolerance_ms, f"fast: max skew {stats['max_skew_ms']:.2f} ms, tolerance {tolerance_ms} ms")
+
+
+def check_offset(checker, recording, frames, tolerance_ms):
+    """A camera that runs ahead is caught up by re-grabbing the other one, after which the halves match."""
+    ahead = 3
+    stream = DualWebcamStream(recording, recording, sync_tolerance_ms=tolerance_ms, timestamp_source="driver", playback="fast")
+    stream.vcap2.set(cv2.CAP_PROP_POS_FRAMES, 1 + ahead)
+    read = read_all(stream)
+    stats = stream.sync_stats
+    # The first pair was read before the offset, every later one must have been brought back in step
+    checker.check(len(read) == frames - ahead, f"offset: {frames - ahead} pairs read, got {len(read)}")
+    checker.check(all(matching for _, matching in read[1:]), "offset: halves match after re-grabbing")
+    checker.check(stats["regrabs"] == ahead, f"offset: {ahead} re-grabs, got {stats['regrabs']}")
+    checker.check(stats["unsynced_pairs"] == 0, f"offset: no pair out of tolerance, max skew {stats['max_skew_ms']:.1f} ms")
+
+
+def check_realtime(checker, fps, tolerance_ms, seconds):
+    """Two paced cameras grabbed back to back stay within the tolerance of each other."""
+    size = "320x240"
+    stream = DualWebcamStream(f"synthetic:{size}@{fps}", f"synthetic:{size}@{fps}", sync_tolerance_ms=tolerance_ms)
+    stream.start()
+    seq, pairs, matching = 0, 0, 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        seq, _, frame = stream.read_next(seq, timeout=1.0)
+        if frame is None:
+            break
+        left, right = stream.camera_views(frame)
+        pairs += 1
+        matching += np.array_equal(left, right)
+    stream.stop()
+    stats = stream.sync_stats
+    expected = seconds * fps
+    checker.check(pairs >= expected * 0.8, f"realtime: {pairs} pairs read in {seconds} s at {fps} fps")
+    checker.check(matching == pairs, f"realtime: {matching} of {pairs} pairs show the same frame on both halves")
+    checker.check(
+        stats["max_skew_ms"] <= tolerance_ms and stats["unsynced_pairs"] == 0,
+        f"realtime: mean skew {stats['mean_skew_ms']:.2f} ms, max {stats['max_skew_ms']:.2f} ms, tolerance {tolerance_ms} ms",
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that DualWebcamStream pairs camera frames with bounded skew.")
+    parser.add_argument("--frames", type=int, default=60, help="Frames of the recorded source")
+    parser.add_argument("--fps", type=int, default=30, help="Frame rate of the sources")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="Skew tolerance in ms")
+    parser.add_argument("--seconds", type=float, default=2.0, help="Duration of the realtime check")
+    args = parser.parse_args()
+
+    checker = Checker()
+    with tempfile.TemporaryDirectory() as directory:
+        recording = write_recording(pathlib.Path(directory) / "cabin.avi", args.frames, args.fps)
+        check_fast(checker, str(recording), args.frames, args.tolerance)
+        check_offset(checker, str(recording), args.frames, args.tolerance)
+    check_realtime(checker, args.fps, args.tolerance, args.seconds)
+
+    if checker.failures:
+        logger.error(f"{checker.failures} camera sync checks failed")
+        sys.exit(1)
+    logger.info("All camera sync checks passed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+"""Manifest sync check of ICMS Application
+
+Runs `ConnectionPool` and `ManifestSync` against a SQLite stand-in of the passengerdetails table, in checksum
+mode and with an updated-at column, and checks that a seat swap, a late boarder and a removal are each reported
+once. The encoding cache is seeded with the test images, so no face encoding is computed. Exits with status 1
+when a check fails.
+
+Usage:
+    python check_manifest_sync.py
+
+Author: Ravi Shanker Singh
+"""
+
+import base64
+import hashlib
+import pathlib
+import sqlite3
+import sys
+import tempfile
+
+import numpy as np
+
+from database import ConnectionPool, ManifestSync
+from encoding_cache import EncodingCache, content_hash
+from log import Logger
+
+logger = Logger(module="Manifest Sync Check")
+
+PASSENGERS = [("Asha", "A1"), ("Bram", "A2"), ("Chen", "B1"), ("Dara", "B2")]
+
+
+def person_image(name):
+    """Stand-in `personImage` column value of a passenger."""
+    return base64.b64encode(f"image of {name}".encode()).decode()
+
+
+def sqlite_connect(path):
+    """SQLite connection with the MD5 and CONCAT_WS functions the default row checksum uses."""
+    connection = sqlite3.connect(path, check_same_thread=False)
+    connection.create_function("MD5", 1, lambda text: hashlib.md5(str(text).encode()).hexdigest())
+    connection.create_function("CONCAT_WS", -1, lambda separator, *parts: separator.join(str(part) for part in parts if part is not None))
+    return connection
+
+
+class Checker:
+    def __init__(self):
+        self.failures = 0
+
+    def check(self, condition, message):
+        if condition:
+            logger.info(f"ok   {message}")
+        else:
+            logger.error(f"FAIL {message}")
+            self.failures += 1
+
+
+def check_sync(checker, directory, updated_column):
+    """Seat swap, insert and delete against one table layout."""
+    mode = f"updated column {updated_column}" if updated_column else "checksums"
+    path = str(directory / f"manifest_{updated_column or 'checksum'}.sqlite")
+    db = sqlite_connect(path)
+    extra = f", {updated_column} INTEGER" if updated_column else ""
+    db.execute(f"CREATE TABLE passengerdetails (passengerName TEXT, personImage TEXT, passengerSeat TEXT{extra})")
+    for name, seat in PASSENGERS:
+        values = (name, person_image(name), seat, 1) if updated_column else (name, person_image(name), seat)
+        db.execute(f"INSERT INTO passengerdetails VALUES ({', '.join('?' * len(values))})", values)
+    db.commit()
+
+    cache = EncodingCache(directory / f"encodings_{updated_column or 'checksum'}.sqlite")
+    for name, _ in PASSENGERS + [("Eve", None)]:
+        cache.put(content_hash(person_image(name)), np.full(128, len(name), dtype=np.float64))
+
+    changed, removed = {}, []
+    # One connection, so every sync reuses the connection the previous one returned to the pool
+    pool = ConnectionPool(lambda: sqlite_connect(path), size=1)
+    sync = ManifestSync(
+        pool,
+        lambda passenger: changed.update({passenger["passenger_name"]: passenger["passenger_dataset"][1]}),
+        removed.append,
+        updated_column=updated_column,
+        placeholder="?",
+        cache=cache,
+    )
+    sync.prime()
+    checker.check(sync.sync_once() == (0, 0), f"{mode}: nothing reported before the manifest changes")
+
+    bump = f", {updated_column} = 2" if updated_column else ""
+    db.execute(f"UPDATE passengerdetails SET passengerSeat = 'A2'{bump} WHERE passengerName = 'Asha'")
+    db.execute(f"UPDATE passengerdetails SET passengerSeat = 'A1'{bump} WHERE passengerName = 'Bram'")
+    values = ("Eve", person_image("Eve"), "C1", 2) if updated_column else ("Eve", person_image("Eve"), "C1")
+    db.execute(f"INSERT INTO passengerdetails VALUES ({', '.join('?' * len(values))})", values)
+    db.execute("DELETE FROM passengerdetails WHERE passengerName = 'Dara'")
+    db.commit()
+
+    checker.check(sync.sync_once() == (3, 1), f"{mode}: three changed and one removed passenger reported")
+    checker.check(changed == {"Asha": "A2", "Bram": "A1", "Eve": "C1"}, f"{mode}: seat swap and late boarder {changed}")
+    checker.check(removed == ["Dara"], f"{mode}: removal {removed}")
+    checker.check(sync.sync_once() == (0, 0), f"{mode}: nothing reported again")
+
+    pool.close()
+    cache.close()
+    db.close()
+
+
+def check_pool_timeout(checker, directory):
+    """A borrower gives up with a clear error when every connection stays in use."""
+    path = str(directory / "timeout.sqlite")
+    pool = ConnectionPool(lambda: sqlite_connect(path), size=1, timeout=0.3)
+    with pool.connection():
+        try:
+            with pool.connection():
+                pass
+            checker.check(False, "pool: second borrower of a pool of one times out")
+        except TimeoutError as e:
+            checker.check(True, f"pool: second borrower of a pool of one times out ({e})")
+    with pool.connection() as connection:
+        checker.check(connection.execute("SELECT 1").fetchone() == (1,), "pool: connection is lent again once returned")
+    pool.close()
+
+
+def main():
+    checker = Checker()
+    with tempfile.TemporaryDirectory() as directory:
+        directory = pathlib.Path(directory)
+        check_sync(checker, directory, None)
+        check_sync(checker, directory, "updatedAt")
+        check_pool_timeout(checker, directory)
+    if checker.failures:
+        logger.error(f"{checker.failures} manifest sync checks failed")
+        sys.exit(1)
+    logger.info("All manifest sync checks passed")
+
+
+if __name__ == "__main__":
+    main()
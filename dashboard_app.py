@@ -0,0 +1,287 @@
+"""ICMS Dashboard window
+
+Tk front end of the cabin monitor: seat widgets, the manifest progress, voice announcements and the camera
+preview. The pipeline itself runs in `cabin_monitor.CabinMonitor`.
+
+Author: Ravi Shanker Singh
+"""
+
+import queue
+import sys
+import threading
+import tkinter as tk
+from tkinter import PhotoImage
+
+import numpy as np
+from announcements import AnnouncementQueue
+from cabin_monitor import CONFIG, CabinMonitor
+from frame_scheduler import LoopLagMonitor
+from helper import NotificationController, decode_thumbnail, mp3_files
+from log import Logger
+from preview import SeatPreview
+from tts_cache import TTSCache, announcement_texts, seat_announcement_text
+
+logger = Logger(module="ICMS Dashboard")
+
+
+# fmt: off
+class WebcamApp(CabinMonitor):
+    """Main class for the ICMS Dashboard application."""
+
+    def __init__(self, root):
+        """Initialize the application."""
+        # Initialize the main application
+        self.root = root
+        self.root.title("Webcam Face Recognition")
+
+        # Set up GUI elements
+        self.bg_image = PhotoImage(file=CONFIG.background)
+        self.root.geometry("1920x1200")
+        self.bg_label = tk.Label(root, image=self.bg_image)
+        self.bg_label.place(relwidth=1, relheight=1)
+
+        # Create NotificationController, it votes the seat decisions of the pipeline and shows them
+        self.notification_controller = NotificationController(
+            self.root, [], CONFIG.cabin, CONFIG.vote_window, CONFIG.distance_weighted_vote, CONFIG.tolerance
+        )
+        super().__init__(self.notification_controller)
+        self.manifest_updates = queue.Queue()
+        self.manifest_label = tk.Label(root, text="Manifest: loading...", font=("Arial", 12), bg="#007D96", fg="white")
+        self.manifest_label.place(relx=0.99, rely=0.01, anchor="ne")
+
+        # Seat decisions travel from the analysis thread to the Tk loop, voice messages from the Tk loop to the audio thread
+        self.seat_updates = queue.Queue()
+        self.announcements = AnnouncementQueue(mp3_files, CONFIG.repeat_interval, CONFIG.announcement_gap, CONFIG.max_pending_announcements)
+        self.announcements.start()
+        # Personalised announcements are rendered once per passenger in the background as the manifest loads
+        self.tts_cache = None
+        if CONFIG.tts_cache:
+            self.tts_cache = TTSCache(voice_index=CONFIG.tts_voice_index, rate=CONFIG.tts_rate, max_bytes=CONFIG.tts_max_bytes)
+            self.tts_cache.start()
+            for seat_name in CONFIG.cabin.seat_names:
+                if seat_name not in self.announcements.clips:
+                    self.tts_cache.render_async(seat_name, seat_announcement_text(seat_name), self.announcements.add_clip)
+        self.loop_lag = LoopLagMonitor(self.root.after)
+        self.analysis_thread = None
+        self.preview = None
+        self.monitoring = False
+        self.root.protocol("WM_DELETE_WINDOW", self.on_closing)
+        self.seat_decisions = None
+        self.empty_skip_update_notification = 5
+        # Label code shown by every seat widget and the number of publishes every seat was decided empty in a row
+        self.shown_codes = np.full(len(CONFIG.cabin), self.notification_controller.empty_code, dtype=np.int64)
+        self.ui_statbility = np.zeros(len(CONFIG.cabin), dtype=np.int64)
+        self.welcome_notification = {}
+        self.message_take_off = True
+
+        # The loader publishes into the announcements and widgets set up above
+        self.start_manifest()
+        self.root.after(100, self.apply_manifest_updates)
+
+    def on_passenger(self, passenger):
+        """Queue a new or changed passenger for the Tk widgets."""
+        # The seat thumbnail is decoded and scaled here, off the Tk thread, for passengers of the monitored seats
+        if passenger["passenger_dataset"][1] in CONFIG.cabin.index:
+            thumbnail_size = self.notification_controller.thumbnail_size
+            try:
+                passenger["passenger_thumbnail"] = decode_thumbnail(passenger["passenger_image"], thumbnail_size)
+            except Exception as e:
+                logger.warn(f"Could not decode the image of {passenger['passenger_name']}: {e}")
+        self.manifest_updates.put(("passenger", passenger))
+        self.render_announcements(passenger["passenger_name"])
+
+    def render_announcements(self, passenger_name):
+        """Queue the personalised announcements of a passenger without a pre-recorded clip for rendering."""
+        if self.tts_cache is None:
+            return
+        for message, text in announcement_texts(passenger_name).items():
+            if message not in self.announcements.clips:
+                self.tts_cache.render_async(message, text, self.announcements.add_clip)
+
+    def on_removal(self, passenger_name):
+        """Queue the removal of a passenger for the Tk widgets."""
+        self.manifest_updates.put(("removed", passenger_name))
+
+    def on_manifest_progress(self, processed, total):
+        self.manifest_updates.put(("progress", (processed, total)))
+
+    def on_manifest_loaded(self, count):
+        self.manifest_updates.put(("done", count))
+
+    def apply_manifest_updates(self):
+        """Apply passengers published by the loader and sync threads to the Tk widgets."""
+        try:
+            while True:
+                kind, payload = self.manifest_updates.get_nowait()
+                if kind == "passenger":
+                    self.notification_controller.add_passenger(payload)
+                elif kind == "removed":
+                    self.notification_controller.remove_passenger(payload)
+                elif kind == "progress":
+                    self.manifest_label.config(text=f"Manifest: {payload[0]}/{payload[1]} loaded")
+                else:
+                    self.manifest_label.config(text=f"Manifest: {payload} passengers")
+                    logger.info(f"Manifest loaded with {payload} passengers")
+        except queue.Empty:
+            pass
+        self.root.after(100, self.apply_manifest_updates)
+
+    def start_monitoring(self):
+        """Start the monitoring process."""
+        dataset = self.notification_controller.initialize_seat_info()
+        logger.info(f"Database Loaded for {dataset}")
+        message = "Welcome"
+        self.announcements.announce(message)
+        if not self.monitoring:
+            self.monitoring = True
+        self.start_webcam()
+
+    def start_webcam(self):
+        """Start the webcam stream and the analysis thread."""
+        super().start_webcam()
+        if CONFIG.preview:
+            self.preview = SeatPreview(
+                self.seat_coordinate, self.root.after, CONFIG.preview_scale, CONFIG.preview_fps, on_quit=self.stop_monitoring
+            )
+            self.preview.start()
+        # Inference runs beside the Tk loop, which only applies the seat decisions the analysis thread publishes
+        self.analysis_thread = threading.Thread(target=self.run_analysis, daemon=True)
+        self.analysis_thread.start()
+        self.root.after(20, self.apply_seat_updates)
+        self.loop_lag.start()
+
+    def run_analysis(self):
+        """Analysis thread, analyse scheduled frames until the stream stops."""
+        super().run_analysis()
+        logger.info(f"Event loop lag {self.loop_lag.stats}, {self.notification_controller.widget_updates} seat widget updates")
+
+    def publish_decisions(self, decisions):
+        """Hand the seat decision codes to the Tk thread."""
+        self.seat_updates.put(decisions)
+
+    def stop_monitoring(self):
+        """Monitoring was stopped with the 'q' key in the preview, reset the seats on the Tk thread."""
+        self.seat_updates.put(None)
+        self.vid.stop()
+
+    def apply_seat_updates(self):
+        """Tk side of the analysis thread, apply the seat decisions published since the last call."""
+        try:
+            while True:
+                seat_decisions = self.seat_updates.get_nowait()
+                if seat_decisions is None:
+                    self.reset_seats()
+                    return
+                self.seat_decisions = seat_decisions
+                self.update_gui()
+                self.seat_decisions = None
+        except queue.Empty:
+            pass
+        except Exception as e:
+            logger.error(f"Error in apply_seat_updates: {e}")
+        if not self.vid.stopped or not self.seat_updates.empty():
+            self.root.after(20, self.apply_seat_updates)
+
+    def reset_seats(self):
+        """Show every seat empty again with its assigned passenger, once monitoring stopped."""
+        controller = self.notification_controller
+        controller.initialize_seat_info()
+        for seat_name in controller.seat_names:
+            controller.update_single_seat(seat_name)
+        self.shown_codes[:] = controller.empty_code
+        self.ui_statbility[:] = 0
+
+    def update_gui(self):
+        """
+        Update the GUI based on seatbelt status.
+
+        Only the seats whose decision differs from what their widget shows are touched. An empty decision is shown
+        once the seat was decided empty in `empty_skip_update_notification` publishes in a row.
+        """
+        controller = self.notification_controller
+        codes = self.seat_decisions
+        statuses, colors = controller.label_status[codes], controller.label_color[codes]
+        empty = statuses == "Empty"
+        self.ui_statbility = np.where(empty, self.ui_statbility + 1, 0)
+        due = ~empty | (self.ui_statbility >= self.empty_skip_update_notification)
+        self.ui_statbility[empty & due] = 0
+
+        changed = np.flatnonzero(due & (codes != self.shown_codes))
+        for i in changed:
+            _, status, color = controller.labels[codes[i]]
+            controller.update_single_seat(controller.seat_names[i], None, color, status)
+        self.shown_codes[changed] = codes[changed]
+
+        all_green = bool(np.all(colors == "green"))
+        for i in np.flatnonzero(~empty):
+            seat, (name, _, color) = controller.seat_names[i], controller.labels[codes[i]]
+            message = None
+            if color in ('yellow', "green"):
+                if name not in self.welcome_notification:
+                    message = f"welcome_{name}"
+                    self.welcome_notification[name] = True
+                else:
+                    message = f"seltbelt_{name}"
+            elif color == 'orange':
+                message = seat
+            elif color == 'red':
+                message = "message_unauthorize"
+            elif all_green and self.message_take_off:
+                message = "message_takeoff"
+                self.message_take_off = False
+            if message:
+                self.announcements.announce(message)
+
+    def display_frames(self):
+        """Offer the analysed frame to the preview, which shows a downscaled copy from the Tk loop."""
+        if self.preview is not None:
+            self.preview.offer(self.frame)
+
+    def on_closing(self):
+        """Handle closing the application."""
+        try:
+            if self.vid:
+                self.vid.stop()
+            if self.analysis_thread is not None:
+                self.analysis_thread.join(timeout=2)
+            self.loop_lag.stop()
+            if self.preview is not None:
+                self.preview.stop()
+            self.announcements.close()
+            if self.tts_cache is not None:
+                self.tts_cache.close()
+            self.stop()
+            self.root.destroy()
+        except Exception as e:
+            logger.exception(e)
+            self.root.destroy()
+        else:
+            sys.exit()
+
+
+def main():
+    """Main function to start the application."""
+    root = tk.Tk()
+    app = WebcamApp(root)
+
+    def start_monitoring(event=None):
+        app.start_monitoring()
+
+    # Set up the "Start Monitoring" button
+    start_button = tk.Button(
+        root,
+        text="Start Monitoring",
+        command=start_monitoring,
+        font=("Arial", 18, "bold"),
+        bg="#04AA6D",
+        fg="white",
+    )
+    start_button.place(relx=0.5, rely=0.9, anchor="center")
+
+    # Bind space bar to the "Start Monitoring" button
+    root.bind("<space>", start_monitoring)
+    root.bind("<F1>", lambda event: root.attributes("-fullscreen", True))
+    root.bind("<Escape>", lambda event: root.attributes("-fullscreen", False))
+
+    root.mainloop()
+
@@ -1,5 +1,11 @@
 import base64
+import multiprocessing
 import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 
 import cv2
 import mysql.connector
@@ -7,6 +13,7 @@ import numpy as np
 from dotenv import load_dotenv
 from face_recognition import face_encodings
 
+from encoding_cache import EncodingCache, content_hash
 from log import Logger
 
 # Load environment variables from .env file
@@ -26,35 +33,393 @@ db_config = {
 }
 
 
-def get_passenger_data():
-    data_from_db = []
+class ConnectionPool:
+    """
+    Small pool of reusable DB-API connections.
+
+    The default factory connects to MySQL with `db_config`, any DB-API connection factory works, for instance
+    `lambda: sqlite3.connect(path, check_same_thread=False)` for a local stand-in of the manifest database.
+
+    Methods:
+        connection(): Context manager lending a connection from the pool.
+        borrow(): Take a connection, waiting at most `timeout` seconds for one to become free.
+        close(): Close every idle connection.
+
+    """
+
+    def __init__(self, connect=None, size=2, timeout=30.0):
+        """
+        Initialize the ConnectionPool.
+
+        Args:
+            connect (callable, optional): Returns a new DB-API connection, defaults to MySQL with `db_config`.
+            size (int, optional): Maximum number of open connections.
+            timeout (float, optional): Seconds a borrower waits for a free connection.
+
+        """
+        self.connect = connect or (lambda: mysql.connector.connect(**db_config))
+        self.size = size
+        self.timeout = timeout
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def connection(self):
+        """
+        Lend a connection, a connection that raised is closed instead of returned to the pool.
+
+        Raises:
+            TimeoutError: When no connection became free within `timeout` seconds.
+        """
+        connection = self.borrow()
+
+        try:
+            yield connection
+        except Exception:
+            with self.lock:
+                self.created -= 1
+            try:
+                connection.close()
+            except Exception:
+                pass
+            raise
+
+        # End the read transaction, a pooled MySQL connection would otherwise keep its REPEATABLE READ snapshot
+        # and later borrowers would never see rows changed after its first SELECT
+        try:
+            connection.rollback()
+        except Exception as e:
+            logger.warn(f"Dropping a connection that could not be reset: {e}")
+            with self.lock:
+                self.created -= 1
+            try:
+                connection.close()
+            except Exception:
+                pass
+        else:
+            self.idle.put(connection)
+
+    def borrow(self):
+        """Take an idle connection, open a new one while below `size`, or wait for one to be returned."""
+        deadline = time.monotonic() + self.timeout
+        while True:
+            try:
+                return self.idle.get_nowait()
+            except queue.Empty:
+                pass
+            with self.lock:
+                create = self.created < self.size
+                self.created += create
+            if create:
+                try:
+                    return self.connect()
+                except Exception:
+                    # A failed connect frees its slot again
+                    with self.lock:
+                        self.created -= 1
+                    raise
+
+            # Dropped connections free their slot without being returned, so waiting is done in short steps
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise TimeoutError(f"No database connection became free within {self.timeout} s, all {self.size} are in use")
+            try:
+                return self.idle.get(timeout=min(remaining, 0.1))
+            except queue.Empty:
+                pass
+
+    def close(self):
+        """Close every idle connection."""
+        while True:
+            try:
+                connection = self.idle.get_nowait()
+            except queue.Empty:
+                return
+            with self.lock:
+                self.created -= 1
+            connection.close()
+
+
+def encode_passenger_image(load_image):
+    """Decode a passenger image and compute its face encoding."""
+    image_np = np.frombuffer(load_image, dtype=np.uint8)
+    image = cv2.imdecode(image_np, cv2.IMREAD_COLOR)
+    return face_encodings(image)[0]
+
+
+def stream_passenger_data(on_passenger, on_progress=None, batch_size=16, workers=None, cache=None, pool=None):
+    """
+    Read the passenger manifest incrementally and publish every passenger as soon as its encoding is ready.
+
+    Rows are fetched `batch_size` at a time. Cached encodings are published straight away, the others are decoded
+    and encoded on a process pool, so the caller can start monitoring while the manifest is still loading.
+    Passengers are identified by name, a row repeating the name of an earlier one is reported and skipped.
+
+    Args:
+        on_passenger (callable): Called with every passenger record, from the loader or a pool callback thread.
+        on_progress (callable, optional): Called with (processed, total) after every passenger.
+        batch_size (int, optional): Rows fetched from the database at a time.
+        workers (int, optional): Encoding processes, defaults to the CPU count, 0 encodes in the calling thread.
+        cache (EncodingCache, optional): Encoding cache, a new one on the default location when not provided.
+        pool (ConnectionPool, optional): Pool to borrow the connection from, a one-off MySQL connection otherwise.
+
+    Returns:
+        int: Number of passengers published.
+    """
+    encoding_cache = cache or EncodingCache()
+    progress = {"processed": 0, "published": 0, "total": 0}
+    progress_lock = threading.Lock()
+    connection_pool = pool or ConnectionPool(size=1)
+    executor = None
+    names = set()
+
+    def publish(passenger_row, load_image, face_encoding=None, error=None):
+        name, _, seat = passenger_row
+        if error is None:
+            on_passenger({"passenger_name": name, "passenger_image": load_image, "passenger_dataset": [name, seat, face_encoding]})
+        else:
+            logger.error(f"Error processing passenger {name}: {error}")
+        with progress_lock:
+            progress["processed"] += 1
+            progress["published"] += error is None
+            processed, total = progress["processed"], progress["total"]
+        if on_progress:
+            on_progress(processed, total)
+
+    def encoded(passenger_row, load_image, future):
+        try:
+            face_encoding = future.result()
+            encoding_cache.put(content_hash(passenger_row[1]), face_encoding)
+            publish(passenger_row, load_image, face_encoding)
+        except Exception as e:
+            publish(passenger_row, load_image, error=e)
 
     try:
-        connection = mysql.connector.connect(**db_config)
-        cursor = connection.cursor()
-        cursor.execute("SELECT passengerName, personImage, passengerSeat FROM passengerdetails")
-        results = cursor.fetchall()
+        with connection_pool.connection() as connection:
+            cursor = connection.cursor()
+            cursor.execute("SELECT COUNT(*) FROM passengerdetails")
+            progress["total"] = cursor.fetchone()[0]
+            cursor.execute("SELECT passengerName, personImage, passengerSeat FROM passengerdetails")
 
-        for passenger in results:
+            if workers != 0:
+                # Spawned workers do not inherit the Tk interpreter of the dashboard
+                executor = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for passenger in rows:
+                    if passenger[0] in names:
+                        publish(passenger, None, error=ValueError("another passenger has the same name, only the first is monitored"))
+                        continue
+                    names.add(passenger[0])
+                    try:
+                        load_image = base64.b64decode(passenger[1])
+                        face_encoding = encoding_cache.get(content_hash(passenger[1]))
+                        if face_encoding is not None:
+                            encoding_cache.hits += 1
+                            publish(passenger, load_image, face_encoding)
+                            continue
+
+                        encoding_cache.misses += 1
+                        if executor is None:
+                            face_encoding = encode_passenger_image(load_image)
+                            encoding_cache.put(content_hash(passenger[1]), face_encoding)
+                            publish(passenger, load_image, face_encoding)
+                        else:
+                            future = executor.submit(encode_passenger_image, load_image)
+                            future.add_done_callback(lambda done, row=passenger, image=load_image: encoded(row, image, done))
+                    except Exception as e:
+                        publish(passenger, None, error=e)
+    except Exception as e:
+        logger.error(f"Error fetching data from the database:  {e}")
+    finally:
+        if executor is not None:
+            executor.shutdown(wait=True)
+        if pool is None:
+            connection_pool.close()
+        logger.info(f"Face encoding cache: {encoding_cache.hits} hits, {encoding_cache.misses} encoded")
+        if cache is None:
+            encoding_cache.close()
+
+    return progress["published"]
+
+
+def get_passenger_data(cache=None, workers=0, pool=None):
+    """
+    Read the whole passenger manifest.
+
+    Returns:
+        list: Passenger records with name, image bytes and [name, seat, face encoding] dataset.
+    """
+    data_from_db = []
+    stream_passenger_data(data_from_db.append, workers=workers, cache=cache, pool=pool)
+    return data_from_db
+
+
+# Row checksum computed by MySQL, so unchanged images never leave the database
+ROW_CHECKSUM = "MD5(CONCAT_WS('|', passengerName, passengerSeat, personImage))"
+
+
+class ManifestSync:
+    """
+    Background sync of changed passenger rows into the running application.
+
+    Rows changed since the last sync are found through an updated-at column when the table has one, otherwise
+    through a checksum of every row computed by the database. Only the names and checksums of the candidate rows
+    are read, the images are fetched for the changed rows alone, which are encoded (through the encoding cache)
+    and published. Passengers deleted from the table are reported as removed.
+
+    Methods:
+        prime(): Remember the current manifest state without publishing it.
+        sync_once(): Publish the passengers changed or removed since the last sync.
+        start(): Run `sync_once` every `interval` seconds on a background thread.
+        stop(): Stop the background thread.
+
+    """
+
+    def __init__(
+        self,
+        pool,
+        on_changed,
+        on_removed,
+        interval=30.0,
+        updated_column=None,
+        placeholder="%s",
+        cache=None,
+        checksum=ROW_CHECKSUM,
+        batch_size=100,
+    ):
+        """
+        Initialize the ManifestSync.
+
+        Args:
+            pool (ConnectionPool): Pool the sync borrows its connection from.
+            on_changed (callable): Called with the passenger record of every new or changed row.
+            on_removed (callable): Called with the name of every passenger removed from the table.
+            interval (float, optional): Seconds between two syncs of the background thread.
+            updated_column (str, optional): Column holding the last update time of a row, checksums when None.
+            placeholder (str, optional): Parameter placeholder of the driver, "%s" for MySQL, "?" for SQLite.
+            cache (EncodingCache, optional): Encoding cache, a new one on the default location when not provided.
+            checksum (str, optional): SQL expression of the row checksum, a SQLite stand-in needs an MD5 function
+                registered with `create_function` for the default.
+            batch_size (int, optional): Changed rows fetched with their images per query.
+
+        """
+        self.pool = pool
+        self.on_changed = on_changed
+        self.on_removed = on_removed
+        self.interval = interval
+        self.updated_column = updated_column
+        self.placeholder = placeholder
+        self.cache = cache or EncodingCache()
+        self.checksum = checksum
+        self.batch_size = batch_size
+        self.checksums = {}
+        self.last_updated = None
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def _fetch(self, cursor):
+        """Name, checksum and, with an updated-at column, update time of the rows that may have changed."""
+        columns = f"passengerName, {self.checksum}"
+        if self.updated_column is None:
+            cursor.execute(f"SELECT {columns} FROM passengerdetails")
+        elif self.last_updated is None:
+            cursor.execute(f"SELECT {columns}, {self.updated_column} FROM passengerdetails")
+        else:
+            # Rows updated in the same instant as the last sync are fetched again and filtered by checksum
+            query = f"SELECT {columns}, {self.updated_column} FROM passengerdetails WHERE {self.updated_column} >= {self.placeholder}"
+            cursor.execute(query, (self.last_updated,))
+        return cursor.fetchall()
+
+    def _fetch_rows(self, cursor, names):
+        """(passengerName, personImage, passengerSeat) rows of the given passengers, `batch_size` names per query."""
+        rows = {}
+        for i in range(0, len(names), self.batch_size):
+            batch = names[i : i + self.batch_size]
+            placeholders = ", ".join([self.placeholder] * len(batch))
+            query = f"SELECT passengerName, personImage, passengerSeat FROM passengerdetails WHERE passengerName IN ({placeholders})"
+            cursor.execute(query, batch)
+            for row in cursor.fetchall():
+                rows.setdefault(row[0], row)
+        return list(rows.values())
+
+    def _changes(self, fetch_images=True):
+        """Return the changed rows and the names removed from the table, and advance the sync state."""
+        with self.pool.connection() as connection:
+            cursor = connection.cursor()
+            candidates = self._fetch(cursor)
+            if self.updated_column is None:
+                names = {row[0] for row in candidates}
+            else:
+                cursor.execute("SELECT passengerName FROM passengerdetails")
+                names = {row[0] for row in cursor.fetchall()}
+
+            changed_names, seen = [], set()
+            for row in candidates:
+                # Passengers are identified by name, later rows repeating a name are ignored as by the loader
+                if row[0] in seen:
+                    continue
+                seen.add(row[0])
+                if self.checksums.get(row[0]) != row[1]:
+                    self.checksums[row[0]] = row[1]
+                    changed_names.append(row[0])
+                if self.updated_column is not None and row[2] is not None:
+                    self.last_updated = row[2] if self.last_updated is None else max(self.last_updated, row[2])
+            changed = self._fetch_rows(cursor, changed_names) if fetch_images else []
+            cursor.close()
+
+        removed = [name for name in self.checksums if name not in names]
+        for name in removed:
+            del self.checksums[name]
+        return changed, removed
+
+    def prime(self):
+        """Remember the checksum of every row so the first sync only reports later changes, no image is read."""
+        self._changes(fetch_images=False)
+
+    def sync_once(self):
+        """
+        Publish the passengers changed or removed since the last sync.
+
+        Returns:
+            tuple: Number of changed and removed passengers.
+        """
+        changed, removed = self._changes()
+        for passenger in changed:
             try:
                 load_image = base64.b64decode(passenger[1])
-                image_np = np.frombuffer(load_image, dtype=np.uint8)
-                image = cv2.imdecode(image_np, cv2.IMREAD_COLOR)
-                face_encoding = face_encodings(image)[0]
-
-                passenger_data = {
+                face_encoding = self.cache.get_or_compute(passenger[1], lambda: encode_passenger_image(load_image))
+                self.on_changed({
                     "passenger_name": passenger[0],
                     "passenger_image": load_image,
                     "passenger_dataset": [passenger[0], passenger[2], face_encoding],
-                }
+                })
+            except Exception as e:
+                logger.error(f"Error syncing passenger {passenger[0]}: {e}")
+        for name in removed:
+            self.on_removed(name)
 
-                data_from_db.append(passenger_data)
+        if changed or removed:
+            logger.info(f"Manifest sync: {len(changed)} changed, {len(removed)} removed")
+        return len(changed), len(removed)
 
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.sync_once()
             except Exception as e:
-                logger.error(f"Error processing passenger {passenger[0]}: {e}")
-    except Exception as e:
-        logger.error(f"Error fetching data from the database:  {e}")
-    else:
-        connection.close()
+                logger.error(f"Error in manifest sync: {e}")
 
-    return data_from_db
+    def start(self):
+        """Run `sync_once` every `interval` seconds on a background thread."""
+        self.stopped.clear()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop the background thread."""
+        self.stopped.set()
@@ -0,0 +1,110 @@
+"""Face encoding cache of ICMS Application
+
+Stores the 128-d face encoding of every passenger image in a small SQLite file, keyed by a content hash of the
+image blob, so only new or changed passenger images have to go through dlib on start up.
+
+Author: Ravi Shanker Singh
+"""
+
+import hashlib
+import os
+import pathlib
+import sqlite3
+import threading
+
+import numpy as np
+
+from log import Logger
+
+logger = Logger(module="Encoding Cache")
+
+current = pathlib.Path(__file__).parent.resolve()
+DEFAULT_CACHE_PATH = current.joinpath("cache", "face_encodings.sqlite")
+
+
+def content_hash(blob):
+    """
+    Hash an image blob as stored in the database.
+
+    Args:
+        blob (bytes or str): Raw `personImage` column value.
+
+    Returns:
+        str: Hex digest identifying the image content.
+    """
+    if isinstance(blob, str):
+        blob = blob.encode()
+    return hashlib.sha1(blob).hexdigest()
+
+
+class EncodingCache:
+    """
+    Persistent mapping of image content hash to face encoding.
+
+    Methods:
+        get(key): Return the cached encoding for a content hash or None.
+        put(key, encoding): Store the encoding of a content hash.
+        get_or_compute(blob, compute): Return the cached encoding of a blob, computing it on a miss.
+        close(): Close the underlying database file.
+
+    """
+
+    def __init__(self, path=None):
+        """
+        Initialize the EncodingCache.
+
+        Args:
+            path (str or Path, optional): Location of the cache file, defaults to $ICMS_ENCODING_CACHE or
+                cache/face_encodings.sqlite next to the application.
+
+        """
+        self.path = pathlib.Path(path or os.getenv("ICMS_ENCODING_CACHE") or DEFAULT_CACHE_PATH)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS encodings (hash TEXT PRIMARY KEY, encoding BLOB NOT NULL)")
+        self.connection.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """Return the cached encoding for a content hash or None."""
+        with self.lock:
+            row = self.connection.execute("SELECT encoding FROM encodings WHERE hash = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float64)
+
+    def put(self, key, encoding):
+        """Store the encoding of a content hash."""
+        blob = np.asarray(encoding, dtype=np.float64).tobytes()
+        with self.lock:
+            self.connection.execute("INSERT OR REPLACE INTO encodings (hash, encoding) VALUES (?, ?)", (key, blob))
+            self.connection.commit()
+
+    def get_or_compute(self, blob, compute):
+        """
+        Return the cached encoding of an image blob, computing and storing it on a miss.
+
+        Args:
+            blob (bytes or str): Raw `personImage` column value.
+            compute (callable): Called without arguments on a miss, must return the face encoding.
+
+        Returns:
+            np.ndarray: Face encoding of the image.
+        """
+        key = content_hash(blob)
+        encoding = self.get(key)
+        if encoding is not None:
+            self.hits += 1
+            return encoding
+
+        self.misses += 1
+        encoding = compute()
+        self.put(key, encoding)
+        return encoding
+
+    def close(self):
+        """Close the underlying database file."""
+        with self.lock:
+            self.connection.close()
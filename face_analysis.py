@@ -0,0 +1,250 @@
+"""Face analysis of ICMS Application
+
+Face detection, encoding and verification of the seat ROIs of a frame. Free of GUI and audio dependencies so the
+headless monitor and the face workers can use it without loading Tk.
+
+Author: Ravi Shanker Singh
+"""
+
+import time
+
+import cv2
+import numpy as np
+from face_recognition import face_encodings, face_locations
+from joblib import Parallel, delayed
+
+from gallery import FaceGallery
+from log import Logger
+
+logger = Logger(module="Face Analysis")
+
+
+# fmt: off
+def detect_faces(rgb_image, scale=1.0):
+    """
+    Detect faces on a resized copy of the image and map the boxes back to the original pixels.
+
+    Args:
+        rgb_image (np.ndarray): RGB image.
+        scale (float, optional): Resize factor of the detection copy, 1.0 detects on the original image.
+
+    Returns:
+        list: Face boxes as (top, right, bottom, left) in pixels of `rgb_image`.
+    """
+    if scale == 1.0:
+        return face_locations(rgb_image)
+
+    h, w = rgb_image.shape[:2]
+    small_image = cv2.resize(rgb_image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    return [
+        (max(int(top / scale), 0), min(int(right / scale), w), min(int(bottom / scale), h), max(int(left / scale), 0))
+        for top, right, bottom, left in face_locations(small_image)
+    ]
+
+
+def process_faces(frame, seat_coordinates, scale=1.0):
+    """
+    Process faces in the given frame and return a dictionary with seat information.
+
+    Detection runs on a copy of every seat ROI resized by `scale`, encoding always uses the original pixels.
+    """
+    def process_seat(x1, y1, x2, y2, seat_name):
+        seat_roi = frame[y2:y1, x1:x2]
+        rgb_seat_roi = cv2.cvtColor(seat_roi, cv2.COLOR_BGR2RGB)
+        face_area = detect_faces(rgb_seat_roi, scale)
+
+        if len(face_area) == 1:
+            face_encoding = face_encodings(rgb_seat_roi, face_area)
+            return seat_name, face_encoding
+        else:
+            return seat_name, []
+
+    return dict(Parallel(n_jobs=-1)(delayed(process_seat)(x1, y1, x2, y2, seat_name) for x1, y1, x2, y2, seat_name in seat_coordinates))
+
+
+def seat_overlap(face_boxes, seat_coordinates):
+    """
+    Compute which fraction of every face box lies inside every seat ROI.
+
+    Args:
+        face_boxes (list): Face boxes as (top, right, bottom, left) tuples.
+        seat_coordinates (list): Seat ROIs as returned by `seats_coordinates`.
+
+    Returns:
+        np.ndarray: Overlap matrix of shape (faces, seats) with values between 0 and 1.
+    """
+    faces = np.asarray(face_boxes, dtype=np.float32).reshape(-1, 4)
+    # Seat tuples are (start, bottom, end, top, name), bring them to the face box (top, right, bottom, left) order
+    seats = np.array([(y2, x2, y1, x1) for x1, y1, x2, y2, _ in seat_coordinates], dtype=np.float32).reshape(-1, 4)
+
+    top = np.maximum(faces[:, None, 0], seats[None, :, 0])
+    right = np.minimum(faces[:, None, 1], seats[None, :, 1])
+    bottom = np.minimum(faces[:, None, 2], seats[None, :, 2])
+    left = np.maximum(faces[:, None, 3], seats[None, :, 3])
+    intersection = np.clip(bottom - top, 0, None) * np.clip(right - left, 0, None)
+
+    face_area = (faces[:, 2] - faces[:, 0]) * (faces[:, 1] - faces[:, 3])
+    return intersection / np.maximum(face_area, 1.0)[:, None]
+
+
+def detection_regions(seat_coordinates, frame_shape, margin=0.25):
+    """
+    Regions of the frame face detection has to cover to find the faces of the given seats.
+
+    Every seat ROI is widened by `margin` of its size on each side so faces straddling its border are still found.
+    The bounding box of the widened ROIs is searched once when it is not much larger than the ROIs themselves,
+    otherwise, for a few changed seats far apart, every widened ROI is searched on its own.
+
+    Args:
+        seat_coordinates (list): Seat ROIs as returned by `seats_coordinates`.
+        frame_shape (tuple): Shape of the frame.
+        margin (float, optional): Widening of every ROI as a fraction of its width and height.
+
+    Returns:
+        list: (top, right, bottom, left, seat indices) of every region, the seats whose faces it may hold.
+    """
+    h, w = frame_shape[:2]
+    rois = np.array([(y2, x2, y1, x1) for x1, y1, x2, y2, _ in seat_coordinates], dtype=np.int64).reshape(-1, 4)
+    pad_y = ((rois[:, 2] - rois[:, 0]) * margin).astype(np.int64)
+    pad_x = ((rois[:, 1] - rois[:, 3]) * margin).astype(np.int64)
+    widened = np.stack([
+        np.clip(rois[:, 0] - pad_y, 0, h), np.clip(rois[:, 1] + pad_x, 0, w),
+        np.clip(rois[:, 2] + pad_y, 0, h), np.clip(rois[:, 3] - pad_x, 0, w),
+    ], axis=1)
+
+    top, right, bottom, left = widened[:, 0].min(), widened[:, 1].max(), widened[:, 2].max(), widened[:, 3].min()
+    union_area = (bottom - top) * (right - left)
+    roi_area = np.sum((widened[:, 2] - widened[:, 0]) * (widened[:, 1] - widened[:, 3]))
+    if len(widened) == 1 or union_area <= 1.5 * roi_area:
+        return [(int(top), int(right), int(bottom), int(left), list(range(len(widened))))]
+    return [(int(t), int(r), int(b), int(l), [i]) for i, (t, r, b, l) in enumerate(widened)]
+
+
+def locate_seat_faces(rgb_frame, seat_coordinates, scale=1.0, min_overlap=0.5, detect_regions=None):
+    """
+    Run face detection over the given seats and assign every face to the seat it overlaps most.
+
+    Detection only covers the regions of `detection_regions`, so when few seats changed since they were last
+    analysed the rest of the frame is not searched.
+
+    Args:
+        rgb_frame (np.ndarray): Full RGB frame.
+        seat_coordinates (list): Seat ROIs as returned by `seats_coordinates`.
+        scale (float, optional): Detection runs on a copy resized by this factor, boxes are mapped back.
+        min_overlap (float, optional): Minimum fraction of a face inside a seat to assign it to that seat.
+        detect_regions (callable, optional): Takes the regions as (top, right, bottom, left) and returns the face
+            boxes of every region in frame pixels, `FaceWorkerPool.detect` for instance. Detects in process by default.
+
+    Returns:
+        dict: Seat names as keys and lists of face boxes (top, right, bottom, left) in frame pixels as values.
+    """
+    seat_faces = {seat_name: [] for *_, seat_name in seat_coordinates}
+    if not seat_faces:
+        return seat_faces
+
+    regions = detection_regions(seat_coordinates, rgb_frame.shape)
+    if detect_regions is None:
+        region_boxes = [
+            [(t + top, r + left, b + top, l + left) for t, r, b, l in detect_faces(rgb_frame[top:bottom, left:right], scale)]
+            for top, right, bottom, left, _ in regions
+        ]
+    else:
+        region_boxes = detect_regions([region[:4] for region in regions])
+
+    for (*_, seat_indices), boxes in zip(regions, region_boxes):
+        if not boxes:
+            continue
+
+        region_seats = [seat_coordinates[i] for i in seat_indices]
+        overlap = seat_overlap(boxes, region_seats)
+        best_seat = np.argmax(overlap, axis=1)
+        assigned = overlap[np.arange(len(boxes)), best_seat] >= min_overlap
+        for box, seat_idx in zip(np.asarray(boxes)[assigned], best_seat[assigned]):
+            seat_faces[region_seats[seat_idx][4]].append(tuple(int(v) for v in box))
+    return seat_faces
+
+
+def process_faces_full_frame(frame, seat_coordinates, scale=1.0, face_pool=None):
+    """
+    Process faces with one detection pass over the seats and return a dictionary with seat information.
+
+    The colour conversion and face detection run once per frame instead of once per seat, over the given seats
+    only, and faces that straddle a seat boundary are still assigned to the seat holding most of the face. The
+    result has the same shape as `process_faces`. With a started `FaceWorkerPool`, the detection regions and the
+    faces are spread over its workers.
+    """
+    rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    slot = face_pool.publish(frame) if face_pool is not None else None
+    detect_regions = (lambda regions: face_pool.detect(slot, regions)) if face_pool is not None else None
+    seat_faces = locate_seat_faces(rgb_frame, seat_coordinates, scale, detect_regions=detect_regions)
+
+    result = {seat_name: [] for seat_name in seat_faces}
+    seats = [seat_name for seat_name, boxes in seat_faces.items() if len(boxes) == 1]
+    if seats:
+        boxes = [seat_faces[seat_name][0] for seat_name in seats]
+        encodings = face_pool.encode(slot, boxes) if face_pool is not None else face_encodings(rgb_frame, boxes)
+        for seat_name, face_encoding in zip(seats, encodings):
+            result[seat_name] = [face_encoding]
+    return result
+
+
+def do_face_verification(database_faces_embed, passanger_face_embed, tolerance=0.55):
+    """
+    Perform face verification by comparing the embedding vectors from the database.
+
+    Args:
+        database_faces_embed (FaceGallery or dict): Passenger gallery, or the legacy name -> dataset mapping.
+        passanger_face_embed (array-like): Face embedding of the passenger to verify.
+        tolerance (float, optional): Maximum distance for a face to be accepted as a passenger.
+
+    Returns:
+        tuple: (passenger_name, passenger_seat, distance), ("Unknown", "Un", distance) when nobody matches.
+    """
+    gallery = database_faces_embed
+    if not isinstance(gallery, FaceGallery):
+        gallery = FaceGallery.from_passenger_data({"passenger_dataset": data} for data in database_faces_embed.values())
+
+    passenger_info = gallery.match(passanger_face_embed, tolerance)[0]
+    logger.debug(f"face_verification measure:: {passenger_info}")
+    return passenger_info
+
+
+def verify_faces(gallery, face_embeddings, tolerance=0.55, seat_names=None, early_accept=None):
+    """
+    Verify every face of a frame against the gallery with one batched distance computation.
+
+    Args:
+        gallery (FaceGallery): Passenger gallery.
+        face_embeddings (list): Face embeddings found in the frame.
+        tolerance (float, optional): Maximum distance for a face to be accepted as a passenger.
+        seat_names (list, optional): Seat every face was found on, enables the seat-first shortcut.
+        early_accept (float, optional): Distance under which the passenger assigned to the seat is accepted.
+
+    Returns:
+        list: One (passenger_name, passenger_seat, distance) tuple per face.
+    """
+    if not len(face_embeddings):
+        return []
+    results = gallery.match(np.asarray(face_embeddings), tolerance, seat_names, early_accept)
+    logger.debug(f"face_verification measure:: {results}")
+    return results
+
+def time_consumer(func):
+    """_summary_
+
+    Args:
+        func (_type_): _description_
+
+    Returns:
+        _type_: _description_
+    """
+    # This function shows the execution time of
+
+    def wrap_func(*args, **kwargs):
+        t1 = time.time()
+        result = func(*args, **kwargs)
+        t2 = time.time()
+        print(f"Function {func.__name__!r} executed in {(t2-t1):.4f}s")
+        return result
+
+    return wrap_func
@@ -0,0 +1,170 @@
+"""Seat face tracker of ICMS Application
+
+Keeps the last verified identity of every seat while the face box stays in place and looks the same, so a
+passenger sitting still is not re-encoded and re-verified on every frame. Identities are re-verified on a fixed
+cadence regardless.
+
+Author: Ravi Shanker Singh
+"""
+
+import cv2
+import numpy as np
+from face_recognition import face_encodings
+
+from face_analysis import locate_seat_faces
+from log import Logger
+
+logger = Logger(module="Face Tracker")
+
+
+def box_iou(box_a, box_b):
+    """
+    Intersection over union of two face boxes.
+
+    Args:
+        box_a (tuple): Face box as (top, right, bottom, left).
+        box_b (tuple): Face box as (top, right, bottom, left).
+
+    Returns:
+        float: Overlap between 0 and 1.
+    """
+    top, right = max(box_a[0], box_b[0]), min(box_a[1], box_b[1])
+    bottom, left = min(box_a[2], box_b[2]), max(box_a[3], box_b[3])
+    intersection = max(bottom - top, 0) * max(right - left, 0)
+    area_a = (box_a[2] - box_a[0]) * (box_a[1] - box_a[3])
+    area_b = (box_b[2] - box_b[0]) * (box_b[1] - box_b[3])
+    union = area_a + area_b - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def appearance_signature(rgb_frame, box, size=16):
+    """
+    Cheap appearance descriptor of a face, a small grayscale thumbnail of the face box.
+
+    Args:
+        rgb_frame (np.ndarray): Full RGB frame.
+        box (tuple): Face box as (top, right, bottom, left).
+        size (int, optional): Edge length of the thumbnail.
+
+    Returns:
+        np.ndarray: Thumbnail of shape (size, size) as float32.
+    """
+    top, right, bottom, left = box
+    face = cv2.cvtColor(rgb_frame[top:bottom, left:right], cv2.COLOR_RGB2GRAY)
+    return cv2.resize(face, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+
+
+class SeatFaceTracker:
+    """
+    Per seat track of the last verified face.
+
+    Attributes:
+        reverify_frames (int): Frames after which a tracked identity is verified again.
+        min_iou (float): Minimum box overlap with the tracked face to keep the identity.
+        max_appearance_diff (float): Maximum mean grey level difference with the tracked face to keep the identity.
+
+    Methods:
+        lookup(seat_name, box, signature): Return the tracked seat information if the face is unchanged.
+        update(seat_name, box, signature, log_info): Store a freshly verified face.
+        drop(seat_name): Forget the face tracked on a seat.
+        process(frame, seat_coordinates, verify, scale): Run tracked detection, encoding and verification on a frame.
+
+    """
+
+    def __init__(self, reverify_frames=30, min_iou=0.6, max_appearance_diff=12.0):
+        """
+        Initialize the SeatFaceTracker.
+
+        Args:
+            reverify_frames (int, optional): Frames after which a tracked identity is verified again.
+            min_iou (float, optional): Minimum box overlap with the tracked face to keep the identity.
+            max_appearance_diff (float, optional): Maximum mean grey level difference to keep the identity.
+
+        """
+        self.reverify_frames = reverify_frames
+        self.min_iou = min_iou
+        self.max_appearance_diff = max_appearance_diff
+        self.tracks = {}
+        self.reused = 0
+        self.verified = 0
+
+    def lookup(self, seat_name, box, signature):
+        """
+        Return the tracked seat information if the face on the seat has not changed.
+
+        Args:
+            seat_name (str): Seat of the face.
+            box (tuple): Face box as (top, right, bottom, left).
+            signature (np.ndarray): Appearance signature of the face.
+
+        Returns:
+            dict or None: Seat information of the tracked passenger, None when the face has to be verified.
+        """
+        track = self.tracks.get(seat_name)
+        if track is None:
+            return None
+
+        track["age"] += 1
+        if track["age"] >= self.reverify_frames:
+            return None
+        if box_iou(track["box"], box) < self.min_iou:
+            return None
+        if float(np.mean(np.abs(track["signature"] - signature))) > self.max_appearance_diff:
+            return None
+
+        self.reused += 1
+        return track["log_info"]
+
+    def update(self, seat_name, box, signature, log_info):
+        """Store a freshly verified face for a seat."""
+        self.verified += 1
+        self.tracks[seat_name] = {"box": box, "signature": signature, "log_info": log_info, "age": 0}
+
+    def drop(self, seat_name):
+        """Forget the face tracked on a seat."""
+        self.tracks.pop(seat_name, None)
+
+    def process(self, frame, seat_coordinates, verify, scale=1.0, face_pool=None):
+        """
+        Detect faces over the given seats and verify only the seats whose face changed.
+
+        Args:
+            frame (np.ndarray): BGR frame.
+            seat_coordinates (list): Seat ROIs as returned by `seats_coordinates`.
+            verify (callable): Takes a list of face encodings and their seat names, returns one seat information
+                dict per face.
+            scale (float, optional): Detection scale passed to `locate_seat_faces`.
+            face_pool (FaceWorkerPool, optional): Started worker pool the detection and encoding are spread over.
+
+        Returns:
+            dict: Seat names as keys and a list with the seat information of the passenger, or an empty list.
+        """
+        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        slot = face_pool.publish(frame) if face_pool is not None else None
+        detect_regions = (lambda regions: face_pool.detect(slot, regions)) if face_pool is not None else None
+        seat_faces = locate_seat_faces(rgb_frame, seat_coordinates, scale, detect_regions=detect_regions)
+        frame_info = {seat_name: [] for seat_name in seat_faces}
+
+        pending = []
+        for seat_name, boxes in seat_faces.items():
+            if len(boxes) != 1:
+                self.drop(seat_name)
+                continue
+            box = boxes[0]
+            signature = appearance_signature(rgb_frame, box)
+            log_info = self.lookup(seat_name, box, signature)
+            if log_info is None:
+                pending.append((seat_name, box, signature))
+            else:
+                frame_info[seat_name].append(log_info)
+
+        if pending:
+            boxes = [box for _, box, _ in pending]
+            encodings = face_pool.encode(slot, boxes) if face_pool is not None else face_encodings(rgb_frame, boxes)
+            seat_names = [seat_name for seat_name, _, _ in pending]
+            for (seat_name, box, signature), log_info in zip(pending, verify(encodings, seat_names)):
+                self.update(seat_name, box, signature, log_info)
+                frame_info[seat_name].append(log_info)
+
+        logger.debug(f"Tracked seats reused {self.reused}, verified {self.verified}")
+        return frame_info
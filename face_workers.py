@@ -0,0 +1,204 @@
+"""Face encoding worker pool of ICMS Application
+
+Long-lived process pool for face detection and encoding. Frames are published once into a ring of shared memory
+slots, workers only receive the slot index and a region of the frame (a seat ROI, a detection region or a face
+box), and encodings come back as compact float32 arrays, so the per-frame dispatch cost no longer includes
+starting workers or pickling frames. It serves the per-seat detection as well as the full-frame detection and
+the face tracker.
+
+Author: Ravi Shanker Singh
+"""
+
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+from face_recognition import face_encodings
+
+from face_analysis import detect_faces
+from log import Logger
+
+logger = Logger(module="Face Workers")
+
+# Frame ring attached once in every worker process
+_worker_shm = None
+_worker_frames = None
+_worker_scale = 1.0
+
+
+def _attach_frame_ring(shm_name, ring_shape, scale):
+    """Worker initializer, map the shared frame ring into the worker process."""
+    global _worker_shm, _worker_frames, _worker_scale
+    _worker_scale = scale
+    _worker_shm = shared_memory.SharedMemory(name=shm_name)
+    _worker_frames = np.ndarray(ring_shape, dtype=np.uint8, buffer=_worker_shm.buf)
+
+
+def _encode_seat(task):
+    """Detect and encode the face of one seat ROI of a published frame."""
+    slot, x1, y1, x2, y2, seat_name = task
+    seat_roi = _worker_frames[slot, y2:y1, x1:x2]
+    rgb_seat_roi = cv2.cvtColor(seat_roi, cv2.COLOR_BGR2RGB)
+    face_area = detect_faces(rgb_seat_roi, _worker_scale)
+
+    if len(face_area) == 1:
+        return seat_name, np.asarray(face_encodings(rgb_seat_roi, face_area), dtype=np.float32)
+    return seat_name, None
+
+
+def _detect_region(task):
+    """Detect the faces of one region of a published frame, boxes are returned in frame pixels."""
+    slot, top, right, bottom, left = task
+    rgb_region = cv2.cvtColor(_worker_frames[slot, top:bottom, left:right], cv2.COLOR_BGR2RGB)
+    return [(t + top, r + left, b + top, l + left) for t, r, b, l in detect_faces(rgb_region, _worker_scale)]
+
+
+def _encode_face(task):
+    """Encode one face box of a published frame, from a crop around the box with room for the landmarks."""
+    slot, top, right, bottom, left = task
+    h, w = _worker_frames.shape[1:3]
+    pad_y, pad_x = bottom - top, right - left
+    y0, x0 = max(top - pad_y, 0), max(left - pad_x, 0)
+    crop = cv2.cvtColor(_worker_frames[slot, y0:min(bottom + pad_y, h), x0:min(right + pad_x, w)], cv2.COLOR_BGR2RGB)
+    return np.asarray(face_encodings(crop, [(top - y0, right - x0, bottom - y0, left - x0)])[0], dtype=np.float32)
+
+
+class FaceWorkerPool:
+    """
+    Persistent pool of face encoding workers fed through a shared memory frame ring.
+
+    Attributes:
+        frame_shape (tuple): Shape of the frames the ring accepts.
+        slots (int): Number of frames that can be in flight at once.
+        dispatch_ms (float): Time spent publishing and dispatching the last frame.
+
+    Methods:
+        start(): Allocate the frame ring and start the worker processes.
+        publish(frame): Copy a frame into the next ring slot.
+        submit(frame, seat_coordinates): Publish a frame and dispatch its seats without waiting.
+        process(frame, seat_coordinates): Publish a frame and wait for the result of every seat.
+        detect(slot, regions): Detect the faces of regions of a published frame.
+        encode(slot, boxes): Encode face boxes of a published frame.
+        close(): Stop the workers and release the shared memory.
+
+    """
+
+    def __init__(self, frame_shape, slots=4, processes=None, scale=1.0):
+        """
+        Initialize the FaceWorkerPool.
+
+        Args:
+            frame_shape (tuple): Shape (height, width, channels) of the frames to process.
+            slots (int, optional): Number of frame slots in the ring.
+            processes (int, optional): Number of worker processes, defaults to the CPU count.
+            scale (float, optional): Detection scale of the seat ROIs, see `face_analysis.detect_faces`.
+
+        """
+        self.frame_shape = tuple(frame_shape)
+        self.slots = slots
+        self.processes = processes or os.cpu_count()
+        self.scale = scale
+        self.shm = None
+        self.frames = None
+        self.pool = None
+        self.frame_count = 0
+        self.dispatch_ms = 0.0
+
+    @property
+    def started(self):
+        return self.pool is not None
+
+    def start(self):
+        """Allocate the frame ring and start the worker processes."""
+        if self.started:
+            return
+        ring_shape = (self.slots, *self.frame_shape)
+        self.shm = shared_memory.SharedMemory(create=True, size=int(np.prod(ring_shape)))
+        self.frames = np.ndarray(ring_shape, dtype=np.uint8, buffer=self.shm.buf)
+        # Spawned workers do not inherit the Tk interpreter or the camera threads of the dashboard
+        context = multiprocessing.get_context("spawn")
+        self.pool = context.Pool(self.processes, initializer=_attach_frame_ring, initargs=(self.shm.name, ring_shape, self.scale))
+        logger.info(f"Started {self.processes} face workers with a {self.slots} frame ring of {self.frame_shape}")
+
+    def submit(self, frame, seat_coordinates):
+        """
+        Publish a frame into the next ring slot and dispatch one task per seat.
+
+        Args:
+            frame (np.ndarray): BGR frame of shape `frame_shape`.
+            seat_coordinates (list): Seat ROIs as returned by `seats_coordinates`.
+
+        Returns:
+            AsyncResult: Resolves to a list of (seat_name, encodings or None).
+        """
+        start = time.perf_counter()
+        slot = self.publish(frame)
+        pending = self.pool.map_async(_encode_seat, [(slot, x1, y1, x2, y2, seat_name) for x1, y1, x2, y2, seat_name in seat_coordinates])
+        self.dispatch_ms = (time.perf_counter() - start) * 1000
+        logger.debug(f"Face workers dispatch {self.dispatch_ms:.3f} ms for frame slot {slot}")
+        return pending
+
+    def publish(self, frame):
+        """
+        Copy a frame into the next ring slot.
+
+        Args:
+            frame (np.ndarray): BGR frame of shape `frame_shape`.
+
+        Returns:
+            int: Ring slot the workers read the frame from.
+        """
+        slot = self.frame_count % self.slots
+        self.frame_count += 1
+        np.copyto(self.frames[slot], frame)
+        return slot
+
+    def process(self, frame, seat_coordinates):
+        """
+        Process faces in the given frame and return a dictionary with seat information.
+
+        The result has the same shape as `face_analysis.process_faces`.
+        """
+        results = self.submit(frame, seat_coordinates).get()
+        return {seat_name: list(encodings) if encodings is not None else [] for seat_name, encodings in results}
+
+    def detect(self, slot, regions):
+        """
+        Detect the faces of regions of a published frame, one region per worker task.
+
+        Args:
+            slot (int): Ring slot returned by `publish`.
+            regions (list): Regions as (top, right, bottom, left) in frame pixels.
+
+        Returns:
+            list: Face boxes (top, right, bottom, left) in frame pixels, one list per region.
+        """
+        return self.pool.map(_detect_region, [(slot, *region) for region in regions])
+
+    def encode(self, slot, boxes):
+        """
+        Encode face boxes of a published frame, one box per worker task.
+
+        Args:
+            slot (int): Ring slot returned by `publish`.
+            boxes (list): Face boxes as (top, right, bottom, left) in frame pixels.
+
+        Returns:
+            list: Face encoding of every box.
+        """
+        return self.pool.map(_encode_face, [(slot, *box) for box in boxes])
+
+    def close(self):
+        """Stop the workers and release the shared memory."""
+        if self.pool is not None:
+            self.pool.terminate()
+            self.pool.join()
+            self.pool = None
+        if self.shm is not None:
+            self.frames = None
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
@@ -0,0 +1,237 @@
+"""Frame scheduler of ICMS Application
+
+Decides which captured frame is analysed and when. Capture runs at the camera rate in its own thread; the
+scheduler always hands out the freshest frame, counts the frames it skips as stale, and paces analysis at a
+target rate that backs off when the measured stage latency would leave the event loop no time for the UI.
+Every analysed frame is reported with its capture-to-decision latency. `LoopLagMonitor` measures how responsive
+the UI event loop stays while analysis runs beside it.
+
+Author: Ravi Shanker Singh
+"""
+
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+from log import Logger
+
+logger = Logger(module="Frame Scheduler")
+
+
+class FrameScheduler:
+    """
+    Freshest-frame scheduler with an adaptive analysis rate.
+
+    Attributes:
+        target_fps (float): Analysis rate aimed for while stage latency allows it.
+        min_fps (float): Lowest analysis rate the scheduler backs off to.
+        max_busy_fraction (float): Largest share of each analysis period spent in the analysis stages.
+        stage_ms (dict): Smoothed latency of every analysis stage in ms.
+        stale_dropped (int): Captured frames skipped because a newer frame was available.
+        latencies_ms (list): Capture-to-decision latency of the recent analysed frames.
+
+    Methods:
+        next_frame(): Freshest frame not analysed yet as (seq, capture timestamp, frame), None if there is none.
+        stage(name): Context manager timing one analysis stage.
+        complete(): Record the decision of the current frame and return its capture-to-decision latency.
+        delay_ms(): Milliseconds to wait before the next analysis.
+        stats: Summary of rate, latency, dropped frames and polls that found no new frame.
+
+    """
+
+    def __init__(self, stream, target_fps=10.0, min_fps=2.0, max_busy_fraction=0.8, smoothing=0.2, report_every=100):
+        """
+        Initialize the FrameScheduler.
+
+        Args:
+            stream (WebcamStream or DualWebcamStream): Capture stream with a frame ring.
+            target_fps (float, optional): Analysis rate aimed for.
+            min_fps (float, optional): Lowest analysis rate.
+            max_busy_fraction (float, optional): Largest share of a period spent analysing, the rest is left to the UI.
+            smoothing (float, optional): Weight of the newest measurement in the latency averages.
+            report_every (int, optional): Analysed frames between two summary log lines.
+
+        """
+        self.stream = stream
+        self.target_fps = target_fps
+        self.min_fps = min_fps
+        self.max_busy_fraction = max_busy_fraction
+        self.smoothing = smoothing
+        self.report_every = report_every
+
+        self.last_seq = 0
+        self.current_timestamp = None
+        self.cycle_started = None
+        self.stage_ms = {}
+        self.analysis_ms = 0.0
+        self.analysed = 0
+        self.stale_dropped = 0
+        self.latencies_ms = []
+        self.started_at = time.monotonic()
+
+    def next_frame(self):
+        """
+        Freshest frame captured since the last analysed one.
+
+        Frames captured in between are skipped and counted as stale. Lossless rings (recordings played fast) hand
+        out every frame in order instead, so a run over a recording is reproducible.
+
+        Returns:
+            tuple or None: (seq, capture timestamp, frame), None when no new frame was captured.
+        """
+        self.cycle_started = time.monotonic()
+        if self.stream.ring.lossless:
+            seq, timestamp, frame = self.stream.read_next(self.last_seq, timeout=0)
+        else:
+            seq, timestamp, frame = self.stream.read_latest()
+        if frame is None or seq <= self.last_seq:
+            return None
+
+        if seq > self.last_seq + 1 and self.last_seq:
+            self.stale_dropped += seq - self.last_seq - 1
+        self.last_seq = seq
+        self.current_timestamp = timestamp
+        return seq, timestamp, frame
+
+    @contextmanager
+    def stage(self, name):
+        """Time one analysis stage of the current frame."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            previous = self.stage_ms.get(name, elapsed)
+            self.stage_ms[name] = previous + self.smoothing * (elapsed - previous)
+
+    def complete(self):
+        """
+        Record that the decision for the current frame is made.
+
+        Returns:
+            float: Capture-to-decision latency of the frame in ms.
+        """
+        now = time.monotonic()
+        latency_ms = (now - self.current_timestamp) * 1000 if self.current_timestamp is not None else 0.0
+        elapsed = (now - self.cycle_started) * 1000 if self.cycle_started is not None else 0.0
+        self.analysis_ms = elapsed if not self.analysed else self.analysis_ms + self.smoothing * (elapsed - self.analysis_ms)
+
+        self.analysed += 1
+        self.latencies_ms.append(latency_ms)
+        del self.latencies_ms[: -self.report_every]
+        logger.debug(f"Frame {self.last_seq}: capture to decision {latency_ms:.1f} ms, analysis {elapsed:.1f} ms")
+        if self.analysed % self.report_every == 0:
+            logger.info(f"Scheduler {self.stats}")
+        return latency_ms
+
+    @property
+    def period_ms(self):
+        """Current analysis period: the target period, stretched when analysis would exceed its busy share."""
+        period = 1000.0 / self.target_fps
+        if self.max_busy_fraction > 0:
+            period = max(period, self.analysis_ms / self.max_busy_fraction)
+        return min(period, 1000.0 / self.min_fps)
+
+    def delay_ms(self):
+        """Milliseconds to wait from now until the next analysis should start, at least 1."""
+        if self.cycle_started is None:
+            return 1
+        elapsed = (time.monotonic() - self.cycle_started) * 1000
+        return max(int(self.period_ms - elapsed), 1)
+
+    @property
+    def stats(self):
+        """Analysis rate, capture-to-decision latency percentiles, stage latency, dropped frames and idle polls."""
+        latencies = np.array(self.latencies_ms) if self.latencies_ms else np.zeros(1)
+        return {
+            "analysed": self.analysed,
+            "analysis_fps": round(1000.0 / self.period_ms, 2),
+            "latency_p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "latency_p95_ms": round(float(np.percentile(latencies, 95)), 1),
+            "stage_ms": {name: round(value, 1) for name, value in self.stage_ms.items()},
+            "stale_dropped": self.stale_dropped,
+            "idle_polls": self.stream.idle_polls,
+        }
+
+
+class LoopLagMonitor:
+    """
+    Event loop responsiveness probe.
+
+    A heartbeat is scheduled on the event loop every `interval_ms`; the lag is how much later than requested it
+    runs, which is how long the loop was busy with other callbacks.
+
+    Attributes:
+        interval_ms (int): Heartbeat interval.
+        lags_ms (list): Lag of the recent heartbeats.
+        max_lag_ms (float): Largest lag seen since start.
+
+    Methods:
+        start(): Schedule the first heartbeat, no-op while running.
+        stop(): Stop scheduling heartbeats.
+        stats: Percentiles of the recent lag.
+
+    """
+
+    def __init__(self, schedule, interval_ms=50, window=200, report_every=600):
+        """
+        Initialize the LoopLagMonitor.
+
+        Args:
+            schedule (callable): Schedules a callback after a delay in ms on the event loop, e.g. `tk.Tk.after`.
+            interval_ms (int, optional): Heartbeat interval.
+            window (int, optional): Number of recent heartbeats the statistics cover.
+            report_every (int, optional): Heartbeats between two summary log lines.
+
+        """
+        self.schedule = schedule
+        self.interval_ms = interval_ms
+        self.window = window
+        self.report_every = report_every
+        self.lags_ms = []
+        self.max_lag_ms = 0.0
+        self.beats = 0
+        self.expected = None
+        self.running = False
+        self.scheduled = False
+
+    def start(self):
+        """Schedule the first heartbeat, a monitor that is already running keeps its single heartbeat."""
+        if self.running:
+            return
+        self.running = True
+        self.expected = time.monotonic() + self.interval_ms / 1000
+        # A heartbeat still pending from before a stop picks the running monitor up again
+        if not self.scheduled:
+            self.scheduled = True
+            self.schedule(self.interval_ms, self.beat)
+
+    def stop(self):
+        self.running = False
+
+    def beat(self):
+        self.scheduled = False
+        if not self.running:
+            return
+        now = time.monotonic()
+        lag_ms = max((now - self.expected) * 1000, 0.0)
+        self.lags_ms.append(lag_ms)
+        del self.lags_ms[: -self.window]
+        self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+        self.beats += 1
+        if self.beats % self.report_every == 0:
+            logger.info(f"Event loop lag {self.stats}")
+        self.expected = now + self.interval_ms / 1000
+        self.scheduled = True
+        self.schedule(self.interval_ms, self.beat)
+
+    @property
+    def stats(self):
+        """Median, p95 and max lag of the event loop in ms."""
+        lags = np.array(self.lags_ms) if self.lags_ms else np.zeros(1)
+        return {
+            "lag_p50_ms": round(float(np.percentile(lags, 50)), 1),
+            "lag_p95_ms": round(float(np.percentile(lags, 95)), 1),
+            "lag_max_ms": round(self.max_lag_ms, 1),
+        }
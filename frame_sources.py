@@ -0,0 +1,265 @@
+"""Frame sources of ICMS Application
+
+Everything the capture threads can read frames from: live cameras, recorded video files, directories of still
+images and a synthetic generator. Recorded and synthetic sources implement the subset of the `cv2.VideoCapture`
+interface the capture code uses (grab, retrieve, read, get, set, isOpened, release), so the same pipeline runs
+off cabin recordings as off the cameras.
+
+Recorded sources play in one of two modes:
+    realtime: frames are released at the recorded frame rate, as a camera would deliver them.
+    fast: frames are released as fast as they are grabbed; capture streams opened in this mode hand every frame
+        to the consumer, which makes a run over a recording deterministic.
+
+Author: Ravi Shanker Singh
+"""
+
+import pathlib
+import platform
+import time
+
+import cv2
+import numpy as np
+
+from log import Logger
+
+logger = Logger(module="Frame Sources")
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+PLAYBACK_MODES = ("realtime", "fast")
+
+
+class RecordedSource:
+    """
+    Base of the sources that replay frames instead of reading a camera.
+
+    Subclasses implement `frame_count` and `load(index)`; pacing, looping, position and the
+    `cv2.VideoCapture` interface are shared.
+
+    Attributes:
+        fps (float): Frame rate the frames are released at in realtime mode and timestamped with.
+        realtime (bool): Release frames at `fps` instead of as fast as they are grabbed.
+        loop (bool): Start again at the first frame after the last one.
+        position (int): Index of the next frame to grab.
+
+    """
+
+    def __init__(self, fps, realtime=True, loop=False):
+        self.fps = float(fps) if fps and fps > 0 else 10.0
+        self.realtime = realtime
+        self.loop = loop
+        self.position = 0
+        self.current = None
+        self.started_at = None
+        self.opened = True
+
+    @property
+    def frame_count(self):
+        raise NotImplementedError
+
+    def load(self, index):
+        """Frame at `index` as a BGR array, None when it cannot be read."""
+        raise NotImplementedError
+
+    def isOpened(self):
+        return self.opened
+
+    def grab(self):
+        if not self.opened:
+            return False
+        if self.position >= self.frame_count:
+            if not self.loop or self.frame_count == 0:
+                return False
+            self.position = 0
+            self.started_at = None
+
+        if self.realtime:
+            if self.started_at is None:
+                self.started_at = time.monotonic()
+            delay = self.started_at + self.position / self.fps - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+        self.current = self.load(self.position)
+        self.position += 1
+        return self.current is not None
+
+    def retrieve(self, image=None):
+        if self.current is None:
+            return False, None
+        if image is not None and image.shape == self.current.shape:
+            np.copyto(image, self.current)
+            return True, image
+        return True, self.current.copy()
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FPS:
+            return self.fps
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            return float(self.position)
+        if prop == cv2.CAP_PROP_POS_MSEC:
+            # Media time of the grabbed frame, what the driver timestamp of a camera stands for
+            return max(self.position - 1, 0) * 1000.0 / self.fps
+        if prop == cv2.CAP_PROP_FRAME_COUNT:
+            return float(self.frame_count)
+        if self.current is not None and prop in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT):
+            return float(self.current.shape[1] if prop == cv2.CAP_PROP_FRAME_WIDTH else self.current.shape[0])
+        return -1.0
+
+    def set(self, prop, value):
+        if prop == cv2.CAP_PROP_FPS and value > 0:
+            self.fps = float(value)
+            return True
+        if prop == cv2.CAP_PROP_POS_FRAMES:
+            self.position = int(value)
+            self.started_at = None
+            return True
+        # Size, pixel format and buffer depth are properties of a camera, a recording keeps its own
+        return False
+
+    def release(self):
+        self.opened = False
+        self.current = None
+
+
+class VideoFileSource(RecordedSource):
+    """Frames of a recorded video file, paced at the frame rate stored in the file."""
+
+    def __init__(self, path, realtime=True, loop=False, fps=None):
+        self.path = str(path)
+        self.vcap = cv2.VideoCapture(self.path)
+        super().__init__(fps or self.vcap.get(cv2.CAP_PROP_FPS), realtime, loop)
+        self.opened = self.vcap.isOpened()
+        self.count = int(self.vcap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.decoded = 0
+
+    @property
+    def frame_count(self):
+        # Some containers report no frame count, the file end decides then
+        return self.count if self.count > 0 else self.position + 1
+
+    def load(self, index):
+        if index != self.decoded:
+            self.vcap.set(cv2.CAP_PROP_POS_FRAMES, index)
+        grabbed, frame = self.vcap.read()
+        self.decoded = index + 1
+        if not grabbed:
+            self.count = index
+            return None
+        return frame
+
+    def release(self):
+        super().release()
+        self.vcap.release()
+
+
+class ImageDirectorySource(RecordedSource):
+    """Still images of a directory in file name order, played back at `fps`."""
+
+    def __init__(self, path, fps=10, realtime=True, loop=False):
+        super().__init__(fps, realtime, loop)
+        self.path = pathlib.Path(path)
+        self.paths = sorted(path for path in self.path.iterdir() if path.suffix.lower() in IMAGE_SUFFIXES)
+        self.opened = bool(self.paths)
+
+    @property
+    def frame_count(self):
+        return len(self.paths)
+
+    def load(self, index):
+        frame = cv2.imread(str(self.paths[index]))
+        if frame is None:
+            logger.warn(f"Could not read {self.paths[index]}")
+        return frame
+
+
+class SyntheticSource(RecordedSource):
+    """
+    Generated frames for measurements without a camera or recording.
+
+    Every frame is a fixed noise background with a bright block moving across it and the frame number printed
+    on it. The output only depends on `seed` and the frame index, so two runs see the same frames.
+    """
+
+    def __init__(self, shape=(480, 640, 3), fps=30, frames=None, seed=0, realtime=True, loop=False):
+        super().__init__(fps, realtime, loop)
+        self.shape = tuple(shape)
+        self.frames = frames
+        rng = np.random.default_rng(seed)
+        self.background = rng.integers(0, 64, size=self.shape, dtype=np.uint8)
+
+    @property
+    def frame_count(self):
+        return self.frames if self.frames is not None else self.position + 1
+
+    def load(self, index):
+        frame = self.background.copy()
+        height, width = self.shape[:2]
+        size = max(min(height, width) // 6, 8)
+        x = (index * 8) % max(width - size, 1)
+        y = (height - size) // 2
+        frame[y : y + size, x : x + size] = 255
+        cv2.putText(frame, str(index), (10, height - 10), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 255), 2, cv2.LINE_AA)
+        return frame
+
+
+def parse_synthetic(spec):
+    """Shape and fps of a "synthetic[:WIDTHxHEIGHT[@FPS]]" source, e.g. "synthetic:640x480@30"."""
+    shape, fps = (480, 640, 3), 30.0
+    _, _, options = spec.partition(":")
+    if options:
+        size, _, rate = options.partition("@")
+        if size:
+            width, height = (int(value) for value in size.lower().split("x"))
+            shape = (height, width, 3)
+        if rate:
+            fps = float(rate)
+    return shape, fps
+
+
+def open_frame_source(source, playback="realtime", loop=False, fps=None):
+    """
+    Open a camera, video file, image directory or synthetic generator.
+
+    Args:
+        source (int or str): Camera index, stream URL, path of a video file or image directory, or
+            "synthetic[:WIDTHxHEIGHT[@FPS]]".
+        playback (str, optional): "realtime" or "fast", see the module documentation. Cameras always run live.
+        loop (bool, optional): Replay recorded sources from the start when they end.
+        fps (float, optional): Frame rate of image directories, overrides the rate of video files.
+
+    Returns:
+        cv2.VideoCapture or RecordedSource: Opened source with the `cv2.VideoCapture` interface.
+    """
+    if playback not in PLAYBACK_MODES:
+        raise ValueError(f"Unknown playback mode {playback!r}, expected one of {PLAYBACK_MODES}")
+    realtime = playback == "realtime"
+
+    if isinstance(source, str) and source.isdigit():
+        source = int(source)
+    if isinstance(source, int):
+        if platform.system() == "Windows":
+            return cv2.VideoCapture(source, cv2.CAP_DSHOW)
+        return cv2.VideoCapture(source)
+
+    if source.startswith("synthetic"):
+        shape, synthetic_fps = parse_synthetic(source)
+        return SyntheticSource(shape, fps or synthetic_fps, realtime=realtime, loop=loop)
+
+    path = pathlib.Path(source)
+    if path.is_dir():
+        return ImageDirectorySource(path, fps or 10, realtime, loop)
+    if path.is_file():
+        return VideoFileSource(path, realtime, loop, fps)
+
+    # Stream URLs and device paths are left to OpenCV
+    return cv2.VideoCapture(source)
+
+
+def is_recorded(vcap):
+    """True for the replayed sources, which have no driver queue and no capture settings to negotiate."""
+    return isinstance(vcap, RecordedSource)
@@ -0,0 +1,442 @@
+"""Passenger face gallery of ICMS Application
+
+Holds every passenger embedding of the manifest in one contiguous matrix so a whole frame of faces can be verified
+with a single batched distance computation instead of a Python loop over the database. Large galleries, such as
+the whole manifest of a gate, are searched through a coarse k-means partition with exact re-ranking.
+
+Author: Ravi Shanker Singh
+"""
+
+import threading
+
+import numpy as np
+
+from log import Logger
+
+logger = Logger(module="Face Gallery")
+
+EMBEDDING_SIZE = 128
+UNKNOWN_PASSENGER = ("Unknown", "Un")
+
+
+class CoarseIndex:
+    """
+    Approximate nearest neighbour index, a k-means partition of the gallery rows with exact re-ranking.
+
+    Attributes:
+        n_lists (int): Number of partitions, defaults to the square root of the gallery size.
+        n_probe (int): Number of closest partitions searched per query.
+
+    Methods:
+        build(embeddings): Partition the gallery rows with k-means.
+        add(row, embedding): Put a gallery row into its closest partition.
+        remove(row): Take a gallery row out of its partition.
+        relabel(old_row, new_row): Follow a gallery row that moved to another position.
+        candidates(face_embedding): Gallery rows of the partitions closest to a face.
+
+    """
+
+    def __init__(self, n_lists=None, n_probe=4, iterations=10, seed=0):
+        """
+        Initialize the CoarseIndex.
+
+        Args:
+            n_lists (int, optional): Number of partitions, defaults to the square root of the gallery size.
+            n_probe (int, optional): Number of closest partitions searched per query.
+            iterations (int, optional): k-means iterations of `build`.
+            seed (int, optional): Seed of the k-means initialisation.
+
+        """
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+        self.lists = []
+        self.list_arrays = {}
+        self.row_list = {}
+
+    def __len__(self):
+        return len(self.row_list)
+
+    @staticmethod
+    def _nearest(embeddings, centroids, chunk=8192):
+        """Index of the closest centroid of every embedding, computed in chunks to bound memory."""
+        centroid_norms = np.einsum("ij,ij->i", centroids, centroids)
+        nearest = np.empty(len(embeddings), dtype=np.int64)
+        for start in range(0, len(embeddings), chunk):
+            block = embeddings[start:start + chunk]
+            nearest[start:start + chunk] = np.argmin(centroid_norms[None, :] - 2.0 * (block @ centroids.T), axis=1)
+        return nearest
+
+    def build(self, embeddings):
+        """
+        Partition the gallery rows with k-means.
+
+        Args:
+            embeddings (np.ndarray): Gallery embeddings, row i is gallery row i.
+
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        n_lists = min(self.n_lists or max(int(np.sqrt(len(embeddings))), 1), len(embeddings))
+        rng = np.random.default_rng(self.seed)
+        centroids = embeddings[rng.choice(len(embeddings), n_lists, replace=False)].copy()
+
+        for _ in range(self.iterations):
+            nearest = self._nearest(embeddings, centroids)
+            counts = np.bincount(nearest, minlength=n_lists)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, nearest, embeddings)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+
+        nearest = self._nearest(embeddings, centroids)
+        self.centroids = centroids
+        self.lists = [list(np.flatnonzero(nearest == i)) for i in range(n_lists)]
+        self.list_arrays = {}
+        self.row_list = {int(row): int(list_id) for row, list_id in enumerate(nearest)}
+
+    def add(self, row, embedding):
+        """Put a gallery row into its closest partition."""
+        list_id = int(self._nearest(np.asarray(embedding, dtype=np.float32).reshape(1, -1), self.centroids)[0])
+        self.lists[list_id].append(row)
+        self.list_arrays.pop(list_id, None)
+        self.row_list[row] = list_id
+
+    def remove(self, row):
+        """Take a gallery row out of its partition."""
+        list_id = self.row_list.pop(row, None)
+        if list_id is not None:
+            self.lists[list_id].remove(row)
+            self.list_arrays.pop(list_id, None)
+
+    def relabel(self, old_row, new_row):
+        """Follow a gallery row that moved from `old_row` to `new_row`."""
+        list_id = self.row_list.pop(old_row, None)
+        if list_id is not None:
+            members = self.lists[list_id]
+            members[members.index(old_row)] = new_row
+            self.list_arrays.pop(list_id, None)
+            self.row_list[new_row] = list_id
+
+    def candidates(self, face_embedding):
+        """
+        Gallery rows of the partitions closest to a face.
+
+        Args:
+            face_embedding (np.ndarray): Face embedding of shape (128,).
+
+        Returns:
+            np.ndarray: Candidate gallery rows for exact re-ranking.
+        """
+        distances = np.linalg.norm(self.centroids - face_embedding, axis=1)
+        probe = np.argpartition(distances, self.n_probe - 1)[:self.n_probe] if len(distances) > self.n_probe else range(len(distances))
+        return np.concatenate([self._list_array(int(list_id)) for list_id in probe])
+
+    def _list_array(self, list_id):
+        """Rows of a partition as an array, cached until the partition changes."""
+        rows = self.list_arrays.get(list_id)
+        if rows is None:
+            rows = self.list_arrays[list_id] = np.array(self.lists[list_id], dtype=np.int64)
+        return rows
+
+
+class FaceGallery:
+    """
+    Contiguous float32 store of passenger embeddings with parallel name and seat arrays.
+
+    Rows are kept in preallocated buffers that grow by doubling, and removal moves the last row into the freed
+    position, so passengers can be added and removed while the dashboard runs without copying the gallery.
+    Passengers are identified by name, as in the manifest, so a gallery holds one row per name.
+
+    Attributes:
+        names (np.ndarray): Passenger names, one per gallery row.
+        seats (np.ndarray): Assigned seat of every passenger, one per gallery row.
+        embeddings (np.ndarray): Matrix of shape (passengers, 128) with the face embeddings.
+        ann_min_size (int): Gallery size from which queries go through the `CoarseIndex`.
+
+    Methods:
+        from_passenger_data(passengers): Build the gallery from the output of `get_passenger_data`.
+        add(name, seat, embedding, replace): Add a passenger, or replace the seat and embedding of a known passenger.
+        remove(name): Remove a passenger.
+        distances(face_embeddings): Euclidean distance of every face to every passenger.
+        match(face_embeddings, tolerance, seat_hints, early_accept): Best passenger for every face as (name, seat, distance).
+
+    """
+
+    def __init__(self, names=(), seats=(), embeddings=None, ann_min_size=10000):
+        """
+        Initialize the FaceGallery.
+
+        Args:
+            names (sequence): Passenger names.
+            seats (sequence): Assigned seat of every passenger.
+            embeddings (array-like, optional): Face embeddings, one row per passenger.
+            ann_min_size (int, optional): Gallery size from which queries use the approximate index.
+
+        """
+        self.lock = threading.RLock()
+        self.ann_min_size = ann_min_size
+        self.index = None
+        self.index_size = 0
+        self.size = 0
+        self._names = np.empty(0, dtype=object)
+        self._seats = np.empty(0, dtype=object)
+        self._embeddings = np.empty((0, EMBEDDING_SIZE), dtype=np.float32)
+        self._squared_norms = np.empty(0, dtype=np.float32)
+        self.rows_by_name = {}
+        self.seat_rows = {}
+        # Distance of a row to its closest other row, computed on demand and dropped whenever the gallery changes
+        self.separations = {}
+
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, EMBEDDING_SIZE)
+            for name, seat, embedding in zip(names, seats, embeddings):
+                self.add(name, seat, embedding, replace=False)
+
+    @classmethod
+    def from_passenger_data(cls, passengers, ann_min_size=10000):
+        """
+        Build the gallery from passenger records.
+
+        Args:
+            passengers (list): Output of `database.get_passenger_data`.
+            ann_min_size (int, optional): Gallery size from which queries use the approximate index.
+
+        Returns:
+            FaceGallery: Gallery with one row per passenger.
+
+        Raises:
+            ValueError: When two passengers have the same name.
+
+        """
+        gallery = cls(ann_min_size=ann_min_size)
+        for passenger in passengers:
+            gallery.add(*passenger["passenger_dataset"], replace=False)
+        return gallery
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def names(self):
+        return self._names[:self.size]
+
+    @property
+    def seats(self):
+        return self._seats[:self.size]
+
+    @property
+    def embeddings(self):
+        return self._embeddings[:self.size]
+
+    @property
+    def squared_norms(self):
+        return self._squared_norms[:self.size]
+
+    def _grow(self):
+        """Double the capacity of the row buffers."""
+        capacity = max(2 * len(self._names), 16)
+        for attr, shape, dtype in (
+            ("_names", (capacity,), object),
+            ("_seats", (capacity,), object),
+            ("_embeddings", (capacity, EMBEDDING_SIZE), np.float32),
+            ("_squared_norms", (capacity,), np.float32),
+        ):
+            buffer = np.empty(shape, dtype=dtype)
+            buffer[:self.size] = getattr(self, attr)[:self.size]
+            setattr(self, attr, buffer)
+
+    def _set_row(self, row, name, seat, embedding):
+        self._names[row] = name
+        self._seats[row] = seat
+        self._embeddings[row] = embedding
+        self._squared_norms[row] = np.dot(self._embeddings[row], self._embeddings[row])
+        self.rows_by_name[name] = row
+        self.seat_rows.setdefault(seat, set()).add(row)
+
+    def _clear_seat(self, row):
+        rows = self.seat_rows.get(self._seats[row])
+        if rows is not None:
+            rows.discard(row)
+            if not rows:
+                del self.seat_rows[self._seats[row]]
+
+    def add(self, name, seat, embedding, replace=True):
+        """
+        Add a passenger, or replace the seat and embedding of a passenger already in the gallery.
+
+        Args:
+            name (str): Passenger name.
+            seat (str): Assigned seat.
+            embedding (array-like): Face embedding of the passenger.
+            replace (bool, optional): Update a passenger of the same name, raise when False.
+
+        Raises:
+            ValueError: When `replace` is False and a passenger of the same name is in the gallery.
+
+        """
+        with self.lock:
+            row = self.rows_by_name.get(name)
+            if row is not None and not replace:
+                raise ValueError(f"Passenger {name} is already in the gallery, passengers are identified by name")
+            self.separations.clear()
+            if row is not None:
+                self._clear_seat(row)
+                if self.index is not None:
+                    self.index.remove(row)
+            else:
+                if self.size == len(self._names):
+                    self._grow()
+                row = self.size
+                self.size += 1
+
+            self._set_row(row, name, seat, np.asarray(embedding, dtype=np.float32).reshape(EMBEDDING_SIZE))
+            if self.index is not None:
+                self.index.add(row, self._embeddings[row])
+
+    def remove(self, name):
+        """
+        Remove a passenger from the gallery.
+
+        Args:
+            name (str): Passenger name.
+
+        Returns:
+            bool: True when the passenger was in the gallery.
+        """
+        with self.lock:
+            row = self.rows_by_name.pop(name, None)
+            if row is None:
+                return False
+            self.separations.clear()
+
+            self._clear_seat(row)
+            if self.index is not None:
+                self.index.remove(row)
+
+            last = self.size - 1
+            if row != last:
+                # Keep the rows contiguous by moving the last passenger into the freed row
+                self._clear_seat(last)
+                self._set_row(row, self._names[last], self._seats[last], self._embeddings[last])
+                if self.index is not None:
+                    self.index.relabel(last, row)
+            self._names[last] = self._seats[last] = None
+            self.size -= 1
+            return True
+
+    def _maintain_index(self):
+        """Build the approximate index once the gallery is large enough, rebuild it after it doubled."""
+        if self.size < self.ann_min_size:
+            self.index = None
+            return
+        if self.index is None or self.size >= 2 * self.index_size:
+            started = self.index is None
+            self.index = CoarseIndex()
+            self.index.build(self.embeddings)
+            self.index_size = self.size
+            logger.info(f"{'Built' if started else 'Rebuilt'} approximate index over {self.size} passengers")
+
+    def distances(self, face_embeddings):
+        """
+        Compute the Euclidean distance between every face and every passenger.
+
+        Args:
+            face_embeddings (array-like): One embedding or a batch of embeddings of shape (faces, 128).
+
+        Returns:
+            np.ndarray: Distance matrix of shape (faces, passengers).
+
+        """
+        faces = np.asarray(face_embeddings, dtype=np.float32).reshape(-1, EMBEDDING_SIZE)
+        with self.lock:
+            squared = np.einsum("ij,ij->i", faces, faces)[:, None] + self.squared_norms[None, :] - 2.0 * (faces @ self.embeddings.T)
+        return np.sqrt(np.maximum(squared, 0.0))
+
+    def separation(self, row):
+        """Distance of a gallery row to its closest other row, infinite for a gallery of one."""
+        separation = self.separations.get(row)
+        if separation is None:
+            distances = self.distances(self._embeddings[row])[0]
+            distances[row] = np.inf
+            separation = self.separations[row] = float(distances.min())
+        return separation
+
+    def nearest(self, face_embeddings):
+        """
+        Closest gallery row of every face, through the approximate index for large galleries.
+
+        Args:
+            face_embeddings (array-like): Batch of embeddings of shape (faces, 128).
+
+        Returns:
+            tuple: Arrays with the closest row and its distance for every face.
+        """
+        faces = np.asarray(face_embeddings, dtype=np.float32).reshape(-1, EMBEDDING_SIZE)
+        with self.lock:
+            self._maintain_index()
+            if self.index is None:
+                distances = self.distances(faces)
+                best = np.argmin(distances, axis=1)
+                return best, distances[np.arange(len(faces)), best]
+
+            best = np.empty(len(faces), dtype=np.int64)
+            best_distances = np.empty(len(faces), dtype=np.float32)
+            for i, face in enumerate(faces):
+                rows = self.index.candidates(face)
+                if not len(rows):
+                    rows = np.arange(self.size)
+                distances = np.linalg.norm(self._embeddings[rows] - face, axis=1)
+                j = int(np.argmin(distances))
+                best[i], best_distances[i] = rows[j], distances[j]
+            return best, best_distances
+
+    def match(self, face_embeddings, tolerance=0.55, seat_hints=None, early_accept=None):
+        """
+        Find the closest passenger for every face.
+
+        When a seat hint is given for a face, the passenger assigned to that seat is compared first and accepted
+        straight away if closer than `early_accept`, `tolerance` and half the distance of that passenger to their
+        closest other passenger. By the triangle inequality every other passenger is then further from the face,
+        so the shortcut returns what the exact search would. Every other face goes through the full gallery
+        search, so results are the same as without hints.
+
+        Args:
+            face_embeddings (array-like): One embedding or a batch of embeddings of shape (faces, 128).
+            tolerance (float, optional): Maximum distance for a face to be accepted as a passenger.
+            seat_hints (list, optional): Seat each face was found on, one per face.
+            early_accept (float, optional): Distance under which the assigned passenger of the seat is accepted.
+
+        Returns:
+            list: One (passenger_name, passenger_seat, distance) tuple per face, ("Unknown", "Un", distance) when
+                no passenger is within tolerance.
+
+        """
+        faces = np.asarray(face_embeddings, dtype=np.float32).reshape(-1, EMBEDDING_SIZE)
+        with self.lock:
+            if not len(self):
+                return [(*UNKNOWN_PASSENGER, float("inf"))] * len(faces)
+
+            results = [None] * len(faces)
+            if seat_hints is not None and early_accept is not None:
+                for i, seat in enumerate(seat_hints):
+                    rows = list(self.seat_rows.get(seat, ()))
+                    if not rows:
+                        continue
+                    distances = np.linalg.norm(self._embeddings[rows] - faces[i], axis=1)
+                    best = int(np.argmin(distances))
+                    row = rows[best]
+                    if distances[best] < min(early_accept, tolerance) and distances[best] < self.separation(row) / 2:
+                        results[i] = (self._names[row], self._seats[row], float(distances[best]))
+
+            pending = [i for i, result in enumerate(results) if result is None]
+            if pending:
+                best, best_distances = self.nearest(faces[pending])
+                for i, idx, distance in zip(pending, best, best_distances):
+                    distance = float(distance)
+                    if distance > tolerance:
+                        results[i] = (*UNKNOWN_PASSENGER, distance)
+                    else:
+                        results[i] = (self._names[idx], self._seats[idx], distance)
+            return results
@@ -1,9 +1,10 @@
+import itertools
 import json
 import pathlib
 
 import cv2
 
-from helper import seats_coordinates
+from cabin import CabinLayout
 from log import Logger
 
 # Set up logging
@@ -13,7 +14,7 @@ current = pathlib.Path(__file__).parent.resolve()
 
 with open(current.joinpath("config.json")) as data_file:
     data = json.load(data_file)
-    seat_coordinates = seats_coordinates(data["SEAT_COORDINATES"], data["FRAME_SHAPE"])
+    seat_coordinates = CabinLayout.from_config(data).seat_coordinates
 
 
 class RectangleDrawer:
@@ -40,7 +41,7 @@ class RectangleDrawer:
 
     def draw_existing_rectangles(self, rectangles):
         colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]  # Red, Green, Blue, Yellow
-        for (x1, y1, x2, y2, name), color in zip(rectangles, colors):
+        for (x1, y1, x2, y2, name), color in zip(rectangles, itertools.cycle(colors)):
             cv2.rectangle(self.img, (x1, y2), (x2, y1), color, 5)
             cv2.putText(self.img, f"Seat {name}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2, cv2.LINE_AA)
 
@@ -0,0 +1,212 @@
+"""Headless monitor of ICMS Application
+
+Runs the cabin monitoring pipeline without Tk, the camera preview or voice announcements and streams the seat
+decisions as newline-delimited JSON, one line per published decision set:
+
+    {"type": "seats", "time": 1718000000.12, "frame": 42, "seats": {"A1": {"passenger": "Ravi", "status": "Ready", "color": "green"}, ...}}
+
+and a final {"type": "stats", ...} line with the scheduler statistics and the CPU and memory used. The output is
+"-" for stdout, a file path (appended to) or "unix:PATH" for a local stream socket another process listens on.
+When the decisions go to stdout, log lines go to stderr.
+
+Author: Ravi Shanker Singh
+"""
+
+import json
+import signal
+import socket
+import sys
+import time
+
+from cabin_monitor import CONFIG, CabinMonitor, resource_usage
+from log import Logger
+from seat_voting import SeatVoter
+
+logger = Logger(module="Headless Monitor")
+
+
+class DecisionWriter:
+    """
+    Newline-delimited JSON writer to stdout, a file or a Unix socket.
+
+    A socket that cannot be reached drops lines and is reconnected at most once per `retry_interval`. The socket
+    is non-blocking so a slow reader never stalls the analysis thread: lines it does not take yet wait in a
+    backlog of at most `max_backlog` bytes, and whole lines are dropped while the backlog is full.
+
+    Attributes:
+        output (str): "-", a file path or "unix:PATH".
+        written (int): Lines written, or queued in the socket backlog.
+        dropped (int): Lines dropped while the socket was unreachable, its backlog full or the connection lost.
+
+    Methods:
+        write(record): Write one record as a JSON line.
+        close(): Close the file or socket.
+
+    """
+
+    def __init__(self, output="-", retry_interval=1.0, max_backlog=1 << 20, close_timeout=1.0):
+        """
+        Initialize the DecisionWriter.
+
+        Args:
+            output (str, optional): "-" for stdout, a file path or "unix:PATH".
+            retry_interval (float, optional): Seconds between two attempts to reach the socket.
+            max_backlog (int, optional): Bytes a slow socket reader may fall behind before lines are dropped.
+            close_timeout (float, optional): Seconds `close` waits for the reader to take the backlog.
+
+        """
+        self.output = output
+        self.retry_interval = retry_interval
+        self.max_backlog = max_backlog
+        self.close_timeout = close_timeout
+        self.stream = None
+        self.owns_stream = False
+        self.sock = None
+        self.backlog = bytearray()
+        self.backlog_full = False
+        self.unreachable = False
+        self.retry_at = 0.0
+        self.written = 0
+        self.dropped = 0
+        if output == "-":
+            self.stream = sys.stdout
+        elif output.startswith("unix:"):
+            self.connect()
+        else:
+            self.stream = open(output, "a", encoding="utf-8")
+            self.owns_stream = True
+
+    def connect(self):
+        """Connect to the Unix socket, False when nobody listens on it yet."""
+        self.retry_at = time.monotonic() + self.retry_interval
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.output[len("unix:") :])
+        except OSError as e:
+            sock.close()
+            if not self.unreachable:
+                logger.warn(f"Cannot reach {self.output}, seat decisions are dropped until it is: {e}")
+                self.unreachable = True
+            return False
+        if self.unreachable:
+            logger.info(f"Reached {self.output} after dropping {self.dropped} lines")
+            self.unreachable = False
+        sock.setblocking(False)
+        self.sock = sock
+        return True
+
+    def disconnect(self, error):
+        """Drop a lost connection with the lines still waiting for it."""
+        logger.warn(f"Lost {self.output}: {error}")
+        self.sock.close()
+        self.sock = None
+        self.dropped += self.backlog.count(b"\n")
+        self.backlog.clear()
+
+    def flush(self):
+        """Send as much of the backlog as the reader takes without blocking."""
+        try:
+            while self.backlog:
+                del self.backlog[: self.sock.send(self.backlog)]
+        except BlockingIOError:
+            pass
+        except OSError as e:
+            self.disconnect(e)
+
+    def write(self, record):
+        """Write one record as a JSON line."""
+        line = json.dumps(record, separators=(",", ":")) + "\n"
+        if self.stream is not None:
+            self.stream.write(line)
+            self.stream.flush()
+            self.written += 1
+            return
+
+        if self.sock is None and (time.monotonic() < self.retry_at or not self.connect()):
+            self.dropped += 1
+            return
+        data = line.encode()
+        if len(self.backlog) + len(data) > self.max_backlog:
+            if not self.backlog_full:
+                logger.warn(f"{self.output} is not keeping up, seat decisions are dropped until it does")
+                self.backlog_full = True
+            self.dropped += 1
+        else:
+            self.backlog_full = False
+            self.backlog += data
+            self.written += 1
+        self.flush()
+
+    def close(self):
+        if self.sock is not None:
+            # Give the reader a moment to take the last lines, the stats line among them
+            try:
+                self.sock.settimeout(self.close_timeout)
+                self.sock.sendall(self.backlog)
+            except OSError as e:
+                logger.warn(f"Closed {self.output} before it took the last lines: {e}")
+            self.sock.close()
+        elif self.owns_stream:
+            self.stream.close()
+
+
+class HeadlessMonitor(CabinMonitor):
+    """
+    Cabin monitor writing its seat decisions to a `DecisionWriter`.
+
+    Analysis runs on the calling thread until the stream ends, SIGINT or SIGTERM.
+
+    Methods:
+        run(): Load the manifest, start capture and analyse until stopped.
+
+    """
+
+    def __init__(self, writer):
+        """
+        Initialize the HeadlessMonitor.
+
+        Args:
+            writer (DecisionWriter): Destination of the seat decisions.
+
+        """
+        super().__init__(SeatVoter(CONFIG.cabin, CONFIG.vote_window, CONFIG.distance_weighted_vote, CONFIG.tolerance))
+        self.writer = writer
+
+    def publish_decisions(self, decisions):
+        """Write the seat decisions of the current frame as one JSON line."""
+        labels = self.voter.labels
+        seats = {}
+        for seat_name, code in zip(self.voter.seat_names, decisions):
+            name, status, color = labels[code]
+            seats[seat_name] = {"passenger": name, "status": status, "color": color}
+        self.writer.write({"type": "seats", "time": round(time.time(), 3), "frame": self.scheduler.last_seq, "seats": seats})
+
+    def run(self):
+        """Load the manifest, start capture and analyse until the stream ends or the process is told to stop."""
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.vid.stop() if self.vid else None)
+        self.start_manifest()
+        self.start_webcam()
+        try:
+            self.run_analysis()
+        except KeyboardInterrupt:
+            logger.info("Interrupted, stopping")
+        finally:
+            self.stop()
+            scheduler = self.scheduler.stats if self.scheduler is not None else {}
+            self.writer.write({"type": "stats", "time": round(time.time(), 3), "scheduler": scheduler, **resource_usage()})
+            self.writer.close()
+
+
+def main(output=None):
+    """
+    Run the headless monitor.
+
+    Args:
+        output (str, optional): "-", a file path or "unix:PATH", defaults to HEADLESS.OUTPUT of config.json.
+
+    """
+    writer = DecisionWriter(output or CONFIG.headless_output)
+    if writer.stream is sys.stdout:
+        # Log lines and timing prints must not mix into the decision stream
+        sys.stdout = sys.stderr
+    HeadlessMonitor(writer).run()
@@ -6,20 +6,19 @@ Author: Ravi Shanker Singh
 """
 
 
+import itertools
 import pathlib
 import time
 import tkinter as tk
-from collections import Counter, defaultdict
 from io import BytesIO
 
 import cv2
 import numpy as np
-from face_recognition import face_encodings, face_locations
 from PIL import Image, ImageTk
-from joblib import Parallel, delayed
 import pygame
+from encoding_cache import content_hash
 from log import Logger
-from seatbelt import seatbelt_status
+from seat_voting import SeatVoter
 import pyttsx3
 
 
@@ -29,6 +28,9 @@ SEAT_BEAT = False
 
 logger = Logger(module="Helper Module")
 
+# Size (width, height) of the passenger image shown next to every seat
+THUMBNAIL_SIZE = (317, 200)
+
 mp3_files = {
     'A1': current.joinpath("voice_message", "A1.mp3"),
     'A2': current.joinpath("voice_message", "A2.mp3"),
@@ -72,37 +74,83 @@ if SEAT_BEAT:
 
 
 class Seat:
-    def __init__(self, root, label, image_path, x_rel, y_rel):
+    def __init__(self, root, label, image_path, x_rel, y_rel, scale=1.0):
         self.seat_name = label
-        self.label = tk.Label(root, text=label, font=("Arial", 18), bg="#007D96", fg="white", width=5, height=3)
+        self.label = tk.Label(root, text=label, font=("Arial", max(int(18 * scale), 6)), bg="#007D96", fg="white", width=5, height=3)
         self.label.place(relx=x_rel, rely=y_rel, anchor="center")
         self.image_label = tk.Label(root)
-        self.image_label.place(relx=x_rel + 0.06, rely=y_rel + 0.17, anchor="center")
+        self.image_label.place(relx=x_rel + 0.06 * scale, rely=y_rel + 0.17 * scale, anchor="center")
         image = Image.open(image_path)
+        if scale < 1:
+            image = image.resize((max(int(image.width * scale), 1), max(int(image.height * scale), 1)))
         tk_image = ImageTk.PhotoImage(image)
 
         self.default_image = tk_image
-        self.image_label.config(height=200, width=317, image=self.default_image)
+        thumbnail_size = scaled_thumbnail_size(scale)
+        self.image_label.config(height=thumbnail_size[1], width=thumbnail_size[0], image=self.default_image)
 
         self.rectangle_color = "white"
-        self.rectangle_width = 200
-        self.rectangle_height = 80
+        self.rectangle_width = max(int(200 * scale), 1)
+        self.rectangle_height = max(int(80 * scale), 1)
         self.rectangle_text = "Empty"
 
         self.rectangle_canvas_status = tk.Canvas(root, width=self.rectangle_width, height=self.rectangle_height, bg=self.rectangle_color)
-        self.rectangle_canvas_status.place(relx=x_rel + 0.09, rely=y_rel, anchor="center")
+        self.rectangle_canvas_status.place(relx=x_rel + 0.09 * scale, rely=y_rel, anchor="center")
         self.status_text = self.rectangle_canvas_status.create_text(
             self.rectangle_width / 2,
             self.rectangle_height / 2,
             text=self.rectangle_text,
             fill="black",
-            font=("Arial", 12, "bold"),
+            font=("Arial", max(int(12 * scale), 6), "bold"),
         )
 
+        self.shown_image = self.default_image
+
     def change_rectangle_color(self, new_color, status):
-        self.rectangle_canvas_status.config(bg=new_color)
-        self.rectangle_text = status
-        self.rectangle_canvas_status.itemconfig(self.status_text, text=status)
+        """Show a status, touches Tk only for what changed and returns whether anything did."""
+        changed = False
+        if new_color != self.rectangle_color:
+            self.rectangle_canvas_status.config(bg=new_color)
+            self.rectangle_color = new_color
+            changed = True
+        if status != self.rectangle_text:
+            self.rectangle_canvas_status.itemconfig(self.status_text, text=status)
+            self.rectangle_text = status
+            changed = True
+        return changed
+
+    def show_image(self, tk_image):
+        """Show a passenger thumbnail or the default image, touches Tk only when it is a different image."""
+        if tk_image is self.shown_image:
+            return False
+        self.image_label.config(image=tk_image)
+        self.image_label.image = tk_image
+        self.shown_image = tk_image
+        return True
+
+
+def scaled_thumbnail_size(scale=1.0):
+    """Thumbnail size of seat widgets drawn at `scale`, at least one pixel each way."""
+    return max(int(THUMBNAIL_SIZE[0] * scale), 1), max(int(THUMBNAIL_SIZE[1] * scale), 1)
+
+
+def decode_thumbnail(image_data, size=THUMBNAIL_SIZE):
+    """
+    Decode a passenger image and scale it to fit the seat image label.
+
+    Runs on any thread, only turning the result into an `ImageTk.PhotoImage` needs the Tk thread.
+
+    Args:
+        image_data (bytes): Encoded passenger image.
+        size (tuple, optional): Largest (width, height) of the thumbnail.
+
+    Returns:
+        PIL.Image.Image: Decoded and scaled image.
+    """
+    image = Image.open(BytesIO(image_data))
+    image.thumbnail(size)
+    image.load()
+    return image
 
 
 def seats_coordinates(data, frame_shape):
@@ -111,55 +159,51 @@ def seats_coordinates(data, frame_shape):
 
 
 # fmt: off
-class NotificationController:
+class NotificationController(SeatVoter):
     """
     A class for managing notifications related to seat assignments and belt statuses.
 
+    Seat decisions are voted by `SeatVoter`, this class shows them and the passengers on the seat widgets.
+
     Attributes:
-        ALLOWED_SEAT_NAMES (list): List of allowed seat names.
+        seats (dict): Seat names as keys and Seat widgets as values.
+        seat_info (dict): Passenger assigned to every seat.
+        dataset (dict): Passenger records by passenger name.
 
     Methods:
-        __init__(self, root, dataset): Initialize the NotificationController.
-        belt_read(self): Read the status of seat belts.
+        __init__(self, root, dataset, cabin): Initialize the NotificationController.
         initialize_seats(self): Initialize seat objects.
         initialize_seat_info(self): Initialize seat information.
-        update_seat_info(self, frame_results): Update seat information based on frame results.
-        analyze_frames(self, data): Analyze frame results.
-        analysis(self, frame_results): Perform analysis on frame results.
+        assign_passenger(self, passenger): Show the thumbnail of a passenger on the assigned seat.
+        add_passenger(self, passenger): Add a passenger published by the manifest loader.
+        remove_passenger(self, passenger_name): Remove a passenger and clear their seat.
+        thumbnail_for(self, image_data, decoded_image=None): PhotoImage of a passenger image, cached by content.
         update_single_seat(self, update_seat, image_data=None, rectangle_color="white", status="Empty"): Update a single seat.
 
     """
-    ALLOWED_SEAT_NAMES = ["A1", "A2", "B1", "B2"]
-    UNAUTHORIZED_NAMES = {"Unknown", "Un"}
-
-    def __init__(self, root, dataset):
+    def __init__(self, root, dataset, cabin, window=5, distance_weighted=False, tolerance=0.55):
         """
         Initialize the NotificationController.
 
         Args:
             root (object): The root object for the GUI.
             dataset (list): List of passenger data.
+            cabin (CabinLayout): Seat map of the cabin, it names the seats and places their widgets.
+            window (int, optional): Number of recent frames every seat decision is voted over.
+            distance_weighted (bool, optional): Let confident face matches count up to twice in the vote.
+            tolerance (float, optional): Match tolerance the vote weight of a face match is measured against.
 
         """
-        self.dataset = dataset
+        super().__init__(cabin, window, distance_weighted, tolerance)
+        self.dataset = {passenger["passenger_name"]: passenger for passenger in dataset}
         self.root = root
+        self.seat_positions, self.widget_scale = cabin.ui_positions()
+        self.thumbnail_size = scaled_thumbnail_size(self.widget_scale)
         self.seats = self.initialize_seats()
         self.seat_info = None
-        self.passenger_track = defaultdict(list)
-
-    def belt_read(self):
-        """
-        Read the status of seat belts.
-
-        Returns:
-            dict: Dictionary with seat names as keys and seat belt status as values.
-
-        """
-        try:
-            seat_belt_status = seatbelt_status()
-        except Exception as e:
-            seat_belt_status = {seat: False for seat in self.ALLOWED_SEAT_NAMES}
-        return seat_belt_status
+        # PhotoImage of every passenger image by content hash, decoded and scaled once
+        self.thumbnails = {}
+        self.widget_updates = 0
 
     def initialize_seats(self):
         """
@@ -169,13 +213,7 @@ class NotificationController:
             dict: Dictionary with seat names as keys and Seat objects as values.
 
         """
-        seat_positions = [
-            ("A1", face_img, 0.66, 0.2),
-            ("A2", face_img, 0.26, 0.2),
-            ("B1", face_img, 0.66, 0.58),
-            ("B2", face_img, 0.26, 0.58),
-        ]
-        return {name: Seat(self.root, name, img, x, y) for name, img, x, y in seat_positions}
+        return {name: Seat(self.root, name, face_img, x, y, self.widget_scale) for name, x, y in self.seat_positions}
 
     def initialize_seat_info(self):
         """
@@ -193,122 +231,102 @@ class NotificationController:
             "passenger_embedding": None,
         }
 
-        self.seat_info = {seat_name: default_seat_info.copy() for seat_name in self.ALLOWED_SEAT_NAMES}
+        self.seat_info = {seat_name: default_seat_info.copy() for seat_name in self.seat_names}
         if self.dataset:
-            for passenger in self.dataset:
-                passenger_name, passenger_seat, passenger_embedding = passenger["passenger_dataset"]
-                seat = self.seat_info[passenger_seat]
-                seat.update({
-                    "profile_image": passenger["passenger_image"],
-                    "passenger_name": passenger_name,
-                    "passenger_embedding": passenger_embedding,
-                })
-                self.update_single_seat(self.seats[passenger_seat], image_data=passenger["passenger_image"])
+            for passenger in self.dataset.values():
+                self.assign_passenger(passenger)
         else:
-            logger.error("Database not able to fetch Data.")
+            logger.warn("No passenger loaded yet, seats are assigned as the manifest loads.")
 
         return {seat: passenger.get("passenger_name") for seat, passenger in self.seat_info.items()}
 
-    def update_seat_info(self, frame_results):
+    def assign_passenger(self, passenger):
         """
-        Update seat information based on frame results.
+        Show the thumbnail of a passenger on the seat assigned to them, the seat status is left to the vote.
 
         Args:
-            frame_results (dict): Dictionary with seat names as keys and frame results as values.
+            passenger (dict): Passenger record from the manifest.
 
         """
-        belt_data = self.belt_read()
-        for _, seat_info in frame_results.items():
-            for seat_name, passengers in seat_info.items():
-                if passengers:
-                    passenger_info = passengers[0]
-                    name = passenger_info.get("passenger_name", "")
-                    status, color = self.get_passenger_status_color(name, passenger_info, seat_name, belt_data)
-                else:
-                    name, status, color = "", "Empty", "white"
-
-                self.passenger_track[seat_name].append((name, status, color))
-
-    def get_passenger_status_color(self, name, passenger_info, seat_name, belt_data):
-        """Get passenger status and color."""
-
-        if name in self.UNAUTHORIZED_NAMES:
-            return "Unauthorized", "red"
+        passenger_name, passenger_seat, passenger_embedding = passenger["passenger_dataset"]
+        seat = self.seat_info.get(passenger_seat)
+        if seat is None:
+            return
+        seat.update({
+            "profile_image": passenger["passenger_image"],
+            "passenger_name": passenger_name,
+            "passenger_embedding": passenger_embedding,
+        })
+        # Only the thumbnail changes, the status shown stays the voted decision of the seat
+        tk_image = self.thumbnail_for(passenger["passenger_image"], passenger.get("passenger_thumbnail"))
+        self.widget_updates += self.seats[passenger_seat].show_image(tk_image)
+
+    def add_passenger(self, passenger):
+        """
+        Add a passenger published by the manifest loader, must be called from the Tk thread.
 
-        elif name not in self.UNAUTHORIZED_NAMES and passenger_info["passenger_assign_seat"] == seat_name:
-            return "Ready" if belt_data.get(seat_name, False) else "Correct", "green" if belt_data.get(seat_name, False) else "yellow"
+        Args:
+            passenger (dict): Passenger record from the manifest.
 
-        return "Incorrect", "orange"
+        """
+        self.remove_passenger(passenger["passenger_name"])
+        self.dataset[passenger["passenger_name"]] = passenger
+        if self.seat_info is not None:
+            self.assign_passenger(passenger)
 
-    def analyze_frames(self):
+    def remove_passenger(self, passenger_name):
         """
-        Analyze frame results.
+        Remove a passenger and clear the seat showing them, must be called from the Tk thread.
 
         Args:
-            data (dict): Dictionary with seat names as keys and values as lists of frame results.
-
-        Returns:
-            dict: Dictionary with seat names as keys and analyzed results as values.
+            passenger_name (str): Name of the passenger.
 
         """
-    
-        result = {seat: max(Counter(values).items(), key=lambda x: x[1])[0] for seat, values in self.passenger_track.items()}
-        return result
-
-    def analysis(self, frame_results):
+        passenger = self.dataset.pop(passenger_name, None)
+        if passenger is None or self.seat_info is None:
+            return
+        seat_name = passenger["passenger_dataset"][1]
+        seat = self.seat_info.get(seat_name)
+        if seat is not None and seat["passenger_name"] == passenger_name:
+            seat.update({"passenger_name": "", "profile_image": None, "passenger_embedding": None})
+            self.widget_updates += self.seats[seat_name].show_image(self.seats[seat_name].default_image)
+
+    def thumbnail_for(self, image_data, decoded_image=None):
         """
-        Perform analysis on frame results.
+        PhotoImage of a passenger image, created once per image content on the Tk thread.
 
         Args:
-            frame_results (dict): Dictionary with seat names as keys and frame results as values.
+            image_data (bytes): Encoded passenger image.
+            decoded_image (PIL.Image.Image, optional): Image already decoded by `decode_thumbnail` off the Tk thread.
 
         Returns:
-            dict: Dictionary with seat names as keys and analyzed results as values.
-
+            ImageTk.PhotoImage: Scaled passenger image.
         """
-        self.passenger_track.clear()
-        self.update_seat_info(frame_results)
-        return self.analyze_frames()
-
-
-    def update_single_seat(self, update_seat, image_data=None, rectangle_color="white", status="Empty"):
+        key = content_hash(image_data)
+        tk_image = self.thumbnails.get(key)
+        if tk_image is None:
+            tk_image = ImageTk.PhotoImage(decoded_image if decoded_image is not None else decode_thumbnail(image_data, self.thumbnail_size))
+            self.thumbnails[key] = tk_image
+        return tk_image
+
+    def update_single_seat(self, update_seat, image_data=None, rectangle_color="white", status="Empty", decoded_image=None):
         """
-        Update a single seat.
+        Update a single seat, Tk is only touched for the parts that changed.
 
         Args:
             update_seat (str or object): Seat name or Seat object to be updated.
             image_data (bytes, optional): Image data for updating the seat's image.
             rectangle_color (str, optional): Color of the rectangle.
             status (str, optional): Status of the seat.
+            decoded_image (PIL.Image.Image, optional): `image_data` already decoded by `decode_thumbnail`.
 
         """
         seat = self.seats[update_seat] if isinstance(update_seat, str) else update_seat
 
         if image_data:
-            load_image = Image.open(BytesIO(image_data))
-            tk_image = ImageTk.PhotoImage(load_image)
-            seat.image_label.config(image=tk_image)
-            seat.image_label.image = tk_image
-
-        seat.change_rectangle_color(rectangle_color, status)
+            self.widget_updates += seat.show_image(self.thumbnail_for(image_data, decoded_image))
 
-
-def process_faces(frame, seat_coordinates):
-    """
-    Process faces in the given frame and return a dictionary with seat information.
-    """
-    def process_seat(x1, y1, x2, y2, seat_name):
-        seat_roi = frame[y2:y1, x1:x2]
-        rgb_seat_roi = cv2.cvtColor(seat_roi, cv2.COLOR_BGR2RGB)
-        face_area = face_locations(rgb_seat_roi)
-
-        if len(face_area) == 1:
-            face_encoding = face_encodings(rgb_seat_roi, face_area)
-            return seat_name, face_encoding
-        else:
-            return seat_name, []
-
-    return dict(Parallel(n_jobs=-1)(delayed(process_seat)(x1, y1, x2, y2, seat_name) for x1, y1, x2, y2, seat_name in seat_coordinates))
+        self.widget_updates += seat.change_rectangle_color(rectangle_color, status)
 
 
 def draw_seats(frame, seat_coordinates):
@@ -317,7 +335,7 @@ def draw_seats(frame, seat_coordinates):
     """
     colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 255, 0)]  # Red, Green, Blue, Yellow
 
-    for (x1, y1, x2, y2, name), color in zip(seat_coordinates, colors):
+    for (x1, y1, x2, y2, name), color in zip(seat_coordinates, itertools.cycle(colors)):
         cv2.rectangle(frame, (x1, y2), (x2, y1), color, 5)
         cv2.putText(frame, f"Seat {name}", (x1, y1 - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2, cv2.LINE_AA)
 
@@ -337,48 +355,17 @@ def resize(image, width=None, height=None, inter=cv2.INTER_AREA):
     return resized
 
 
-def do_face_verification(database_faces_embed, passanger_face_embed, tolerance=0.55):
-    """
-    Perform face verification by comparing the embedding vectors from the database.
-    """
-    distances = np.zeros(len(database_faces_embed))
-    data_point = {}
-    for i, (passenger_name, passenger_data) in enumerate(database_faces_embed.items()):
-        passenger_name, passenger_seat, passenger_embedding = passenger_data
-        distances[i] = np.linalg.norm(np.array(passanger_face_embed) - np.array(passenger_embedding))
-        data_point[i] = (passenger_name, passenger_seat, distances[i])
-
-    idx = np.argmin(distances)
-    min_distance = distances[idx]
-    passenger_info = data_point[idx]
-    logger.debug(f"face_verification measure:: {passenger_info}")
-
-    if min_distance > tolerance:
-        return "Unknown", "Un", min_distance
-    return passenger_info
-
-def time_consumer(func):
-    """_summary_
-
-    Args:
-        func (_type_): _description_
-
-    Returns:
-        _type_: _description_
-    """
-    # This function shows the execution time of
-
-    def wrap_func(*args, **kwargs):
-        t1 = time.time()
-        result = func(*args, **kwargs)
-        t2 = time.time()
-        print(f"Function {func.__name__!r} executed in {(t2-t1):.4f}s")
-        return result
-
-    return wrap_func
-
+def play_voice_text(text, cache=None):
+    """Speak a text, from the rendered file of a `tts_cache.TTSCache` when one is given."""
+    if cache is not None:
+        if not pygame.mixer.get_init():
+            pygame.mixer.init()
+        pygame.mixer.music.load(str(cache.render(text)))
+        pygame.mixer.music.play()
+        while pygame.mixer.music.get_busy():
+            time.sleep(0.1)
+        return
 
-def play_voice_text(text):
     engine = pyttsx3.init()
     engine.setProperty("rate", 125)
     voices = engine.getProperty('voices')
@@ -401,7 +388,8 @@ def play_voice_mp3(file):
 
         mp3_file (_type_): _description_
     """
-    pygame.mixer.init()
+    if not pygame.mixer.get_init():
+        pygame.mixer.init()
     pygame.mixer.music.load(mp3_files[file])
     pygame.mixer.music.play()
     
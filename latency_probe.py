@@ -0,0 +1,129 @@
+"""Camera latency probe of ICMS Application
+
+Measures glass-to-pipeline delay of a camera: a window flips between black and white while the camera looks at
+it, and the probe times how long it takes until a frame read from the capture thread shows the flip. The grab
+timestamp of that frame splits the delay into glass-to-grab (exposure, driver queue and transfer) and
+grab-to-pipeline (decode and ring hand over). Display latency of the monitor is included in glass-to-grab, so
+compare settings on the same screen.
+
+Usage:
+    python latency_probe.py --camera 4 --flashes 20
+    python latency_probe.py --camera 4 --no-settings
+
+Author: Ravi Shanker Singh
+"""
+
+import argparse
+import json
+import pathlib
+import time
+
+import cv2
+import numpy as np
+
+from CameraAccess import WebcamStream
+from log import Logger
+
+logger = Logger(module="Latency Probe")
+current = pathlib.Path(__file__).parent.resolve()
+
+WINDOW = "ICMS latency probe"
+
+
+def mean_brightness(frame):
+    """Mean grey level of the centre of a frame, where the flashing window is expected."""
+    height, width = frame.shape[:2]
+    return float(np.mean(frame[height // 4 : 3 * height // 4, width // 4 : 3 * width // 4]))
+
+
+def wait_for_flip(stream, after_seq, brighter, threshold, timeout):
+    """
+    Read frames until the brightness crosses `threshold` in the expected direction.
+
+    Returns:
+        tuple: (seq, grab timestamp, read timestamp) of the first frame showing the flip, None on timeout.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        cv2.waitKey(1)
+        seq, timestamp, frame = stream.read_next(after_seq, timeout=0.05)
+        if frame is None:
+            continue
+        after_seq = seq
+        level = mean_brightness(frame)
+        if (level > threshold) == brighter:
+            return seq, timestamp, time.monotonic()
+    return None
+
+
+def probe(stream, flashes, settle, timeout):
+    """Flash the window `flashes` times and report the delay statistics in ms."""
+    screen = np.zeros((480, 640, 3), dtype=np.uint8)
+    cv2.namedWindow(WINDOW, cv2.WINDOW_NORMAL)
+    cv2.setWindowProperty(WINDOW, cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
+
+    levels = []
+    for value in (0, 255):
+        screen[:] = value
+        cv2.imshow(WINDOW, screen)
+        end = time.monotonic() + settle
+        while time.monotonic() < end:
+            cv2.waitKey(1)
+        levels.append(mean_brightness(stream.read()))
+    threshold = sum(levels) / 2
+    if levels[1] - levels[0] < 20:
+        logger.error(f"Camera sees no contrast between black and white ({levels[0]:.0f} / {levels[1]:.0f}), point it at the window")
+        return
+
+    glass_to_grab, glass_to_pipeline = [], []
+    brighter = False
+    for _ in range(flashes):
+        screen[:] = 255 if brighter else 0
+        seq = stream.read_latest()[0]
+        cv2.imshow(WINDOW, screen)
+        cv2.waitKey(1)
+        flipped_at = time.monotonic()
+        found = wait_for_flip(stream, seq, brighter, threshold, timeout)
+        if found is None:
+            logger.warn("Flip not seen before the timeout, skipped")
+        else:
+            _, grabbed_at, read_at = found
+            glass_to_grab.append((grabbed_at - flipped_at) * 1000)
+            glass_to_pipeline.append((read_at - flipped_at) * 1000)
+        brighter = not brighter
+        time.sleep(settle)
+    cv2.destroyWindow(WINDOW)
+
+    if not glass_to_pipeline:
+        logger.error("No flip was measured")
+        return
+    for label, values in (("glass to grab", glass_to_grab), ("glass to pipeline", glass_to_pipeline)):
+        values = np.array(values)
+        logger.info(f"{label:>18}: mean {values.mean():7.1f} ms  p50 {np.median(values):7.1f} ms  p95 {np.percentile(values, 95):7.1f} ms")
+    logger.info(f"Frames dropped {stream.frames_dropped} over {len(glass_to_pipeline)} flips")
+
+
+def main():
+    with open(current.joinpath("config.json")) as data_file:
+        camera = json.load(data_file)["CAMERA"]
+
+    parser = argparse.ArgumentParser(description="Measure glass-to-pipeline latency of a camera with a flashing window.")
+    parser.add_argument("--camera", type=int, default=camera["FIRST_CAMERA_INDEX"])
+    parser.add_argument("--flashes", type=int, default=20)
+    parser.add_argument("--settle", type=float, default=0.5, help="Seconds between flips.")
+    parser.add_argument("--timeout", type=float, default=2.0, help="Seconds to wait for a flip to show.")
+    parser.add_argument("--no-settings", action="store_true", help="Open the camera with driver defaults to compare.")
+    args = parser.parse_args()
+
+    settings_key = "SECOND_CAMERA_CAPTURE" if args.camera == camera["SECOND_CAMERA_INDEX"] else "FIRST_CAMERA_CAPTURE"
+    settings = None if args.no_settings else camera.get(settings_key)
+    stream = WebcamStream(args.camera, capture_settings=settings)
+    stream.start()
+    try:
+        probe(stream, args.flashes, args.settle, args.timeout)
+    finally:
+        stream.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""Seat motion gate of ICMS Application
+
+Cheap per-seat change detector that runs before face detection. Every seat ROI is compared as a small grayscale
+thumbnail with the same area of the last frame the seat was analysed on; seats where too few pixels changed skip
+detection and encoding and carry their last result forward. A seat is analysed again after a fixed number of
+skipped frames regardless, so slow drift cannot hide a passenger change for long.
+
+Author: Ravi Shanker Singh
+"""
+
+import cv2
+import numpy as np
+
+from log import Logger
+
+logger = Logger(module="Motion Gate")
+
+
+class SeatMotionGate:
+    """
+    Per seat change detection with carry forward of the last seat result.
+
+    The downscaled frame is compared with one reference image in a single pass; the changed pixel count of every
+    seat comes out of an integral image of the difference, so the cost per seat is four lookups.
+
+    Attributes:
+        downscale (float): Factor the frame is shrunk by before the seat thumbnails are cut out.
+        pixel_threshold (int): Grey level difference above which a thumbnail pixel counts as changed.
+        min_changed_fraction (float): Share of changed pixels above which a seat is analysed again.
+        max_skipped_frames (int): Consecutive skipped frames after which a seat is analysed regardless.
+
+    Methods:
+        changed_seats(frame, seat_coordinates): Seat ROIs whose content changed since they were last analysed.
+        carry_forward(frame_info): Fill in the last result of the seats that were skipped.
+        skip_ratios: Share of checked frames every seat skipped.
+
+    """
+
+    def __init__(self, downscale=0.125, pixel_threshold=15, min_changed_fraction=0.02, max_skipped_frames=50):
+        """
+        Initialize the SeatMotionGate.
+
+        Args:
+            downscale (float, optional): Factor the frame is shrunk by before comparing.
+            pixel_threshold (int, optional): Grey level difference of a changed pixel.
+            min_changed_fraction (float, optional): Share of changed pixels that marks a seat as changed.
+            max_skipped_frames (int, optional): Consecutive skipped frames after which a seat is analysed regardless.
+
+        """
+        self.downscale = downscale
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.max_skipped_frames = max_skipped_frames
+        self.seat_key = None
+        self.seat_names = []
+        self.boxes = None
+        self.reference = None
+        self.results = {}
+        self.has_result = np.zeros(0, dtype=bool)
+        self.skipped_in_row = np.zeros(0, dtype=np.int64)
+        self.checked = np.zeros(0, dtype=np.int64)
+        self.skipped = np.zeros(0, dtype=np.int64)
+        self.pending = set()
+
+    def gray(self, frame):
+        """Downscaled grayscale copy of the frame."""
+        small = cv2.resize(frame, None, fx=self.downscale, fy=self.downscale, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+
+    def seat_boxes(self, frame_shape, gray_shape, seat_coordinates):
+        """Seat ROIs in downscaled pixels as (top, bottom, left, right) rows, at least one pixel each."""
+        rois = np.array([seat[:4] for seat in seat_coordinates], dtype=np.float64).reshape(-1, 4)
+        scale_y, scale_x = gray_shape[0] / frame_shape[0], gray_shape[1] / frame_shape[1]
+        # Seat tuples hold the bottom edge in y1 and the top edge in y2
+        top, left = (rois[:, 3] * scale_y).astype(np.int64), (rois[:, 0] * scale_x).astype(np.int64)
+        bottom = np.maximum((rois[:, 1] * scale_y).astype(np.int64), top + 1)
+        right = np.maximum((rois[:, 2] * scale_x).astype(np.int64), left + 1)
+        boxes = np.stack([top, bottom, left, right], axis=1)
+        boxes[:, :2] = boxes[:, :2].clip(0, gray_shape[0])
+        boxes[:, 2:] = boxes[:, 2:].clip(0, gray_shape[1])
+        return boxes
+
+    def track(self, frame_shape, gray_shape, seat_coordinates):
+        """Start over when the seat list or the frame size changed."""
+        seat_key = (frame_shape[:2], tuple(seat_coordinates))
+        if seat_key == self.seat_key:
+            return
+        count = len(seat_coordinates)
+        self.seat_key = seat_key
+        self.seat_names = [seat[4] for seat in seat_coordinates]
+        self.boxes = self.seat_boxes(frame_shape, gray_shape, seat_coordinates)
+        self.reference = None
+        self.results = {}
+        self.has_result = np.zeros(count, dtype=bool)
+        self.skipped_in_row = np.zeros(count, dtype=np.int64)
+        self.checked = np.zeros(count, dtype=np.int64)
+        self.skipped = np.zeros(count, dtype=np.int64)
+
+    def changed_seats(self, frame, seat_coordinates):
+        """
+        Seat ROIs whose content changed since the seat was last analysed.
+
+        Args:
+            frame (np.ndarray): BGR frame.
+            seat_coordinates (list): Seat ROIs as returned by `seats_coordinates`.
+
+        Returns:
+            list: The entries of `seat_coordinates` that have to be analysed on this frame.
+        """
+        gray = self.gray(frame)
+        self.track(frame.shape, gray.shape, seat_coordinates)
+        self.checked += 1
+        top, bottom, left, right = self.boxes.T
+
+        if self.reference is None:
+            changed = np.ones(len(self.seat_names), dtype=bool)
+            self.reference = gray.copy()
+        else:
+            # Changed pixel count of every seat from four corners of the integral image of the difference
+            difference = (cv2.absdiff(self.reference, gray) > self.pixel_threshold).astype(np.uint8)
+            integral = cv2.integral(difference)
+            counts = integral[bottom, right] - integral[top, right] - integral[bottom, left] + integral[top, left]
+            fractions = counts / ((bottom - top) * (right - left))
+            skip = (fractions < self.min_changed_fraction) & self.has_result & (self.skipped_in_row < self.max_skipped_frames)
+            changed = ~skip
+            self.skipped_in_row[skip] += 1
+            self.skipped[skip] += 1
+            for i in np.flatnonzero(changed):
+                self.reference[top[i] : bottom[i], left[i] : right[i]] = gray[top[i] : bottom[i], left[i] : right[i]]
+
+        self.skipped_in_row[changed] = 0
+        indices = np.flatnonzero(changed)
+        self.pending = {self.seat_names[i] for i in indices}
+        return [seat_coordinates[i] for i in indices]
+
+    def carry_forward(self, frame_info):
+        """
+        Store the results of the analysed seats and fill in the last result of the skipped ones.
+
+        Args:
+            frame_info (dict): Seat names as keys and their seat information list, for the analysed seats.
+
+        Returns:
+            dict: `frame_info` completed with the carried results of the skipped seats.
+        """
+        for seat_name in self.pending:
+            self.results[seat_name] = list(frame_info.get(seat_name, []))
+        for i, seat_name in enumerate(self.seat_names):
+            if seat_name in self.pending:
+                self.has_result[i] = True
+            elif seat_name in self.results:
+                frame_info[seat_name] = list(self.results[seat_name])
+        return frame_info
+
+    @property
+    def skip_ratios(self):
+        """Share of the checked frames every seat skipped."""
+        counts = zip(self.seat_names, self.skipped, self.checked)
+        return {seat_name: round(int(skipped) / int(checked), 3) for seat_name, skipped, checked in counts if checked}
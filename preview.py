@@ -0,0 +1,136 @@
+"""Camera preview of ICMS Application
+
+Shows the analysed frames with the seat ROIs in an OpenCV window without slowing analysis down. The analysis
+thread only offers a frame; at most `fps` times a second the offer is taken as a plain copy, so the analysis
+frame is never drawn on and the ring slot it lives in can be reused. Downscaling and drawing happen in callbacks
+scheduled on the GUI event loop, which is also the only place the window is touched, HighGUI is not supported off
+the main thread on every backend. They shrink the latest copy, lay the seat overlay, drawn once and cached as a
+mask per preview size, over it and show it.
+
+Author: Ravi Shanker Singh
+"""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+
+from helper import draw_seats
+from log import Logger
+
+logger = Logger(module="Preview")
+
+
+class SeatPreview:
+    """
+    Rate-limited, downscaled camera preview with a cached seat overlay.
+
+    Attributes:
+        scale (float): Factor the frames are shrunk by for the preview.
+        fps (float): Highest preview rate.
+        window (str): Name of the OpenCV window.
+        rendered (int): Frames shown.
+
+    Methods:
+        start(): Schedule the first preview refresh on the event loop.
+        offer(frame): Hand over an analysed frame, copied only when the next preview frame is due.
+        stop(): Close the window and stop refreshing it.
+
+    """
+
+    def __init__(self, seat_coordinates, schedule, scale=0.5, fps=5.0, window="Cabin monitoring", on_quit=None):
+        """
+        Initialize the SeatPreview.
+
+        Args:
+            seat_coordinates (list): Seat ROIs as returned by `seats_coordinates`.
+            schedule (callable): Schedules a callback after a delay in ms on the event loop, e.g. `tk.Tk.after`.
+            scale (float, optional): Factor the frames are shrunk by for the preview.
+            fps (float, optional): Highest preview rate.
+            window (str, optional): Name of the OpenCV window.
+            on_quit (callable, optional): Called on the event loop when 'q' is pressed in the window.
+
+        """
+        self.seat_coordinates = seat_coordinates
+        self.schedule = schedule
+        self.scale = scale
+        self.fps = fps
+        self.window = window
+        self.on_quit = on_quit
+        self.overlays = {}
+        self.pending = None
+        self.next_due = 0.0
+        self.lock = threading.Lock()
+        self.running = False
+        self.sized = False
+        self.rendered = 0
+        self.interval_ms = max(int(1000 / fps), 1)
+
+    def start(self):
+        """Create the window and schedule the first refresh, must be called from the event loop thread."""
+        self.running = True
+        cv2.namedWindow(self.window, cv2.WINDOW_NORMAL)
+        self.schedule(self.interval_ms, self.refresh)
+
+    def offer(self, frame):
+        """
+        Hand over an analysed frame, called on the analysis thread.
+
+        Returns:
+            bool: True when a copy was taken for the preview.
+        """
+        now = time.monotonic()
+        if not self.running or now < self.next_due:
+            return False
+        self.next_due = now + 1.0 / self.fps
+        # Only a copy is taken here, the frame is shrunk on the event loop when it is shown
+        copy = frame.copy()
+        with self.lock:
+            self.pending = copy
+        return True
+
+    def overlay_for(self, frame_shape, preview_shape):
+        """Seat overlay and its mask at the preview size, drawn once at frame size and cached per size."""
+        key = (frame_shape, preview_shape)
+        if key not in self.overlays:
+            overlay = draw_seats(np.zeros(frame_shape, dtype=np.uint8), self.seat_coordinates)
+            overlay = cv2.resize(overlay, (preview_shape[1], preview_shape[0]), interpolation=cv2.INTER_NEAREST)
+            self.overlays[key] = overlay, overlay.any(axis=2)
+        return self.overlays[key]
+
+    def render(self, frame):
+        """Shrink a frame, lay the seat overlay over it and show it."""
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        if not self.sized:
+            cv2.resizeWindow(self.window, small.shape[1], small.shape[0])
+            self.sized = True
+        overlay, mask = self.overlay_for(frame.shape, small.shape)
+        small[mask] = overlay[mask]
+        cv2.imshow(self.window, small)
+        self.rendered += 1
+
+    def stop(self):
+        """Close the window and stop refreshing it, must be called from the event loop thread."""
+        if not self.running:
+            return
+        self.running = False
+        cv2.destroyWindow(self.window)
+        logger.info(f"Preview showed {self.rendered} frames")
+
+    def refresh(self):
+        """Show the latest offered frame and handle the 'q' key, runs on the event loop."""
+        if not self.running:
+            return
+        with self.lock:
+            pending, self.pending = self.pending, None
+        if pending is not None:
+            self.render(pending)
+
+        # The 'q' key stops the video stream
+        if cv2.waitKey(1) == ord("q"):
+            self.stop()
+            if self.on_quit is not None:
+                self.on_quit()
+            return
+        self.schedule(self.interval_ms, self.refresh)
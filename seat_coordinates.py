@@ -12,8 +12,9 @@ import numpy as np
 from face_recognition import face_locations
 from keras.models import load_model
 
+from cabin import CabinLayout
 from CameraAccess import create_webcam_stream
-from helper import draw_seats, seats_coordinates
+from helper import draw_seats
 from log import Logger
 
 # Set up logging
@@ -25,7 +26,9 @@ with open(current.joinpath("config.json")) as data_file:
     data = json.load(data_file)
     camera_source_1 = data["CAMERA"]["FIRST_CAMERA_INDEX"]
     camera_source_2 = data["CAMERA"]["SECOND_CAMERA_INDEX"]
-    two_cam_seat_coordinates = seats_coordinates(data["SEAT_COORDINATES"], data["FRAME_SHAPE"])
+    playback = data["CAMERA"].get("PLAYBACK", "realtime")
+    loop_playback = data["CAMERA"].get("LOOP", False)
+    two_cam_seat_coordinates = CabinLayout.from_config(data).seat_coordinates
 
 
 model_file = current.joinpath("model", "keras_model.h5")
@@ -77,7 +80,7 @@ def main(face_detection=True, seat_belt_detection=False):
     frame_time = 1
     frame_process = 0
     seat_coordinates =two_cam_seat_coordinates
-    video_capture = create_webcam_stream(camera_source_1,camera_source_2)
+    video_capture = create_webcam_stream(camera_source_1, camera_source_2, playback=playback, loop=loop_playback)
     video_capture.start()
 
     prev_frame_time = 0
@@ -0,0 +1,209 @@
+"""Seat voting of ICMS Application
+
+Turns the per-frame seat results of the analysis into stable seat decisions: every seat votes a
+(name, status, color) label per frame and the decision is the label with the most weight over the last frames.
+Free of GUI dependencies, shared by the dashboard and the headless monitor.
+
+Author: Ravi Shanker Singh
+"""
+
+import numpy as np
+
+from seatbelt import seatbelt_status
+
+
+class SeatVoter:
+    """
+    Sliding-window vote of the seat decisions.
+
+    Seat state is kept in arrays indexed by the seat order of the cabin layout, and seat decisions are integer
+    codes into `labels`, so voting costs the same few array operations for any number of seats.
+
+    Attributes:
+        cabin (CabinLayout): Seat map of the cabin.
+        seat_names (list): Seat names in seat index order.
+        labels (list): Every (name, status, color) voted so far, indexed by label code.
+        decision_codes (np.ndarray): Label code of the current decision of every seat.
+
+    Methods:
+        belt_read(): Read the status of seat belts.
+        label_code(label): Integer code of a (name, status, color) label.
+        frame_votes(frame_info, belt_data): Turn the seat information of one frame into one vote per seat.
+        vote(frame_info): Add one frame to the sliding window and return the current seat decision codes.
+        decisions: Current seat decisions as (name, status, color) per seat name.
+        analysis(frame_results): Vote a batch of frames and return the resulting seat decisions.
+
+    """
+
+    UNAUTHORIZED_NAMES = {"Unknown", "Un"}
+    EMPTY_LABEL = ("", "Empty", "white")
+
+    def __init__(self, cabin, window=5, distance_weighted=False, tolerance=0.55):
+        """
+        Initialize the SeatVoter.
+
+        Args:
+            cabin (CabinLayout): Seat map of the cabin.
+            window (int, optional): Number of recent frames every seat decision is voted over.
+            distance_weighted (bool, optional): Let confident face matches count up to twice in the vote.
+            tolerance (float, optional): Match tolerance the vote weight of a face match is measured against.
+
+        """
+        self.cabin = cabin
+        self.seat_names = cabin.seat_names
+        self.window = window
+        self.distance_weighted = distance_weighted
+        self.tolerance = tolerance
+        # Label codes of every (name, status, color) with their status and color for array lookups
+        self.labels = []
+        self.label_codes = {}
+        self.label_status = np.empty(0, dtype=object)
+        self.label_color = np.empty(0, dtype=object)
+        # Window of (vote, weight) per frame and seat with the running weight of every label per seat
+        seat_count = len(self.seat_names)
+        self.seat_index = np.arange(seat_count)
+        self.vote_codes = np.full((window, seat_count), -1, dtype=np.int64)
+        self.vote_weights = np.zeros((window, seat_count))
+        self.vote_counts = np.zeros((seat_count, 0))
+        # Frame from which every label has had weight in the window of every seat, ties go to the earliest
+        self.vote_since = np.zeros((seat_count, 0), dtype=np.int64)
+        self.decision_codes = np.full(seat_count, -1, dtype=np.int64)
+        self.empty_code = self.label_code(self.EMPTY_LABEL)
+        self.belt_data = {}
+        self.frames_voted = 0
+
+    def belt_read(self):
+        """
+        Read the status of seat belts.
+
+        Returns:
+            dict: Dictionary with seat names as keys and seat belt status as values.
+
+        """
+        try:
+            seat_belt_status = seatbelt_status(self.cabin.belt_pins or None)
+        except Exception as e:
+            seat_belt_status = {seat: False for seat in self.seat_names}
+        return seat_belt_status
+
+    def label_code(self, label):
+        """
+        Integer code of a (name, status, color) label, new labels grow the per seat count arrays.
+
+        Args:
+            label (tuple): (name, status, color).
+
+        Returns:
+            int: Label code, the index of the label in `labels`.
+        """
+        code = self.label_codes.get(label)
+        if code is not None:
+            return code
+        code = len(self.labels)
+        if code == self.vote_counts.shape[1]:
+            # Capacity doubles so the arrays are reallocated a logarithmic number of times
+            capacity = max(2 * code, 8)
+            self.vote_counts = np.pad(self.vote_counts, ((0, 0), (0, capacity - code)))
+            self.vote_since = np.pad(self.vote_since, ((0, 0), (0, capacity - code)))
+            self.label_status = np.concatenate([self.label_status, np.empty(capacity - code, dtype=object)])
+            self.label_color = np.concatenate([self.label_color, np.empty(capacity - code, dtype=object)])
+        self.label_status[code], self.label_color[code] = label[1], label[2]
+        self.labels.append(label)
+        self.label_codes[label] = code
+        return code
+
+    def frame_votes(self, frame_info, belt_data):
+        """
+        Turn the seat information of one frame into one vote per seat.
+
+        Args:
+            frame_info (dict): Seat names as keys and a list with the seat information of the passenger, or an empty list.
+            belt_data (dict): Seat belt status per seat.
+
+        Returns:
+            tuple: Label code and vote weight of every seat as arrays, seats without a passenger vote empty.
+        """
+        codes = np.full(len(self.seat_names), self.empty_code, dtype=np.int64)
+        weights = np.ones(len(self.seat_names))
+        for seat_name, passengers in frame_info.items():
+            i = self.cabin.index.get(seat_name)
+            if not passengers or i is None:
+                continue
+            passenger_info = passengers[0]
+            name = passenger_info.get("passenger_name", "")
+            status, color = self.get_passenger_status_color(name, passenger_info, seat_name, belt_data)
+            distance = passenger_info.get("passenger_match_distance")
+            if self.distance_weighted and name not in self.UNAUTHORIZED_NAMES and distance is not None:
+                weights[i] += max(self.tolerance - distance, 0.0) / self.tolerance
+            codes[i] = self.label_code((name, status, color))
+        return codes, weights
+
+    def get_passenger_status_color(self, name, passenger_info, seat_name, belt_data):
+        """Get passenger status and color."""
+
+        if name in self.UNAUTHORIZED_NAMES:
+            return "Unauthorized", "red"
+
+        elif name not in self.UNAUTHORIZED_NAMES and passenger_info["passenger_assign_seat"] == seat_name:
+            return "Ready" if belt_data.get(seat_name, False) else "Correct", "green" if belt_data.get(seat_name, False) else "yellow"
+
+        return "Incorrect", "orange"
+
+    def vote(self, frame_info):
+        """
+        Add the votes of one frame to the sliding window of every seat and return the current seat decisions.
+
+        Every update is O(1) per seat and done for all seats at once: the votes leaving the window are subtracted
+        from the running counts and the new ones added. A seat keeps its decision until another label has strictly
+        more weight in the window, so ties do not make the decision flicker. When the decision has to change, ties
+        between the leading labels go to the one that has held weight in the window the longest. The belt sensors
+        are read once per window.
+
+        Args:
+            frame_info (dict): Seat names as keys and a list with the seat information of the passenger, or an empty list.
+
+        Returns:
+            np.ndarray: Label code of the decision of every seat, in seat index order.
+        """
+        slot = self.frames_voted % self.window
+        if slot == 0:
+            self.belt_data = self.belt_read()
+        frame = self.frames_voted
+        self.frames_voted += 1
+
+        codes, weights = self.frame_votes(frame_info, self.belt_data)
+        seats = self.seat_index
+        filled = self.vote_codes[slot] >= 0
+        self.vote_counts[seats[filled], self.vote_codes[slot, filled]] -= self.vote_weights[slot, filled]
+        entering = self.vote_counts[seats, codes] <= 1e-9
+        self.vote_since[seats[entering], codes[entering]] = frame
+        self.vote_codes[slot], self.vote_weights[slot] = codes, weights
+        self.vote_counts[seats, codes] += weights
+
+        counts = self.vote_counts
+        tied = (counts > 1e-9) & (counts >= counts.max(axis=1, keepdims=True) - 1e-9)
+        leader = np.where(tied, self.vote_since, np.iinfo(np.int64).max).argmin(axis=1)
+        current = self.decision_codes
+        current_counts = np.where(current >= 0, self.vote_counts[seats, current.clip(min=0)], -np.inf)
+        switch = self.vote_counts[seats, leader] > current_counts + 1e-9
+        current[switch] = leader[switch]
+        return current.copy()
+
+    @property
+    def decisions(self):
+        """Current seat decisions as (name, status, color) per seat name, for the seats decided so far."""
+        return {seat_name: self.labels[code] for seat_name, code in zip(self.seat_names, self.decision_codes) if code >= 0}
+
+    def analysis(self, frame_results):
+        """
+        Vote a batch of frames in order and return the resulting seat decisions.
+
+        Args:
+            frame_results (dict): Frame numbers as keys and the seat information of every frame as values.
+
+        Returns:
+            dict: Seat names as keys and (name, status, color) as values.
+        """
+        for frame_info in frame_results.values():
+            self.vote(frame_info)
+        return self.decisions
@@ -13,11 +13,18 @@ else:
 logger = Logger("SeltBelt Sensor Module")
 
 
-def seatbelt_status():
+DEFAULT_PIN_LABELS = {"A1": 31, "A2": 7, "B1": 33, "B2": 29}
+
+
+def seatbelt_status(pin_labels=None):
     """Get Seat Belt Status.
     pin_labels = {'A1': 31, 'A2': 7, 'B1': 33, 'B2': 29}
     Reference colour code:: {'A1': YELLOW, 'A2': BLUE, 'B1': RED, 'B2': GREEN}
 
+    Args:
+        pin_labels (dict, optional): Seat names as keys and their sensor pin as values, the BELT_PIN entries of
+            the cabin layout. Defaults to the four seat cabin above.
+
     Returns:
         dict: Dictionary containing seat belt status for each label.
               False indicates 'No Belt', True indicates 'Belt'.
@@ -27,7 +34,7 @@ def seatbelt_status():
     try:
         GPIO.setwarnings(False)
         GPIO.setmode(GPIO.BOARD)
-        pin_labels = {"A1": 31, "A2": 7, "B1": 33, "B2": 29}
+        pin_labels = DEFAULT_PIN_LABELS if pin_labels is None else pin_labels
 
         for pin in pin_labels.values():
             GPIO.setup(pin, GPIO.IN)
@@ -0,0 +1,181 @@
+"""Text to speech render cache of ICMS Application
+
+Renders announcement texts to audio files once, on a background thread that owns the only pyttsx3 engine, and
+keeps them in a bounded directory keyed by a hash of voice, rate and text. Personalised announcements for every
+manifest passenger are rendered as soon as the passenger is loaded, and the wrong seat announcement of every
+configured seat without a recorded clip at start, so playing them later costs no synthesis.
+The least recently used files are deleted when the directory grows past its size limit.
+
+Author: Ravi Shanker Singh
+"""
+
+import hashlib
+import os
+import pathlib
+import queue
+import threading
+
+import pyttsx3
+
+from log import Logger
+
+logger = Logger(module="TTS Cache")
+
+current = pathlib.Path(__file__).parent.resolve()
+DEFAULT_CACHE_DIR = current.joinpath("cache", "tts")
+
+# Message names follow the pre-recorded clips of `helper.mp3_files`, texts follow voice_message/text_script.txt
+PASSENGER_ANNOUNCEMENTS = {
+    "welcome_{name}": "Welcome aboard, {name}",
+    "seltbelt_{name}": "{name}, Kindly apply your seat belt",
+}
+
+
+def announcement_texts(passenger_name):
+    """Message names and texts of the personalised announcements of a passenger."""
+    return {message.format(name=passenger_name): text.format(name=passenger_name) for message, text in PASSENGER_ANNOUNCEMENTS.items()}
+
+
+def seat_announcement_text(seat_name):
+    """Text of the wrong seat announcement of a seat, its message name is the seat name."""
+    return f"Seat {seat_name}: Incorrect Occupant Identified"
+
+
+class TTSCache:
+    """
+    Bounded on-disk cache of rendered announcements.
+
+    Attributes:
+        directory (Path): Directory of the rendered audio files.
+        voice_index (int): Index of the pyttsx3 voice, the first voice is used when it does not exist.
+        rate (int): Speech rate in words per minute.
+        max_bytes (int): Size of the directory above which the least recently used files are deleted.
+
+    Methods:
+        path(text): Path of the rendered text, None when it is not rendered yet.
+        render(text): Render a text and return its path, on the calling thread.
+        start(): Start the background render thread.
+        render_async(message, text, on_ready): Render a text on the background thread and report its path.
+        close(): Stop the background render thread.
+
+    """
+
+    def __init__(self, directory=None, voice_index=22, rate=125, max_bytes=256 * 1024 * 1024):
+        """
+        Initialize the TTSCache.
+
+        Args:
+            directory (str or Path, optional): Cache directory, defaults to $ICMS_TTS_CACHE or cache/tts next to
+                the application.
+            voice_index (int, optional): Index of the pyttsx3 voice. For Codec USB Sound Card Persian voice tone is
+                22, hindi 29 or english 12.
+            rate (int, optional): Speech rate in words per minute.
+            max_bytes (int, optional): Size limit of the cache directory.
+
+        """
+        self.directory = pathlib.Path(directory or os.getenv("ICMS_TTS_CACHE") or DEFAULT_CACHE_DIR)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.voice_index = voice_index
+        self.rate = rate
+        self.max_bytes = max_bytes
+        self.engine = None
+        self.requests = queue.Queue()
+        self.thread = None
+        self.hits = 0
+        self.renders = 0
+
+    def file_for(self, text):
+        """Cache file of a text, keyed by voice, rate and text."""
+        key = hashlib.sha1(f"{self.voice_index}|{self.rate}|{text}".encode()).hexdigest()
+        return self.directory.joinpath(f"{key}.wav")
+
+    def path(self, text):
+        """
+        Path of the rendered text, None when it is not rendered yet.
+
+        A hit refreshes the modification time of the file, which the eviction uses as last use.
+        """
+        path = self.file_for(text)
+        if not path.is_file() or path.stat().st_size == 0:
+            return None
+        path.touch()
+        self.hits += 1
+        return path
+
+    def init_engine(self):
+        """Create the pyttsx3 engine once, with the configured voice and rate."""
+        if self.engine is None:
+            self.engine = pyttsx3.init()
+            self.engine.setProperty("rate", self.rate)
+            voices = self.engine.getProperty("voices")
+            try:
+                self.engine.setProperty("voice", voices[self.voice_index].id)
+            except Exception:
+                self.engine.setProperty("voice", voices[0].id)
+        return self.engine
+
+    def render(self, text):
+        """
+        Render a text to the cache and return its path, on the calling thread.
+
+        Args:
+            text (str): Text to speak.
+
+        Returns:
+            Path: Rendered audio file.
+        """
+        path = self.path(text)
+        if path is not None:
+            return path
+
+        path = self.file_for(text)
+        partial = path.with_suffix(".part.wav")
+        engine = self.init_engine()
+        engine.save_to_file(text, str(partial))
+        engine.runAndWait()
+        os.replace(partial, path)
+        self.renders += 1
+        self.evict()
+        return path
+
+    def evict(self):
+        """Delete the least recently used files while the cache is larger than `max_bytes`."""
+        files = [(path.stat(), path) for path in self.directory.glob("*.wav") if not path.name.endswith(".part.wav")]
+        total = sum(stat.st_size for stat, _ in files)
+        for stat, path in sorted(files, key=lambda item: item[0].st_mtime):
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= stat.st_size
+
+    def start(self):
+        """Start the background render thread, the only thread using the pyttsx3 engine."""
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def render_async(self, message, text, on_ready):
+        """
+        Render a text on the background thread.
+
+        Args:
+            message (str): Message name reported back with the path.
+            text (str): Text to speak.
+            on_ready (callable): Called on the render thread as on_ready(message, path) once the file exists.
+
+        """
+        self.requests.put((message, text, on_ready))
+
+    def close(self):
+        """Stop the background render thread after the render in progress."""
+        self.requests.put(None)
+
+    def run(self):
+        while True:
+            request = self.requests.get()
+            if request is None:
+                return
+            message, text, on_ready = request
+            try:
+                on_ready(message, self.render(text))
+            except Exception as e:
+                logger.error(f"Error rendering {message}: {e}")